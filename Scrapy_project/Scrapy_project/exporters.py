@@ -0,0 +1,151 @@
+# Gravação das linhas de relatório (itens tipados) em arquivos.
+#
+# O BatchedExportPipeline junta os itens em lotes e entrega cada lote a um
+# RowWriter em uma thread, fora do reactor. Os writers só precisam saber abrir
+# o arquivo, gravar uma lista de linhas e fechar; novos formatos entram em
+# WRITERS.
+
+import csv
+import gzip
+import sqlite3
+from typing import Optional
+
+# Formatos de exportação: content-type e extensão do arquivo gerado.
+FORMATOS_EXPORTACAO = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "sqlite": ("application/vnd.sqlite3", ".sqlite3"),
+}
+
+
+class ExportUnavailableError(RuntimeError):
+    """O formato pedido depende de uma biblioteca opcional que não está instalada."""
+
+
+# Tipo dos campos numéricos que podem ser inteiros ou decimais (ex.: as células
+# do TabNet): o CSV e o SQLite guardam cada valor com o seu tipo; o Parquet,
+# que tem um tipo por coluna, usa float64.
+NUMERO = "numero"
+
+
+def field_types(item_class) -> dict:
+    """
+    Tipo de cada campo de uma classe de item, declarado como
+    'scrapy.Field(tipo=int)' (ou NUMERO); campos sem tipo são texto.
+    """
+    return {nome: campo.get("tipo", str) for nome, campo in item_class.fields.items()}
+
+
+class RowWriter:
+    """
+    Grava linhas (listas na ordem de 'campos') em 'path'. Os métodos são
+    chamados fora do reactor, um lote por vez (mas não sempre da mesma thread).
+    """
+
+    def __init__(self, path: str, campos: list, tipos: dict):
+        self.path = path
+        self.campos = campos
+        self.tipos = tipos
+
+    def write_rows(self, linhas: list):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvRowWriter(RowWriter):
+    """CSV UTF-8 separado por ';', compactado com gzip quando o arquivo termina em '.gz'."""
+
+    def __init__(self, path: str, campos: list, tipos: dict):
+        super().__init__(path, campos, tipos)
+        if path.endswith(".gz"):
+            self._arquivo = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+        else:
+            self._arquivo = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._arquivo, delimiter=";")
+        self._writer.writerow(campos)
+
+    def write_rows(self, linhas: list):
+        self._writer.writerows(linhas)
+
+    def close(self):
+        self._arquivo.close()
+
+
+class ParquetRowWriter(RowWriter):
+    """
+    Parquet (zstd), com um row group por lote; depende do pacote 'pyarrow'.
+
+    Os campos NUMERO são sempre float64: o schema é fixado antes do primeiro
+    lote, e uma coluna int64 truncaria os decimais de lotes posteriores.
+    """
+
+    def __init__(self, path: str, campos: list, tipos: dict):
+        super().__init__(path, campos, tipos)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportUnavailableError("O formato Parquet exige o pacote 'pyarrow'.")
+        tipos_arrow = {int: pa.int64(), float: pa.float64(), NUMERO: pa.float64(), str: pa.string()}
+        self._pa = pa
+        self._schema = pa.schema([pa.field(nome, tipos_arrow[tipos.get(nome, str)]) for nome in campos])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write_rows(self, linhas: list):
+        colunas = list(zip(*linhas)) if linhas else [[] for _ in self.campos]
+        tabela = self._pa.Table.from_arrays(
+            [self._pa.array(coluna, type=campo.type) for coluna, campo in zip(colunas, self._schema)],
+            schema=self._schema,
+        )
+        self._writer.write_table(tabela)
+
+    def close(self):
+        self._writer.close()
+
+
+class SqliteRowWriter(RowWriter):
+    """Banco SQLite com uma tabela 'linhas'; cada lote é gravado em uma transação."""
+
+    # NUMERIC guarda cada valor como inteiro ou decimal, conforme o valor.
+    TIPOS_SQL = {int: "INTEGER", float: "REAL", NUMERO: "NUMERIC", str: "TEXT"}
+
+    def __init__(self, path: str, campos: list, tipos: dict):
+        super().__init__(path, campos, tipos)
+        # Os lotes são gravados pelas threads do reactor, não sempre pela mesma.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        colunas = ", ".join(f'"{nome}" {self.TIPOS_SQL[tipos.get(nome, str)]}' for nome in campos)
+        self._conn.execute("DROP TABLE IF EXISTS linhas")
+        self._conn.execute(f"CREATE TABLE linhas ({colunas})")
+        self._insert = f"INSERT INTO linhas VALUES ({', '.join('?' for _ in campos)})"
+
+    def write_rows(self, linhas: list):
+        with self._conn:
+            self._conn.executemany(self._insert, linhas)
+
+    def close(self):
+        self._conn.close()
+
+
+WRITERS = {
+    "csv": CsvRowWriter,
+    "parquet": ParquetRowWriter,
+    "sqlite": SqliteRowWriter,
+}
+
+
+def format_for_path(path: str, formato: Optional[str] = None) -> str:
+    """O formato informado ou, na falta dele, o indicado pela extensão do arquivo (padrão: CSV)."""
+    if formato:
+        if formato not in WRITERS:
+            raise ValueError(f"Formato de exportação desconhecido: {formato}. Use: {', '.join(WRITERS)}.")
+        return formato
+    caminho = path.lower()
+    if caminho.endswith(".parquet"):
+        return "parquet"
+    if caminho.endswith((".sqlite", ".sqlite3", ".db")):
+        return "sqlite"
+    return "csv"
@@ -0,0 +1,149 @@
+# Cache HTTP das páginas dos portais, compartilhado entre processos.
+#
+# Os crawls rodam em vários processos (o pool da API), e cada extração do
+# TabNet começa baixando o mesmo formulário da base, que quase nunca muda. O
+# FilesystemCacheStorage do Scrapy guardaria uma cópia por pasta e não sabe
+# revalidar sem reescrever tudo; aqui as respostas ficam em um banco SQLite
+# único, junto com as estatísticas somadas de todos os crawls. Fica em um
+# módulo sem dependência do Scrapy para que a API também possa consultá-lo.
+# A política (o que pode ser guardado e por quanto tempo) e o storage usado
+# pelo HttpCacheMiddleware estão em middlewares.py.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    corpo BLOB NOT NULL,
+    sha256 TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    armazenado_em REAL NOT NULL,
+    validado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS estatisticas (
+    nome TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class HttpCacheDB:
+    """
+    Respostas guardadas, por chave (o fingerprint da requisição):
+
+    - armazenado_em: quando o conteúdo atual foi baixado;
+    - validado_em: a última vez em que o servidor confirmou o conteúdo (um
+      304 ou uma resposta com o mesmo corpo). A idade da entrada conta a
+      partir daqui.
+
+    Os corpos são guardados compactados com zlib e os cabeçalhos Set-Cookie
+    nunca são guardados: a mesma página é servida a outras sessões.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def get(self, chave: str, max_age: float = 0) -> Optional[dict]:
+        """A entrada guardada, ou None se não existir (ou se não foi validada há mais de 'max_age' segundos)."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM respostas WHERE chave = ?", (chave,)).fetchone()
+        if row is None or (max_age > 0 and time.time() - row["validado_em"] > max_age):
+            return None
+        return {
+            "url": row["url"],
+            "status": row["status"],
+            "headers": json.loads(row["headers"]),
+            "corpo": zlib.decompress(row["corpo"]),
+            "sha256": row["sha256"],
+            "armazenado_em": row["armazenado_em"],
+            "validado_em": row["validado_em"],
+        }
+
+    def put(self, chave: str, url: str, status: int, headers: dict, corpo: bytes) -> bool:
+        """
+        Guarda a resposta. 'headers' mapeia cada nome para a lista de valores.
+        Retorna False se o corpo é igual ao já guardado (só a validação é
+        renovada) e True se o conteúdo mudou ou a entrada é nova.
+        """
+        sha256 = hashlib.sha256(corpo).hexdigest()
+        headers = {nome: valores for nome, valores in headers.items() if nome.lower() != "set-cookie"}
+        agora = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT sha256 FROM respostas WHERE chave = ?", (chave,)).fetchone()
+                if row is not None and row["sha256"] == sha256:
+                    self._conn.execute(
+                        "UPDATE respostas SET headers = ?, validado_em = ? WHERE chave = ?",
+                        (json.dumps(headers), agora, chave),
+                    )
+                    alterado = False
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO respostas "
+                        "(chave, url, status, headers, corpo, sha256, tamanho, armazenado_em, validado_em) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (chave, url, status, json.dumps(headers), zlib.compress(corpo), sha256, len(corpo),
+                         agora, agora),
+                    )
+                    alterado = True
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return alterado
+
+    def purge(self, max_age: float) -> int:
+        """Remove as entradas não validadas há mais de 'max_age' segundos."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM respostas WHERE validado_em < ?", (time.time() - max_age,))
+        return cursor.rowcount
+
+    def add_stats(self, estatisticas: dict):
+        """Soma contadores (httpcache/hit, httpcache/miss...) aos já guardados."""
+        if not estatisticas:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO estatisticas (nome, total) VALUES (?, ?) "
+                "ON CONFLICT (nome) DO UPDATE SET total = total + excluded.total",
+                list(estatisticas.items()),
+            )
+
+    def snapshot(self) -> dict:
+        """Entradas guardadas, espaço ocupado e estatísticas somadas de todos os crawls."""
+        with self._lock:
+            entradas, tamanho, compactado = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0), COALESCE(SUM(LENGTH(corpo)), 0) FROM respostas"
+            ).fetchone()
+            estatisticas = dict(self._conn.execute("SELECT nome, total FROM estatisticas ORDER BY nome").fetchall())
+        consultas = estatisticas.get("httpcache/hit", 0) + estatisticas.get("httpcache/miss", 0) \
+            + estatisticas.get("httpcache/revalidate", 0) + estatisticas.get("httpcache/invalidate", 0)
+        return {
+            "entradas": entradas,
+            "bytes": tamanho,
+            "bytes_compactados": compactado,
+            "estatisticas": {nome.removeprefix("httpcache/"): total for nome, total in estatisticas.items()},
+            # Respostas servidas sem baixar a página de novo (direto do cache ou após um 304).
+            "taxa_acerto": round((estatisticas.get("httpcache/hit", 0) + estatisticas.get("httpcache/revalidate", 0))
+                                 / consultas, 3) if consultas else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
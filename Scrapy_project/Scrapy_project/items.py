@@ -5,8 +5,24 @@
 
 import scrapy
 
+from .exporters import NUMERO
 
-class ScrapyProjectItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+
+class DatasusRowItem(scrapy.Item):
+    """
+    Uma célula de uma tabela do TabNet (DATASUS), no formato longo:
+    - periodo: rótulo do período (arquivo) consultado, ex.: 'Ago/2025'.
+    - linha: rótulo da linha da tabela, ex.: '26 Pernambuco'.
+    - coluna: rótulo da coluna; quando o eixo de colunas está desativado, é o
+      nome do conteúdo (ex.: 'Internações').
+    - valor: número (int ou float, como na célula: '1.234' -> 1234 e
+      '1.234,56' -> 1234.56); 0 nas células '-' e None nas células sem
+      informação ('...').
+
+    O 'tipo' de cada campo é usado pelos formatos de exportação tipados
+    (Parquet, SQLite); ver exporters.py.
+    """
+    periodo = scrapy.Field(tipo=str)
+    linha = scrapy.Field(tipo=str)
+    coluna = scrapy.Field(tipo=str)
+    valor = scrapy.Field(tipo=NUMERO)
@@ -3,11 +3,23 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+import time
+
+from scrapy import Request, signals
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.task import deferLater
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from .httpcache import HttpCacheDB
+from .throttle import HostLimiter, ThrottleBounds, backoff_delay
+
 
 class ScrapyProjectSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -53,48 +65,201 @@ class ScrapyProjectSpiderMiddleware:
         spider.logger.info("Spider opened: %s" % spider.name)
 
 
-class ScrapyProjectDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+class AdaptiveThrottleMiddleware:
+    """
+    Limita as requisições a cada host com um HostLimiter compartilhado por
+    todos os crawls (inclusive de outros processos), ajustando a concorrência
+    e o intervalo entre envios conforme a latência e os erros observados.
+
+    Também respeita o 'retry_backoff_until' definido pelo
+    BackoffRetryMiddleware, segurando a nova tentativa até o fim da espera.
+    """
+
+    # Respostas que indicam um servidor sobrecarregado.
+    ERROR_STATUSES = {408, 429, 500, 502, 503, 504, 522, 524}
+
+    def __init__(self, limiter: HostLimiter):
+        self.limiter = limiter
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        bounds = ThrottleBounds(
+            min_concurrency=settings.getint("ADAPTIVE_THROTTLE_MIN_CONCURRENCY"),
+            max_concurrency=settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY"),
+            start_concurrency=settings.getint("ADAPTIVE_THROTTLE_START_CONCURRENCY"),
+            min_delay=settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY"),
+            max_delay=settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY"),
+            start_delay=settings.getfloat("ADAPTIVE_THROTTLE_START_DELAY"),
+            target_latency=settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY"),
+            lease_ttl=settings.getfloat("DOWNLOAD_TIMEOUT") + 60,
+        )
+        return cls(_shared_limiter(settings["ADAPTIVE_THROTTLE_DB"], bounds))
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
+    async def process_request(self, request):
+        espera = request.meta.get("retry_backoff_until", 0) - time.time()
+        if espera > 0:
+            await _sleep(espera)
 
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        host = urlparse_cached(request).netloc
+        while True:
+            vaga, espera = self.limiter.acquire(host)
+            if vaga is not None:
+                break
+            await _sleep(espera)
+        request.meta["throttle_vaga"] = (host, vaga)
         return None
 
-    def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+    def process_response(self, request, response):
+        self._release(request, erro=response.status in self.ERROR_STATUSES)
         return response
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def process_exception(self, request, exception):
+        self._release(request, erro=not isinstance(exception, IgnoreRequest))
+        return None
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def _release(self, request, erro: bool):
+        vaga = request.meta.pop("throttle_vaga", None)
+        if vaga is not None:
+            host, vaga_id = vaga
+            self.limiter.release(host, vaga_id, latencia=request.meta.get("download_latency"), erro=erro)
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+
+class BackoffRetryMiddleware(RetryMiddleware):
+    """
+    RetryMiddleware do Scrapy (mesmas configurações RETRY_*) com espera antes de
+    cada nova tentativa: backoff exponencial com jitter, limitado por
+    RETRY_BACKOFF_MAX. A espera é aplicada pelo AdaptiveThrottleMiddleware.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.backoff_base = settings.getfloat("RETRY_BACKOFF_BASE")
+        self.backoff_max = settings.getfloat("RETRY_BACKOFF_MAX")
+
+    def process_response(self, request, response, spider=None):
+        return self._with_backoff(super().process_response(request, response))
+
+    def process_exception(self, request, exception, spider=None):
+        return self._with_backoff(super().process_exception(request, exception))
+
+    def _with_backoff(self, resultado):
+        if isinstance(resultado, Request):
+            tentativa = resultado.meta.get("retry_times", 1)
+            resultado.meta["retry_backoff_until"] = time.time() + backoff_delay(
+                tentativa, self.backoff_base, self.backoff_max
+            )
+        return resultado
+
+
+class PortalPagePolicy:
+    """
+    Política do HttpCacheMiddleware (HTTPCACHE_POLICY) para as páginas dos portais.
+
+    Só passam pelo cache as requisições GET que o spider marca com
+    meta["cache_pagina"]: formulários e listas de opções, que quase nunca
+    mudam e não dependem da sessão (como o formulário do TabNet). O GET que
+    abre uma sessão do SISAB (cookie + ViewState novos a cada vez) e os POSTs
+    presos ao ViewState nunca são guardados.
+
+    Uma página guardada é usada direto por HTTPCACHE_FRESH_SECS; depois disso
+    é revalidada com If-None-Match/If-Modified-Since, quando o servidor enviou
+    ETag ou Last-Modified, ou baixada de novo. Os portais não mandam prazos de
+    validade úteis, então os Cache-Control da resposta são ignorados; um
+    'Cache-Control: no-cache' na requisição força a revalidação. Se a
+    revalidação falhar com 5xx, a cópia guardada é usada.
+    """
+
+    def __init__(self, settings):
+        self.fresh_secs = settings.getfloat("HTTPCACHE_FRESH_SECS")
+
+    def should_cache_request(self, request) -> bool:
+        return request.method == "GET" and bool(request.meta.get("cache_pagina"))
+
+    def should_cache_response(self, response, request) -> bool:
+        return response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request) -> bool:
+        idade = time.time() - request.meta.get("cache_timestamp", 0)
+        if idade < self.fresh_secs and b"no-cache" not in request.headers.get(b"Cache-Control", b""):
+            return True
+        if b"ETag" in cachedresponse.headers:
+            request.headers[b"If-None-Match"] = cachedresponse.headers[b"ETag"]
+        if b"Last-Modified" in cachedresponse.headers:
+            request.headers[b"If-Modified-Since"] = cachedresponse.headers[b"Last-Modified"]
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request) -> bool:
+        return response.status == 304 or response.status >= 500
+
+
+class SharedCacheStorage:
+    """
+    Storage do HttpCacheMiddleware (HTTPCACHE_STORAGE) em um banco SQLite
+    (HTTPCACHE_DB) compartilhado por todos os processos de crawl, em vez das
+    pastas do FilesystemCacheStorage. Entradas não validadas há mais de
+    HTTPCACHE_EXPIRATION_SECS são ignoradas (0 = nunca expiram).
+
+    Uma página baixada de novo com o mesmo conteúdo só renova a validação
+    (conta em 'httpcache/inalterado'). Ao final de cada crawl, as estatísticas
+    'httpcache/*' são somadas às do banco.
+    """
+
+    def __init__(self, settings):
+        self.db_path = settings["HTTPCACHE_DB"]
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.db = None
+
+    def open_spider(self, spider):
+        self.db = _shared_cache(self.db_path)
+        if self.expiration_secs > 0:
+            self.db.purge(self.expiration_secs)
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self._stats = spider.crawler.stats
+
+    def close_spider(self, spider):
+        self.db.add_stats({
+            nome: valor for nome, valor in self._stats.get_stats().items() if nome.startswith("httpcache/")
+        })
+
+    def retrieve_response(self, spider, request):
+        entrada = self.db.get(self._fingerprinter.fingerprint(request).hex(), self.expiration_secs)
+        if entrada is None:
+            return None
+        request.meta["cache_timestamp"] = entrada["validado_em"]
+        headers = Headers({nome.encode("latin-1"): [v.encode("latin-1") for v in valores]
+                           for nome, valores in entrada["headers"].items()})
+        respcls = responsetypes.from_args(headers=headers, url=entrada["url"], body=entrada["corpo"])
+        return respcls(url=entrada["url"], status=entrada["status"], headers=headers, body=entrada["corpo"])
+
+    def store_response(self, spider, request, response):
+        headers = {nome.decode("latin-1"): [v.decode("latin-1") for v in valores]
+                   for nome, valores in response.headers.items()}
+        alterado = self.db.put(self._fingerprinter.fingerprint(request).hex(), response.url, response.status,
+                               headers, response.body)
+        # Depois de um 304 o middleware grava a própria cópia guardada ('cached').
+        if not alterado and "cached" not in response.flags:
+            self._stats.inc_value("httpcache/inalterado")
+
+
+# Um HostLimiter (e uma conexão com o banco) por processo, compartilhado pelos crawls.
+_limiters = {}
+
+def _shared_limiter(db_path: str, bounds: ThrottleBounds) -> HostLimiter:
+    if db_path not in _limiters:
+        _limiters[db_path] = HostLimiter(db_path, bounds)
+    return _limiters[db_path]
+
+# Idem para o banco do cache HTTP.
+_caches = {}
+
+def _shared_cache(db_path: str) -> HttpCacheDB:
+    if db_path not in _caches:
+        _caches[db_path] = HttpCacheDB(db_path)
+    return _caches[db_path]
+
+async def _sleep(segundos: float):
+    from twisted.internet import reactor
+    await maybe_deferred_to_future(deferLater(reactor, segundos))
@@ -3,11 +3,137 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import logging
 
-# useful for handling different item types with a single interface
-from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+from twisted.internet import defer, threads
+from twisted.python.failure import Failure
 
+from .exporters import WRITERS, field_types, format_for_path
+from .items import DatasusRowItem
 
-class ScrapyProjectPipeline:
-    def process_item(self, item, spider):
+logger = logging.getLogger(__name__)
+
+
+class BatchedExportPipeline:
+    """
+    Grava as linhas de relatório produzidas pelos spiders (itens tipados, como
+    o DatasusRowItem) no arquivo indicado pelo atributo 'export_file' do spider,
+    no formato do atributo 'export_format' ('csv', 'parquet' ou 'sqlite'; na
+    falta dele, o da extensão do arquivo).
+
+    Os itens são acumulados em lotes de EXPORT_BATCH_SIZE linhas. Cada lote é
+    serializado (e compactado, no caso de '.csv.gz') em uma thread, fora do
+    reactor, e os lotes são gravados em ordem, um de cada vez. Com mais de
+    EXPORT_MAX_PENDING_BATCHES lotes esperando pela gravação, o pipeline segura
+    os itens seguintes até a fila diminuir.
+
+    Uma falha na gravação interrompe a exportação: o erro fica na estatística
+    'exportacao/erro' do crawl e os itens seguintes são descartados (DropItem).
+
+    Spiders sem 'export_file' e outros tipos de item passam adiante sem alteração.
+    """
+
+    ITEM_CLASSES = (DatasusRowItem,)
+
+    def __init__(self, crawler, batch_size: int, max_pending: int):
+        self.crawler = crawler
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max(1, max_pending)
+        self._writer = None
+        self._campos = None
+        self._buffer = []
+        # Cadeia das gravações: cada lote só começa depois do anterior.
+        self._gravacoes = defer.succeed(None)
+        self._pendentes = 0
+        self._espera = []
+        self._erro = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler,
+            batch_size=crawler.settings.getint("EXPORT_BATCH_SIZE", 5000),
+            max_pending=crawler.settings.getint("EXPORT_MAX_PENDING_BATCHES", 4),
+        )
+
+    def process_item(self, item):
+        if not isinstance(item, self.ITEM_CLASSES):
+            return item
+        spider = self.crawler.spider
+        export_file = getattr(spider, "export_file", None)
+        if not export_file:
+            return item
+        if self._erro is not None:
+            raise DropItem(f"Exportação interrompida: {self._erro}")
+        if self._campos is None:
+            formato = format_for_path(export_file, getattr(spider, "export_format", None))
+            tipos = field_types(type(item))
+            self._campos = list(item.fields)
+            self._submit(lambda: self._open(WRITERS[formato], export_file, tipos))
+
+        # Acesso direto aos campos: o ItemAdapter custa caro com milhares de linhas por resposta.
+        self._buffer.append([item.get(campo) for campo in self._campos])
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+            if self._pendentes > self.max_pending:
+                espera = defer.Deferred()
+                self._espera.append(espera)
+                espera.addCallback(lambda _: item)
+                return espera
         return item
+
+    def close_spider(self):
+        if self._campos is None:
+            return None
+        self._flush()
+        self._submit(self._close)
+        # O crawl só termina depois que todos os lotes foram gravados.
+        return self._gravacoes
+
+    # --- Gravação fora do reactor ---
+
+    def _open(self, writer_class, export_file: str, tipos: dict):
+        self._writer = writer_class(export_file, self._campos, tipos)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        linhas, self._buffer = self._buffer, []
+        self.crawler.stats.inc_value("exportacao/lotes")
+        self.crawler.stats.inc_value("exportacao/linhas", len(linhas))
+        self._submit(lambda: self._writer.write_rows(linhas) if self._writer is not None else None)
+
+    def _submit(self, tarefa):
+        """Encadeia 'tarefa' para rodar em uma thread depois das gravações anteriores."""
+        self._pendentes += 1
+
+        def run(_):
+            if self._erro is not None:
+                return None
+            return threads.deferToThread(tarefa)
+
+        def done(resultado):
+            self._pendentes -= 1
+            if isinstance(resultado, Failure) and self._erro is None:
+                self._erro = resultado.value
+                logger.error("Falha ao gravar as linhas exportadas: %s", resultado.value)
+                self.crawler.stats.set_value("exportacao/erro", f"{type(resultado.value).__name__}: {resultado.value}")
+                self._close_quietly()
+            while self._espera and (self._pendentes <= self.max_pending or self._erro is not None):
+                self._espera.pop(0).callback(None)
+            return None
+
+        self._gravacoes.addCallback(run)
+        self._gravacoes.addBoth(done)
+
+    def _close_quietly(self):
+        try:
+            self._close()
+        except Exception:
+            self._writer = None
@@ -7,10 +7,14 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = "Scrapy_project"
 
-SPIDER_MODULES = ["Scrapy_project.spiders"]
-NEWSPIDER_MODULE = "Scrapy_project.spiders"
+# Os caminhos são relativos ao pacote atual, para que as configurações também
+# funcionem quando o projeto é importado pela API (Scrapy_project.Scrapy_project).
+SPIDER_MODULES = [f"{__package__}.spiders"]
+NEWSPIDER_MODULE = f"{__package__}.spiders"
 
 ADDONS = {}
 
@@ -22,9 +26,39 @@ ADDONS = {}
 ROBOTSTXT_OBEY = False
 
 # Concurrency and throttling settings
+# A concorrência e o intervalo por host são controlados pelo
+# AdaptiveThrottleMiddleware (abaixo); aqui fica só o teto de cada crawl.
 #CONCURRENT_REQUESTS = 16
-CONCURRENT_REQUESTS_PER_DOMAIN = 1
-DOWNLOAD_DELAY = 1
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
+DOWNLOAD_DELAY = 0
+
+# Limite adaptativo por host, compartilhado por todos os crawls através de um
+# banco SQLite. A concorrência e o intervalo entre envios começam em START e
+# variam entre MIN e MAX conforme a latência e os erros do servidor.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_DB = os.path.join(
+    os.environ.get("SISAB_DATA_DIR", os.path.join(os.path.expanduser("~"), ".sisab-api")),
+    "throttle.sqlite3",
+)
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 4
+ADAPTIVE_THROTTLE_START_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.0
+ADAPTIVE_THROTTLE_MAX_DELAY = 30.0
+ADAPTIVE_THROTTLE_START_DELAY = 1.0
+# Latência (até o início da resposta) acima da qual o servidor é considerado
+# sobrecarregado. O SISAB leva alguns segundos para montar cada relatório.
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 30.0
+
+# Novas tentativas em erros 5xx/timeouts, com backoff exponencial e jitter.
+RETRY_TIMES = 3
+RETRY_BACKOFF_BASE = 2.0
+RETRY_BACKOFF_MAX = 60.0
+
+# Tamanho das respostas: os relatórios nacionais do SISAB passam facilmente do
+# aviso padrão de 32 MB. Acima do máximo o download é cancelado.
+DOWNLOAD_WARNSIZE = 128 * 1024 * 1024
+DOWNLOAD_MAXSIZE = 1024 * 1024 * 1024
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -46,9 +80,11 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "Scrapy_project.middlewares.ScrapyProjectDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
+    f"{__package__}.middlewares.BackoffRetryMiddleware": 550,
+    f"{__package__}.middlewares.AdaptiveThrottleMiddleware": 950,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -58,9 +94,15 @@ DOWNLOAD_DELAY = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "Scrapy_project.pipelines.ScrapyProjectPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    f"{__package__}.pipelines.BatchedExportPipeline": 300,
+}
+
+# Exportação das linhas de relatório (BatchedExportPipeline): linhas por lote
+# gravado e número máximo de lotes esperando pela gravação antes de o pipeline
+# segurar os itens seguintes.
+EXPORT_BATCH_SIZE = 5000
+EXPORT_MAX_PENDING_BATCHES = 4
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -75,13 +117,21 @@ DOWNLOAD_DELAY = 1
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
-# Enable and configure HTTP caching (disabled by default)
+# Cache HTTP das páginas dos portais (formulários e opções), em um banco SQLite
+# compartilhado por todos os crawls. Só as requisições marcadas pelos spiders
+# com meta["cache_pagina"] passam pelo cache (ver PortalPagePolicy); as páginas
+# são usadas direto por HTTPCACHE_FRESH_SECS e depois revalidadas, e as
+# entradas não confirmadas há mais de HTTPCACHE_EXPIRATION_SECS são ignoradas.
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = "httpcache"
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_ENABLED = True
+HTTPCACHE_DB = os.path.join(
+    os.environ.get("SISAB_DATA_DIR", os.path.join(os.path.expanduser("~"), ".sisab-api")),
+    "httpcache.sqlite3",
+)
+HTTPCACHE_FRESH_SECS = 3600
+HTTPCACHE_EXPIRATION_SECS = 7 * 24 * 3600
+HTTPCACHE_POLICY = f"{__package__}.middlewares.PortalPagePolicy"
+HTTPCACHE_STORAGE = f"{__package__}.middlewares.SharedCacheStorage"
 
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
@@ -0,0 +1,116 @@
+# Definição do formulário de relatórios de produção do SISAB.
+#
+# Fica em um módulo sem dependência do Scrapy para que a API também possa
+# montar (e normalizar) os mesmos parâmetros enviados pelo SisabSpider.
+
+# --- Opções do Formulário ---
+# Valores usados por padrão (relatório nacional completo). Os filtros de uma
+# extração só podem restringir estas listas.
+
+UFS = [
+    "AC","AL","AM","AP","BA","CE","DF","ES","GO","MA","MG","MS","MT",
+    "PA","PB","PE","PI","PR","RJ","RN","RO","RR","RS","SC","SE","SP","TO"
+]
+
+EQUIPES = ["eq-esf","eq-eacs","eq-nasf","eq-eab","eq-ecr","eq-sb","eq-epen","eq-eap"]
+
+CATEGORIAS_PROFISSIONAIS = [
+    "3","5","6","7","8","9","10","11","12","13","14","15","16","17",
+    "18","19","20","21","22","23","24","25","26","27","30","31"
+]
+
+LOCAIS_ATENDIMENTO = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
+
+TIPOS_ATENDIMENTO = ["2", "5", "6"]
+
+LINHA_PADRAO = "ATD.CO_UF_IBGE"
+COLUNA_PADRAO = "CO_TIPO_ATENDIMENTO"
+
+# Nome de cada filtro aceito pela API -> campo correspondente do formulário.
+CAMPOS_FILTRO = {
+    "estados": "estados",
+    "equipes": "j_idt89",
+    "categorias_profissionais": "categoriaProfissional",
+    "locais_atendimento": "localAtendimento",
+    "tipos_atendimento": "tipoAtendimento",
+    "linha": "selectLinha",
+    "coluna": "selectcoluna",
+}
+
+
+def build_form_data(datas: list, viewstate: str = None, filtros: dict = None) -> dict:
+    """
+    Monta os campos do POST que gera o relatório CSV.
+    - datas: as competências (AAAAMM) escolhidas.
+    - viewstate: o javax.faces.ViewState capturado na página; quando omitido,
+      o campo não é incluído (útil para comparar requisições).
+    - filtros: dict com os filtros do relatório (chaves de CAMPOS_FILTRO);
+      filtros ausentes ou None mantêm o valor padrão.
+    """
+    form_data = {
+        "j_idt44": "j_idt44",
+        "lsCid": "",
+        "dtBasicExample_length": "10",
+        "lsSigtap": "",
+        "td-ls-sigtap_length": "10",
+
+        # Unidade Geografica
+        "unidGeo": "estado",
+
+        # Unidades Federativas
+        "estados": list(UFS),
+
+        # Periodo de Datas
+        "j_idt76": list(datas),
+
+        # Linha da Tabela
+        "selectLinha": LINHA_PADRAO,
+
+        # Coluna da Tabela
+        "selectcoluna": COLUNA_PADRAO,
+
+        # Equipes de Atendimento
+        "j_idt89": list(EQUIPES),
+
+        # Categorias de Profissional
+        "categoriaProfissional": list(CATEGORIAS_PROFISSIONAIS),
+        "idadeInicio": "0",
+        "idadeFim": "0",
+
+        # Locais de Atendimento
+        "localAtendimento": list(LOCAIS_ATENDIMENTO),
+
+        # Tipo de Atendimento
+        "tipoAtendimento": list(TIPOS_ATENDIMENTO),
+
+        # Tipo de Produção
+        "tpProducao": "4",
+
+        # Condição de Avaliação
+        "condicaoAvaliada": "ABP014",
+        "j_idt192": "j_idt192"
+    }
+    for nome, valor in (filtros or {}).items():
+        if nome not in CAMPOS_FILTRO:
+            raise ValueError(f"Filtro desconhecido: {nome}")
+        if valor is not None:
+            form_data[CAMPOS_FILTRO[nome]] = list(valor) if isinstance(valor, (list, tuple, set)) else valor
+    if viewstate is not None:
+        form_data["javax.faces.ViewState"] = viewstate
+    return form_data
+
+
+def normalize_form_data(form_data: dict) -> dict:
+    """
+    Retorna uma cópia canônica dos parâmetros do relatório: sem o ViewState
+    (que muda a cada sessão) e com as listas ordenadas e sem repetições, de modo
+    que requisições equivalentes produzam exatamente o mesmo dicionário.
+    """
+    normalizado = {}
+    for campo, valor in form_data.items():
+        if campo == "javax.faces.ViewState":
+            continue
+        if isinstance(valor, (list, tuple, set)):
+            valor = sorted(set(valor))
+        normalizado[campo] = valor
+    return normalizado
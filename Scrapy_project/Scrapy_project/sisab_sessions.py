@@ -0,0 +1,111 @@
+# Reaproveitamento de sessões JSF do SISAB.
+#
+# Para gerar um relatório, o SisabSpider precisa de uma sessão aberta no portal
+# (cookie JSESSIONID) e do javax.faces.ViewState da página, obtidos com um GET
+# antes do POST. Uma sessão continua válida depois de gerar um relatório, então
+# guardá-la permite que as submissões seguintes (de outros lotes ou de outros
+# jobs no mesmo processo) pulem esse GET.
+
+import threading
+import time
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from typing import Optional
+
+
+@dataclass
+class JsfSession:
+    """Uma sessão já aberta no portal: cookies e ViewState da página de relatórios."""
+    url: str
+    viewstate: str
+    cookies: dict = field(default_factory=dict)
+    criada_em: float = field(default_factory=time.monotonic)
+    usada_em: float = field(default_factory=time.monotonic)
+    usos: int = 0
+
+
+def session_from_response(response) -> Optional[JsfSession]:
+    """
+    Monta uma sessão a partir da resposta do GET da página de relatórios
+    (ViewState do formulário e cookies definidos pelo servidor).
+    Retorna None se a página não tiver o ViewState.
+    """
+    viewstate = response.css('input[name="javax.faces.ViewState"]::attr(value)').get()
+    if not viewstate:
+        return None
+    cookies = {}
+    for header in response.headers.getlist("Set-Cookie"):
+        jar = SimpleCookie()
+        jar.load(header.decode("latin-1"))
+        cookies.update({nome: morsel.value for nome, morsel in jar.items()})
+    return JsfSession(url=response.url, viewstate=viewstate, cookies=cookies)
+
+
+class SessionPool:
+    """
+    Sessões JSF prontas para uso, por URL da página de relatórios.
+
+    - max_sessions: número máximo de sessões guardadas por URL.
+    - max_idle: tempo, em segundos, que uma sessão pode ficar sem uso; o portal
+      expira sessões ociosas, então as mais antigas são descartadas.
+    - max_uses: número de relatórios gerados por uma sessão antes de ela ser
+      descartada (0 = sem limite).
+
+    Cada sessão é usada por uma submissão de cada vez: 'acquire' a retira do
+    pool e 'release' a devolve depois que o CSV foi recebido. Sessões que
+    deixaram de funcionar (o portal não devolveu o CSV) devem ser descartadas
+    com 'discard'.
+    """
+
+    def __init__(self, max_sessions: int = 4, max_idle: float = 600.0, max_uses: int = 0):
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._sessions: dict[str, list[JsfSession]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"reutilizadas": 0, "descartadas": 0}
+
+    def acquire(self, url: str) -> Optional[JsfSession]:
+        """Retira do pool a sessão usada mais recentemente para a URL (ou None)."""
+        agora = time.monotonic()
+        with self._lock:
+            disponiveis = self._sessions.get(url, [])
+            while disponiveis:
+                sessao = disponiveis.pop()
+                if agora - sessao.usada_em < self.max_idle:
+                    self.stats["reutilizadas"] += 1
+                    return sessao
+                self.stats["descartadas"] += 1
+        return None
+
+    def offer(self, sessao: JsfSession):
+        """Adiciona ao pool uma sessão recém-aberta."""
+        self._put(sessao)
+
+    def release(self, sessao: JsfSession):
+        """Devolve ao pool uma sessão que acabou de gerar um relatório."""
+        sessao.usos += 1
+        sessao.usada_em = time.monotonic()
+        if self.max_uses and sessao.usos >= self.max_uses:
+            with self._lock:
+                self.stats["descartadas"] += 1
+            return
+        self._put(sessao)
+
+    def discard(self, sessao: JsfSession):
+        with self._lock:
+            self.stats["descartadas"] += 1
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(sessoes) for sessoes in self._sessions.values())
+
+    def _put(self, sessao: JsfSession):
+        with self._lock:
+            disponiveis = self._sessions.setdefault(sessao.url, [])
+            disponiveis.append(sessao)
+            # Mantém as mais recentes, que têm menos chance de já ter expirado.
+            disponiveis.sort(key=lambda s: s.usada_em)
+            while len(disponiveis) > self.max_sessions:
+                disponiveis.pop(0)
+                self.stats["descartadas"] += 1
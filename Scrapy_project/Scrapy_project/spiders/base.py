@@ -0,0 +1,14 @@
+import scrapy
+
+
+class BaseSpider(scrapy.Spider):
+    """
+    Base dos spiders do projeto, que montam os requests iniciais em
+    'start_requests'. O 'start' padrão do Scrapy >= 2.13 só lê 'start_urls',
+    então ele é sobrescrito aqui para repassar esses requests; as versões
+    anteriores continuam chamando 'start_requests' direto.
+    """
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
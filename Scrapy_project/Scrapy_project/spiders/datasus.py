@@ -1,93 +1,246 @@
+import csv
+import html
+import re
+
 import scrapy
-import os
-from datetime import datetime
-from typing import List
 
+from ..items import DatasusRowItem
+from .base import BaseSpider
 
-class DatasusSpider(scrapy.Spider):
-    name = "datasus"
+URL_TABNET = "http://tabnet.datasus.gov.br/cgi/deftohtm.exe?sih/cnv/nibr.def"
 
-    start_urls = ["http://tabnet.datasus.gov.br/cgi/deftohtm.exe?sih/cnv/nibr.def"]
+# Valor da opção 'Coluna' que desativa o eixo de colunas da tabela.
+SEM_COLUNA = "--Não-Ativa--"
 
-    def get_select_options(self, response: scrapy.http.Response, select_name: str) -> List[str]:
-        """Extrai todos os valores (attributes 'value') de um campo <select>."""
-        # Seletor genérico para Linha, Coluna, Conteúdo
-        selector = f'select[name="{select_name}"] option::attr(value)'
-        return response.css(selector).getall()
+FORMATOS = ("prn", "table")
 
-    def get_period_labels(self, response: scrapy.http.Response) -> List[str]:
-        """Extrai os rótulos de Período (que geralmente são os valores a serem enviados)."""
-        # Seletor para o campo Período (Arquivos)
-        return response.css('select[name="Arquivos"] option::text').getall()
+# Linhas de uma tabela '<table>', lidas uma a uma com expressões regulares em
+# vez de montar a árvore da página inteira (tabelas por município têm milhares de linhas).
+_RE_LINHA = re.compile(r"<tr[^>]*>(.*?)</tr>", re.IGNORECASE | re.DOTALL)
+_RE_CELULA = re.compile(r"<t[hd][^>]*>(.*?)</t[hd]>", re.IGNORECASE | re.DOTALL)
+_RE_TAG = re.compile(r"<[^>]+>")
+_RE_PRE = re.compile(r"<pre[^>]*>(.*?)(?:</pre>|$)", re.IGNORECASE | re.DOTALL)
 
-    def parse(self, response):
+
+def parse_tabnet_value(texto: str):
+    """
+    Converte uma célula do TabNet em número:
+    '-' (sem registros) -> 0, '...' (sem informação) -> None,
+    '1.234' -> 1234 e '1.234,56' (ou '1234,56') -> 1234.56.
+    """
+    texto = texto.strip()
+    if texto in ("", "-"):
+        return 0
+    if texto.strip(".") == "":
+        return None
+    if "," in texto:
+        return float(texto.replace(".", "").replace(",", "."))
+    return int(texto.replace(".", ""))
+
+
+def _as_list(valor) -> list:
+    """Aceita listas ou textos separados por vírgula (argumentos '-a' do scrapy crawl)."""
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        return [parte.strip() for parte in valor.split(",") if parte.strip()]
+    return list(valor)
+
+
+class DatasusSpider(BaseSpider):
+    name = "datasus"
+
+    def __init__(self, url=None, linha=None, coluna=None, incrementos=None, periodos=None, formato="prn",
+                 apenas_opcoes=False, output_file=None, formato_saida=None, *args, **kwargs):
+        """
+        Extrai uma tabela do TabNet (DATASUS) a partir do formulário de uma base
+        (por padrão, a de procedimentos hospitalares do SIH/SUS).
+        - url: URL do formulário (deftohtm.exe?<base>.def).
+        - linha, coluna: valores das opções 'Linha' e 'Coluna' do formulário
+          (padrão: a opção marcada na página).
+        - incrementos: conteúdos ('Incremento') da tabela; lista ou texto separado por vírgulas.
+        - periodos: arquivos ('nibr2508.dbf') ou rótulos ('Ago/2025') dos períodos.
+          Cada período é consultado em uma requisição própria, em paralelo;
+          padrão: o período mais recente.
+        - formato: 'prn' (colunas separadas por ';', mais leve) ou 'table'.
+        - apenas_opcoes: apenas lê as opções do formulário e as retorna como um item.
+        - output_file: arquivo em que o BatchedExportPipeline grava as linhas extraídas.
+        - formato_saida: 'csv', 'parquet' ou 'sqlite' (padrão: o da extensão de 'output_file').
+        """
+        super().__init__(*args, **kwargs)
+        self.url = url or URL_TABNET
+        self.linha = linha
+        self.coluna = coluna
+        self.incrementos = _as_list(incrementos)
+        self.periodos = _as_list(periodos)
+        self.formato = formato if formato in FORMATOS else "prn"
+        self.apenas_opcoes = apenas_opcoes not in (False, None, "", "0", "false", "False")
+        self.output_file = output_file
+
+        # Lidos pelo BatchedExportPipeline.
+        self.export_file = output_file
+        self.export_format = formato_saida
+
+        # Resultado de cada período: None enquanto pendente, "ok" ou a mensagem de erro.
+        self.resultados = {}
+
+        # Linhas (itens) extraídas de cada período.
+        self.linhas_extraidas = {}
+
+    def start_requests(self):
+        """
+        Faz o GET do formulário, de onde saem as opções e a URL do POST. O
+        formulário não depende de sessão e passa pelo cache HTTP compartilhado.
         """
-        Extrai as opções e monta a requisição POST final.
+        yield scrapy.Request(url=self.url, callback=self.parse, dont_filter=True, meta={"cache_pagina": True})
+
+    # --- Opções do Formulário ---
+
+    @staticmethod
+    def get_select_options(response: scrapy.http.Response, select_name: str) -> list:
+        """Opções de um campo <select>, como dicts {"valor", "rotulo", "selecionada"}."""
+        opcoes = []
+        for opcao in response.css(f'select[name="{select_name}"] option'):
+            valor = opcao.attrib.get("value")
+            rotulo = " ".join(opcao.css("::text").get("").split())
+            opcoes.append({
+                "valor": valor if valor is not None else rotulo,
+                "rotulo": rotulo,
+                "selecionada": "selected" in opcao.attrib,
+            })
+        return opcoes
+
+    def parse_options(self, response: scrapy.http.Response) -> dict:
+        return {
+            "linhas": self.get_select_options(response, "Linha"),
+            "colunas": self.get_select_options(response, "Coluna"),
+            "incrementos": self.get_select_options(response, "Incremento"),
+            "periodos": self.get_select_options(response, "Arquivos"),
+        }
+
+    @staticmethod
+    def _choose(opcoes: list, escolhidos: list, campo: str) -> list:
         """
-        self.logger.info(f"Página de formulário carregada: {response.url}")
+        Converte os valores ou rótulos escolhidos nos valores do formulário;
+        sem escolha, usa as opções marcadas na página (ou a primeira).
+        """
+        if not escolhidos:
+            marcadas = [o["valor"] for o in opcoes if o["selecionada"]]
+            return marcadas or [o["valor"] for o in opcoes[:1]]
+        por_nome = {o["valor"]: o["valor"] for o in opcoes}
+        por_nome.update({o["rotulo"]: o["valor"] for o in opcoes})
+        invalidos = [e for e in escolhidos if e not in por_nome]
+        if invalidos:
+            raise ValueError(f"Opção inválida para '{campo}': {', '.join(invalidos)}.")
+        return [por_nome[e] for e in escolhidos]
 
-        # 1. Extração de todas as opções
-        opcoes_linha = self.get_select_options(response, "Linha")
-        opcoes_coluna = self.get_select_options(response, "Coluna")
-        opcoes_conteudo = self.get_select_options(response, "Incremento")
-        opcoes_periodo_rotulos = self.get_period_labels(response)
+    def parse(self, response):
+        """
+        Lê as opções do formulário e envia um POST por período, todos ao mesmo
+        tempo (limitados pelas configurações de concorrência do Scrapy).
+        """
+        opcoes = self.parse_options(response)
+        if self.apenas_opcoes:
+            yield {"opcoes": opcoes}
+            return
 
-        if not opcoes_periodo_rotulos:
+        if not opcoes["periodos"]:
             self.logger.error("Nenhuma opção de período (Arquivos) foi encontrada.")
+            self.resultados[0] = "Nenhuma opção de período (Arquivos) foi encontrada no formulário."
             return
 
-
-        form_data = {
-            # Tenta satisfazer a validação JavaScript:
-            "uf": "TO",  # Tenta Brasil como valor padrão se não estiver usando estado
-            "mes": "ago",  # Tenta o número do mês (Agosto)
-            "ano": "2025",  # Tenta o ano
-            "tipo_arquivo": "3",  # Tenta um código para CSV/TXT
-
-            # A chave 'Arquivos[]' provavelmente precisa ser alterada.
-            # Use o formato YYYYMM se o servidor esperar isso.
-            "Arquivos[]": ["202508"],
+        linha = self._choose(opcoes["linhas"], [self.linha] if self.linha else [], "linha")[0]
+        coluna = self._choose(opcoes["colunas"], [self.coluna] if self.coluna else [], "coluna")[0]
+        incrementos = self._choose(opcoes["incrementos"], self.incrementos, "incrementos")
+        # Os períodos são listados do mais recente para o mais antigo.
+        periodos = self._choose(opcoes["periodos"], self.periodos or [opcoes["periodos"][0]["valor"]], "periodos")
+        rotulos = {o["valor"]: o["rotulo"] for o in opcoes["periodos"]}
+
+        formulario = response.xpath('//form[.//select[@name="Arquivos"]]')
+        acao = response.urljoin(formulario.attrib.get("action", response.url))
+        # Campos ocultos e o botão de envio, como o navegador enviaria.
+        campos = {
+            campo.attrib["name"]: campo.attrib.get("value", "")
+            for campo in formulario.css('input[type="hidden"][name], input[type="submit"][name]')
         }
 
-        # A URL de ação é a mesma URL da página, pois o formulário POSTa para si mesmo
-        yield scrapy.FormRequest(
-            url=response.url,
-            method="POST",
-            formdata=form_data,
-            # Headers mínimos (o DATASUS geralmente não exige User-Agent complexo)
-            headers={"Referer": response.url},
-            callback=self.parse_report
-        )
+        self.resultados = {indice: None for indice in range(len(periodos))}
+        for indice, periodo in enumerate(periodos):
+            yield scrapy.FormRequest(
+                url=acao,
+                formdata={
+                    **campos,
+                    "Linha": linha,
+                    "Coluna": coluna,
+                    "Incremento": incrementos,
+                    "Arquivos": periodo,
+                    "formato": self.formato,
+                },
+                # O TabNet espera os valores acentuados na codificação da página (ISO-8859-1).
+                encoding=response.encoding,
+                headers={"Referer": response.url},
+                callback=self.parse_report,
+                errback=self.periodo_failed,
+                meta={"lote": indice, "periodo": rotulos[periodo]},
+                dont_filter=True,
+            )
+
+    # --- Tabela de Resultado ---
+
+    @staticmethod
+    def iter_prn_rows(texto: str):
+        """Linhas do bloco '<pre>' (formato 'prn'), já separadas em células."""
+        bloco = _RE_PRE.search(texto)
+        if bloco is None:
+            return
+        bloco = bloco.group(1)
+        linhas = (linha for linha in bloco.splitlines() if linha.strip())
+        yield from csv.reader(linhas, delimiter=";", quotechar='"')
+
+    @staticmethod
+    def iter_table_rows(texto: str):
+        """Linhas da tabela de dados (formato 'table'), já separadas em células."""
+        inicio = texto.find('class="tabdados"')
+        if inicio < 0:
+            return
+        fim = texto.find("</table>", inicio)
+        for linha in _RE_LINHA.finditer(texto, inicio, fim if fim >= 0 else len(texto)):
+            yield [html.unescape(_RE_TAG.sub("", celula)).strip() for celula in _RE_CELULA.findall(linha.group(1))]
 
     def parse_report(self, response):
         """
-        Processa a resposta, que é o relatório (HTML ou CSV) após o redirecionamento.
+        Percorre a tabela do período linha a linha e emite uma célula por item
+        (DatasusRowItem), sem a linha e a coluna de totais.
         """
-        self.logger.info(f"Resposta final (após redirect): {response.url} | Status: {response.status}")
-
-        # 1. Checagem do tipo de conteúdo
-        content_type = response.headers.get("Content-Type", b"").decode()
-
-        if "text/csv" in content_type or "octet-stream" in content_type:
-            # 2. Lógica de salvamento (se for CSV)
-            filename = f"Datasus_Relatorio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-            # Salva o arquivo no diretório atual (adapte conforme necessário)
-            with open(filename, "wb") as f:
-                f.write(response.body)
-            self.logger.info(f"Relatório CSV salvo com sucesso: {filename}")
-
-        elif "html" in content_type or response.status == 200:
-            # 3. Se retornar HTML, tente raspar a tabela
-            self.logger.warning("Retornou HTML. O formulário pode ter falhado na validação.")
-
-            # Aqui você adicionaria a lógica para extrair dados da tabela HTML
-            # Ex: tabela = response.css('table.tabnet-table').get()
-            # ...
-
-"""
-Linha - response.css('select[name="Linha"] option::attr(value)').getall()
-Coluna - response.css('select[name="Coluna"] option::attr(value)').getall()
-Conteudo - response.css('select[name="Incremento"] option::attr(value)').getall()
-Periodo - response.css('select[name="Arquivos"] option::text').getall()
-"""
\ No newline at end of file
+        indice = response.meta["lote"]
+        periodo = response.meta["periodo"]
+        linhas = self.iter_prn_rows(response.text) if self.formato == "prn" else self.iter_table_rows(response.text)
+
+        cabecalho = next(linhas, None)
+        if not cabecalho:
+            self.logger.error(f"Período {periodo}: a resposta não contém a tabela de dados.")
+            self.resultados[indice] = f"A resposta do período {periodo} não contém a tabela de dados."
+            return
+
+        colunas = cabecalho[1:]
+        if colunas and colunas[-1] == "Total":
+            colunas = colunas[:-1]
+
+        total = 0
+        for celulas in linhas:
+            if not celulas or celulas[0] == "Total":
+                continue
+            for coluna, valor in zip(colunas, celulas[1:]):
+                yield DatasusRowItem(periodo=periodo, linha=celulas[0], coluna=coluna, valor=parse_tabnet_value(valor))
+            total += 1
+
+        self.linhas_extraidas[indice] = total
+        self.crawler.stats.inc_value("datasus/linhas", total)
+        self.logger.info(f"Período {periodo}: {total} linhas extraídas.")
+        self.resultados[indice] = "ok"
+
+    def periodo_failed(self, failure):
+        """Registra a falha de rede/HTTP de um período (após as retentativas do Scrapy)."""
+        meta = failure.request.meta
+        self.logger.error(f"Falha na requisição do período {meta['periodo']}: {failure.value}")
+        self.resultados[meta["lote"]] = f"{type(failure.value).__name__}: {failure.value}"
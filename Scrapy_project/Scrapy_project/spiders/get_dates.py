@@ -1,18 +1,29 @@
 import scrapy
 import os
 
-class DateFinderSpider(scrapy.Spider):
+from ..sisab_sessions import session_from_response
+from .base import BaseSpider
+from .sisab import URL_RELATORIO
+
+
+class DateFinderSpider(BaseSpider):
     name = "date_finder"
 
+    def __init__(self, url=None, sessoes=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url or URL_RELATORIO
+        # SessionPool opcional: a sessão aberta para ler as datas fica
+        # disponível para a próxima extração.
+        self.sessoes = sessoes
+
     def start_requests(self):
         """
         Faz o primeiro GET para a página de relatórios.
         """
-        url = "https://sisab.saude.gov.br/paginas/acessoRestrito/relatorio/federal/saude/RelSauProducao.xhtml"
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
-        yield scrapy.Request(url=url, callback=self.parse_dates)
+        yield scrapy.Request(url=self.url, callback=self.parse_dates)
 
     def parse_dates(self, response):
         """
@@ -23,6 +34,11 @@ class DateFinderSpider(scrapy.Spider):
         #     f.write(response.body)
         # self.logger.info(f"HTML de resposta salvo em: {os.path.abspath('debug_response.html')}")
 
+        if self.sessoes is not None:
+            sessao = session_from_response(response)
+            if sessao is not None:
+                self.sessoes.offer(sessao)
+
         datas_disponiveis = response.css('select[name="j_idt76"] option::attr(value)').getall()
 
         if not datas_disponiveis:
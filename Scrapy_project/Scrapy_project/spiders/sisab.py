@@ -1,140 +1,300 @@
+import gzip
+import os
+import time
+from urllib.parse import urlparse
+
 import scrapy
+from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import threads
+
+from ..sisab_form import build_form_data
+from ..sisab_sessions import session_from_response
+from .base import BaseSpider
+
+URL_RELATORIO = "https://sisab.saude.gov.br/paginas/acessoRestrito/relatorio/federal/saude/RelSauProducao.xhtml"
 
-class SisabSpider(scrapy.Spider):
+
+class SisabSpider(BaseSpider):
     name = "spider-sisab"
 
-    def __init__(self, datas_alvo=None, output_file=None, *args, **kwargs):
+    def __init__(self, datas_alvo=None, output_file=None, url=None, lotes=None, max_tentativas=3,
+                 compactar=False, filtros=None, sessoes=None, *args, **kwargs):
         """
         Este método é chamado quando o spider é iniciado pela API.
         - datas_alvo: A lista de datas escolhida pelo usuário.
         - output_file: O caminho do arquivo onde o CSV deve ser salvo.
+        - url: URL alternativa da página de relatórios (ex.: um servidor local de testes).
+        - lotes: Alternativa a 'datas_alvo'/'output_file' para dividir a extração em
+          várias submissões independentes. Lista de dicts {"datas": [...], "output_file": "..."}
+          (opcionalmente com "filtros"); cada lote usa a sua própria sessão (e ViewState)
+          e é salvo no seu próprio arquivo.
+        - max_tentativas: Quantas vezes um lote é reenviado (com uma nova sessão)
+          quando o servidor não devolve o CSV.
+        - compactar: Grava os arquivos de saída compactados com gzip.
+        - filtros: Filtros do relatório (estados, equipes, eixos...), no formato
+          aceito por 'build_form_data'; valem para os lotes que não têm os seus.
+        - sessoes: SessionPool com sessões do portal já abertas. Quando informado,
+          os lotes reaproveitam essas sessões (pulando o GET inicial) e as sessões
+          que funcionaram voltam para o pool ao final.
         """
         super().__init__(*args, **kwargs)
         self.datas_alvo = datas_alvo or []
         self.output_file = output_file
+        self.url = url or URL_RELATORIO
+        self.max_tentativas = int(max_tentativas)
+        self.compactar = compactar not in (False, None, "", "0", "false", "False")
+        self.filtros = filtros or {}
+        self.sessoes = sessoes
 
-        if not self.datas_alvo:
-            self.logger.error("Spider SisabSpider iniciado sem o parâmetro 'datas_alvo'.")
-        if not self.output_file:
-            self.logger.error("Spider SisabSpider iniciado sem o parâmetro 'output_file'.")
+        if lotes:
+            self.lotes = lotes
+        else:
+            if not self.datas_alvo:
+                self.logger.error("Spider SisabSpider iniciado sem o parâmetro 'datas_alvo'.")
+            if not self.output_file:
+                self.logger.error("Spider SisabSpider iniciado sem o parâmetro 'output_file'.")
+            self.lotes = [{"datas": self.datas_alvo, "output_file": self.output_file}]
 
+        # Resultado de cada lote: None enquanto pendente, "ok" ou a mensagem de erro.
+        self.resultados = {indice: None for indice in range(len(self.lotes))}
 
-    def start_requests(self):
-        """
-        Faz o primeiro GET para a página de relatórios para capturar o ViewState.
-        """
-        url = "https://sisab.saude.gov.br/paginas/acessoRestrito/relatorio/federal/saude/RelSauProducao.xhtml"
-        headers = {
-            "User-Agent": "Mozilla/5.0"
-        }
-        yield scrapy.Request(url=url, callback=self.parse_and_submit)
+        # Tempo, em segundos, gasto gravando (ou movendo) o arquivo de cada lote.
+        self.tempos_gravacao = []
 
+        # Arquivos '.part' abertos, por lote, enquanto o CSV está sendo recebido.
+        self._streams = {}
 
-    def parse_and_submit(self, response):
-        """
-        Extrai o javax.faces.ViewState e monta o POST final.
-        """
-        viewstate = response.css('input[name="javax.faces.ViewState"]::attr(value)').get()
-        if not viewstate:
-            self.logger.error("ViewState não encontrado!")
+        # Cada sessão (nova ou reaproveitada) usa um cookiejar próprio.
+        self._cookiejars = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.on_headers_received, signal=signals.headers_received)
+        crawler.signals.connect(spider.on_bytes_received, signal=signals.bytes_received)
+        crawler.signals.connect(spider.on_spider_closed, signal=signals.spider_closed)
+        return spider
+
+    # --- Escrita em streaming ---
+    # O CSV é gravado em '<output_file>.part' à medida que os bytes chegam, em vez
+    # de ser escrito de uma vez a partir do response.body no callback. O arquivo
+    # parcial pode ser lido (por exemplo, pela API) antes de o download terminar;
+    # o save_csv apenas o renomeia para o caminho final.
+
+    @staticmethod
+    def partial_path(output_file: str) -> str:
+        return f"{output_file}.part"
+
+    def _open_output(self, path: str):
+        return gzip.open(path, "wb") if self.compactar else open(path, "wb")
+
+    def on_headers_received(self, headers, body_length, request, spider):
+        if spider is not self or request.method != "POST" or "lote" not in request.meta:
+            return
+        content_type = headers.get("Content-Type", b"").decode()
+        content_encoding = headers.get("Content-Encoding", b"identity").decode().lower()
+        # Respostas que não são CSV (sessão expirada) ou que chegam comprimidas
+        # pelo HTTP seguem o caminho normal, a partir do response.body.
+        if ("csv" not in content_type and "octet-stream" not in content_type) or content_encoding != "identity":
             return
 
-        self.logger.info(f"ViewState capturado: {viewstate[:25]}...")
+        indice = request.meta["lote"]
+        output_file = self.lotes[indice]["output_file"]
+        if not output_file:
+            return
+        self._close_stream(indice, descartar=True)
+        caminho = self.partial_path(output_file)
+        self._streams[indice] = {"arquivo": self._open_output(caminho), "caminho": caminho, "bytes": 0}
 
-        # As datas a usar vêm diretamente do parâmetro 'datas_alvo' recebido.
-        datas_para_usar = self.datas_alvo
-        if not datas_para_usar:
-            self.logger.error("Nenhuma data foi fornecida para a extração.")
+    def on_bytes_received(self, data, request, spider):
+        if spider is not self or request.method != "POST":
             return
+        stream = self._streams.get(request.meta.get("lote"))
+        if stream is not None:
+            stream["arquivo"].write(data)
+            stream["bytes"] += len(data)
 
-        form_data = {
-            "j_idt44": "j_idt44",
-            "lsCid": "",
-            "dtBasicExample_length": "10",
-            "lsSigtap": "",
-            "td-ls-sigtap_length": "10",
+    def _close_stream(self, indice: int, descartar: bool = False):
+        stream = self._streams.pop(indice, None)
+        if stream is None:
+            return None
+        stream["arquivo"].close()
+        if descartar:
+            if os.path.exists(stream["caminho"]):
+                os.remove(stream["caminho"])
+            return None
+        return stream
 
-            # Unidade Geografica
-            "unidGeo": "estado",
+    def on_spider_closed(self, spider):
+        for indice in list(self._streams):
+            self._close_stream(indice, descartar=True)
 
-            # Unidades Federativas
-            "estados": [
-                "AC","AL","AM","AP","BA","CE","DF","ES","GO","MA","MG","MS","MT",
-                "PA","PB","PE","PI","PR","RJ","RN","RO","RR","RS","SC","SE","SP","TO"
-            ],
 
-            # Periodo de Datas
-            "j_idt76": datas_para_usar,
+    def start_requests(self):
+        """
+        Para cada lote, reaproveita uma sessão do pool, se houver, e envia o POST
+        direto; senão, faz o primeiro GET para a página de relatórios para
+        capturar o ViewState.
+        """
+        for indice in range(len(self.lotes)):
+            sessao = self.sessoes.acquire(self.url) if self.sessoes is not None else None
+            if sessao is not None:
+                self.crawler.stats.inc_value("sisab/sessoes/reutilizadas")
+                yield self.submit_request(indice, sessao, tentativa=1, reutilizada=True)
+            else:
+                yield self.prime_request(indice)
 
-            # Linha da Tabela
-            "selectLinha": "ATD.CO_UF_IBGE",
+    def _new_cookiejar(self) -> int:
+        self._cookiejars += 1
+        return self._cookiejars
 
-            # Coluna da Tabela
-            "selectcoluna": "CO_TIPO_ATENDIMENTO",
+    def prime_request(self, indice: int, tentativa: int = 1):
+        """
+        Monta o GET que abre uma sessão para o lote. Cada sessão usa um cookiejar
+        próprio, pois o ViewState do JSF pertence à sessão em que foi gerado.
+        """
+        return scrapy.Request(
+            url=self.url,
+            callback=self.parse_and_submit,
+            errback=self.lote_failed,
+            meta={"cookiejar": self._new_cookiejar(), "lote": indice, "tentativa": tentativa},
+            dont_filter=True,
+        )
 
-            # Equipes de Atendimento
-            "j_idt89": ["eq-esf","eq-eacs","eq-nasf","eq-eab","eq-ecr","eq-sb","eq-epen","eq-eap"],
 
-            # Categorias de Profissional
-            "categoriaProfissional": [
-                "3","5","6","7","8","9","10","11","12","13","14","15","16","17",
-                "18","19","20","21","22","23","24","25","26","27","30","31"
-            ],
-            "idadeInicio": "0",
-            "idadeFim": "0",
+    def parse_and_submit(self, response):
+        """
+        Extrai o javax.faces.ViewState e monta o POST final.
+        """
+        indice = response.meta["lote"]
+        sessao = session_from_response(response)
+        if sessao is None:
+            self.logger.error("ViewState não encontrado!")
+            self.resultados[indice] = "ViewState não encontrado na página de relatórios."
+            return
 
-            # Locais de Atendimento
-            "localAtendimento": ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10"],
+        self.logger.info(f"ViewState capturado: {sessao.viewstate[:25]}...")
+        self.crawler.stats.inc_value("sisab/sessoes/novas")
 
-            # Tipo de Atendimento
-            "tipoAtendimento": ["2", "5", "6"],
+        request = self.submit_request(indice, sessao, response.meta["tentativa"], cookiejar=response.meta["cookiejar"])
+        if request is not None:
+            yield request
 
-            # Tipo de Produção
-            "tpProducao": "4",
+    def submit_request(self, indice: int, sessao, tentativa: int, reutilizada: bool = False, cookiejar=None):
+        """
+        Monta o POST que gera o CSV do lote usando a sessão informada. Sessões
+        reaproveitadas levam os seus cookies em um cookiejar novo.
+        """
+        # As datas a usar vêm diretamente do lote (ou do parâmetro 'datas_alvo' recebido).
+        datas_para_usar = self.lotes[indice]["datas"]
+        if not datas_para_usar:
+            self.logger.error("Nenhuma data foi fornecida para a extração.")
+            self.resultados[indice] = "Nenhuma data foi fornecida para a extração."
+            return None
 
-            # Condição de Avaliação
-            "condicaoAvaliada": "ABP014",
-            "javax.faces.ViewState": viewstate,
-            "j_idt192": "j_idt192"
-        }
+        filtros = self.lotes[indice].get("filtros") or self.filtros
+        form_data = build_form_data(datas_para_usar, sessao.viewstate, filtros)
 
+        origem = urlparse(sessao.url)
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
-            "Origin": "https://sisab.saude.gov.br",
-            "Referer": response.url,
+            "Origin": f"{origem.scheme}://{origem.netloc}",
+            "Referer": sessao.url,
             "User-Agent": "Mozilla/5.0",
         }
 
         # Envia o POST que retorna o CSV
-        yield scrapy.FormRequest(
-            url=response.url,
+        return scrapy.FormRequest(
+            url=sessao.url,
             formdata=form_data,
             method="POST",
             headers=headers,
+            cookies=sessao.cookies if reutilizada else None,
             callback=self.save_csv,
+            errback=self.lote_failed,
+            meta={
+                "cookiejar": cookiejar if cookiejar is not None else self._new_cookiejar(),
+                "lote": indice,
+                "tentativa": tentativa,
+                "sessao": sessao,
+                "sessao_reutilizada": reutilizada,
+            },
+            dont_filter=True,
         )
 
 
-    def save_csv(self, response):
+    def _write_body(self, output_file: str, corpo: bytes):
+        with self._open_output(output_file) as f:
+            f.write(corpo)
+
+    async def save_csv(self, response):
         """
         Salva o arquivo CSV retornado pelo POST diretamente no caminho fornecido pela API.
         """
+        indice = response.meta["lote"]
+        tentativa = response.meta["tentativa"]
+        output_file = self.lotes[indice]["output_file"]
         try:
             # Validação da Resposta
             content_type = response.headers.get("Content-Type", b"").decode()
             if "csv" not in content_type and "octet-stream" not in content_type:
+                if self.sessoes is not None and response.meta.get("sessao") is not None:
+                    self.sessoes.discard(response.meta["sessao"])
+                if response.meta.get("sessao_reutilizada"):
+                    # A sessão guardada expirou: abre uma nova sem gastar uma tentativa.
+                    self.logger.info(f"Sessão reaproveitada do lote {indice} expirou; abrindo uma nova.")
+                    self.crawler.stats.inc_value("sisab/sessoes/expiradas")
+                    yield self.prime_request(indice, tentativa)
+                    return
+                if tentativa < self.max_tentativas:
+                    # Normalmente é a sessão/ViewState que expirou: tenta de novo só este lote.
+                    self.logger.warning(f"Lote {indice} não retornou um CSV ({content_type}); nova tentativa ({tentativa + 1}/{self.max_tentativas}).")
+                    yield self.prime_request(indice, tentativa + 1)
+                    return
                 raise IOError(f"O servidor retornou um tipo de conteúdo inesperado ({content_type}) em vez de um arquivo CSV.")
 
-            if not self.output_file:
+            if not output_file:
                 raise ValueError("O caminho do arquivo de saída (output_file) não foi fornecido ao spider.")
 
-            # Escrita do Arquivo no caminho temporário fornecido pela API
-            with open(self.output_file, "wb") as f:
-                f.write(response.body)
+            inicio_gravacao = time.monotonic()
+            stream = self._close_stream(indice)
+            if stream is not None:
+                # O conteúdo já foi gravado em disco durante o download.
+                os.replace(stream["caminho"], output_file)
+            else:
+                # Escrita do Arquivo no caminho temporário fornecido pela API. A
+                # gravação (e a compactação gzip) roda em uma thread, para não
+                # travar o reactor e os downloads dos outros lotes.
+                await maybe_deferred_to_future(threads.deferToThread(self._write_body, output_file, response.body))
 
-            self.logger.info(f"CSV salvo com sucesso em: {self.output_file}")
+            self.tempos_gravacao.append(time.monotonic() - inicio_gravacao)
+            self.logger.info(f"CSV salvo com sucesso em: {output_file}")
+            self.resultados[indice] = "ok"
+            if self.sessoes is not None and response.meta.get("sessao") is not None:
+                self.sessoes.release(response.meta["sessao"])
 
         except Exception as e:
+            self._close_stream(indice, descartar=True)
             self.logger.error(f"Falha ao salvar o resultado da extração: {e}")
+            self.resultados[indice] = str(e)
             # Levanta a exceção novamente para que o CrawlerProcess da API saiba que a extração falhou.
             raise
+
+        # Informa a API de que o lote terminou (capturado pelo sinal 'item_scraped').
+        yield {"lote": indice, "datas": self.lotes[indice]["datas"], "output_file": output_file}
+
+
+    def lote_failed(self, failure):
+        """Registra a falha de rede/HTTP de um lote (após as retentativas do Scrapy)."""
+        meta = failure.request.meta
+        indice = meta["lote"]
+        self._close_stream(indice, descartar=True)
+        if self.sessoes is not None and meta.get("sessao") is not None:
+            self.sessoes.discard(meta["sessao"])
+        if meta.get("sessao_reutilizada"):
+            # Uma sessão guardada pode ter sido encerrada pelo portal: tenta com uma nova.
+            self.logger.info(f"Falha com a sessão reaproveitada do lote {indice}; abrindo uma nova.")
+            return [self.prime_request(indice, meta["tentativa"])]
+        self.logger.error(f"Falha na requisição do lote {indice}: {failure.value}")
+        self.resultados[indice] = f"{type(failure.value).__name__}: {failure.value}"
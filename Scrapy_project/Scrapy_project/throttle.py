@@ -0,0 +1,195 @@
+# Limite adaptativo de requisições por host, compartilhado entre processos.
+#
+# Os crawls da API rodam em vários processos ao mesmo tempo, e todos falam com
+# os mesmos servidores (SISAB, DATASUS). Para que, juntos, eles respeitem um
+# único limite, o estado de cada host (concorrência, intervalo entre envios,
+# latência e taxa de erros) e as requisições em andamento ficam em um banco
+# SQLite compartilhado. Fica em um módulo sem dependência do Scrapy para que a
+# API também possa consultar os limites atuais.
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    concorrencia REAL NOT NULL,
+    atraso REAL NOT NULL,
+    latencia REAL,
+    taxa_erros REAL NOT NULL DEFAULT 0,
+    sucessos INTEGER NOT NULL DEFAULT 0,
+    ultimo_envio REAL NOT NULL DEFAULT 0,
+    atualizado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS em_andamento (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT NOT NULL,
+    expira_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_em_andamento_host ON em_andamento (host);
+"""
+
+# Peso da última medição nas médias móveis de latência e de erros.
+_PESO_EWMA = 0.3
+
+
+@dataclass
+class ThrottleBounds:
+    """Limites dentro dos quais a concorrência e o intervalo são ajustados."""
+    min_concurrency: int = 1
+    max_concurrency: int = 4
+    start_concurrency: int = 1
+    min_delay: float = 0.0
+    max_delay: float = 30.0
+    start_delay: float = 1.0
+    target_latency: float = 30.0
+    lease_ttl: float = 300.0
+
+
+class HostLimiter:
+    """
+    Controle de concorrência e intervalo por host, com ajuste AIMD:
+
+    - Cada resposta bem-sucedida com latência abaixo de 'target_latency' conta
+      como sucesso; depois de tantos sucessos seguidos quanto a concorrência
+      atual, a concorrência sobe em 1 e o intervalo cai 25%.
+    - Uma latência acima do alvo aumenta o intervalo em 50%, sem mexer na
+      concorrência.
+    - Um erro (5xx, 429, timeout, conexão recusada) corta a concorrência pela
+      metade e dobra o intervalo.
+
+    Cada requisição em andamento ocupa uma vaga ('acquire'), devolvida em
+    'release'. As vagas expiram após 'lease_ttl', de modo que um processo que
+    morreu no meio de um download não bloqueia o host para sempre.
+    """
+
+    def __init__(self, db_path: str, bounds: ThrottleBounds = None):
+        self.bounds = bounds or ThrottleBounds()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _state(self, host: str, agora: float) -> sqlite3.Row:
+        row = self._conn.execute("SELECT * FROM hosts WHERE host = ?", (host,)).fetchone()
+        if row is None:
+            self._conn.execute(
+                "INSERT INTO hosts (host, concorrencia, atraso, atualizado_em) VALUES (?, ?, ?, ?)",
+                (host, self.bounds.start_concurrency, self.bounds.start_delay, agora),
+            )
+            row = self._conn.execute("SELECT * FROM hosts WHERE host = ?", (host,)).fetchone()
+        return row
+
+    def acquire(self, host: str) -> tuple[Optional[int], float]:
+        """
+        Tenta ocupar uma vaga no host. Retorna (id da vaga, 0) em caso de
+        sucesso ou (None, segundos a esperar antes de tentar de novo).
+        """
+        agora = time.time()
+        with self._lock:
+            return self._acquire(host, agora)
+
+    def _acquire(self, host: str, agora: float) -> tuple[Optional[int], float]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM em_andamento WHERE expira_em <= ?", (agora,))
+            estado = self._state(host, agora)
+            em_andamento = self._conn.execute(
+                "SELECT COUNT(*) FROM em_andamento WHERE host = ?", (host,)
+            ).fetchone()[0]
+
+            if em_andamento >= int(estado["concorrencia"]):
+                self._conn.execute("COMMIT")
+                return None, 0.2
+            liberado_em = estado["ultimo_envio"] + estado["atraso"]
+            if agora < liberado_em:
+                self._conn.execute("COMMIT")
+                return None, liberado_em - agora
+
+            cursor = self._conn.execute(
+                "INSERT INTO em_andamento (host, expira_em) VALUES (?, ?)",
+                (host, agora + self.bounds.lease_ttl),
+            )
+            self._conn.execute("UPDATE hosts SET ultimo_envio = ? WHERE host = ?", (agora, host))
+            self._conn.execute("COMMIT")
+            return cursor.lastrowid, 0.0
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def release(self, host: str, vaga: int, latencia: Optional[float] = None, erro: bool = False):
+        """Devolve a vaga e ajusta os limites do host com o resultado da requisição."""
+        with self._lock:
+            self._release(host, vaga, latencia, erro)
+
+    def _release(self, host: str, vaga: int, latencia: Optional[float], erro: bool):
+        b = self.bounds
+        agora = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM em_andamento WHERE id = ?", (vaga,))
+            estado = self._state(host, agora)
+            concorrencia, atraso, sucessos = estado["concorrencia"], estado["atraso"], estado["sucessos"]
+            taxa_erros = (1 - _PESO_EWMA) * estado["taxa_erros"] + _PESO_EWMA * (1.0 if erro else 0.0)
+            media = estado["latencia"]
+            if latencia is not None:
+                media = latencia if media is None else (1 - _PESO_EWMA) * media + _PESO_EWMA * latencia
+
+            if erro:
+                concorrencia = max(b.min_concurrency, concorrencia // 2)
+                atraso = min(b.max_delay, max(atraso * 2, b.min_delay, 0.5))
+                sucessos = 0
+            elif latencia is not None and latencia > b.target_latency:
+                atraso = min(b.max_delay, max(atraso * 1.5, b.min_delay, 0.5))
+                sucessos = 0
+            else:
+                sucessos += 1
+                if sucessos >= concorrencia:
+                    concorrencia = min(b.max_concurrency, concorrencia + 1)
+                    atraso = max(b.min_delay, atraso * 0.75)
+                    sucessos = 0
+
+            self._conn.execute(
+                "UPDATE hosts SET concorrencia = ?, atraso = ?, latencia = ?, taxa_erros = ?, sucessos = ?, "
+                "atualizado_em = ? WHERE host = ?",
+                (concorrencia, atraso, media, taxa_erros, sucessos, agora, host),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def snapshot(self) -> dict:
+        """Limites atuais e requisições em andamento de cada host."""
+        agora = time.time()
+        with self._lock:
+            em_andamento = dict(self._conn.execute(
+                "SELECT host, COUNT(*) FROM em_andamento WHERE expira_em > ? GROUP BY host", (agora,)
+            ).fetchall())
+            hosts = self._conn.execute("SELECT * FROM hosts ORDER BY host").fetchall()
+        return {
+            row["host"]: {
+                "concorrencia": int(row["concorrencia"]),
+                "atraso": round(row["atraso"], 3),
+                "latencia_media": round(row["latencia"], 3) if row["latencia"] is not None else None,
+                "taxa_erros": round(row["taxa_erros"], 3),
+                "em_andamento": em_andamento.get(row["host"], 0),
+            }
+            for row in hosts
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def backoff_delay(tentativa: int, base: float, maximo: float) -> float:
+    """Espera antes da nova tentativa: backoff exponencial com jitter total."""
+    return random.uniform(0, min(maximo, base * 2 ** (tentativa - 1)))
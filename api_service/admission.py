@@ -0,0 +1,73 @@
+"""
+Cotas de extrações por cliente (token bucket).
+
+Cada cliente tem um balde com até 'capacidade' fichas, reabastecido à taxa
+de 'taxa' fichas por segundo; cada extração nova consome uma ficha. Um
+cliente pode, assim, disparar uma rajada de 'capacidade' extrações e depois
+segue limitado à taxa média. Os baldes ficam em memória, no processo da API,
+e os clientes inativos há mais tempo são descartados quando há mais de
+'max_clientes' (um balde descartado volta cheio).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuotaExceededError(RuntimeError):
+    """O cliente esgotou a sua cota; 'retry_after' é o tempo, em segundos, até a próxima ficha."""
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class ClientQuotas:
+    def __init__(self, taxa: float, capacidade: int, max_clientes: int = 10000):
+        self.taxa = taxa
+        self.capacidade = max(1, capacidade)
+        self.max_clientes = max_clientes
+        self._lock = threading.Lock()
+        # cliente -> (fichas, instante da última atualização)
+        self._baldes = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.taxa > 0
+
+    def acquire(self, cliente: str, custo: float = 1.0):
+        """Consome 'custo' fichas do cliente ou levanta QuotaExceededError."""
+        if not self.enabled:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            fichas = self._refill(cliente, agora)
+            if fichas < custo:
+                self._baldes[cliente] = (fichas, agora)
+                espera = math.ceil((custo - fichas) / self.taxa)
+                raise QuotaExceededError(
+                    f"Limite de extrações atingido para este cliente; tente de novo em {espera}s.",
+                    retry_after=max(1, espera),
+                )
+            self._baldes[cliente] = (fichas - custo, agora)
+
+    def remaining(self, cliente: str) -> float:
+        """Fichas disponíveis para o cliente agora."""
+        if not self.enabled:
+            return math.inf
+        with self._lock:
+            return self._refill(cliente, time.monotonic())
+
+    def _refill(self, cliente: str, agora: float) -> float:
+        if cliente in self._baldes:
+            fichas, atualizado_em = self._baldes[cliente]
+            self._baldes.move_to_end(cliente)
+            return min(self.capacidade, fichas + (agora - atualizado_em) * self.taxa)
+        while len(self._baldes) >= self.max_clientes:
+            self._baldes.popitem(last=False)
+        return float(self.capacidade)
+
+    def status(self) -> dict:
+        with self._lock:
+            clientes = len(self._baldes)
+        return {"clientes": clientes, "taxa_por_minuto": self.taxa * 60, "capacidade": self.capacidade}
@@ -0,0 +1,123 @@
+import os
+from pathlib import Path
+
+# Configurações da API, lidas de variáveis de ambiente para facilitar o deploy.
+
+# Pasta onde a API guarda seu estado local (banco de jobs, arquivos, caches).
+DATA_DIR = Path(os.environ.get("SISAB_DATA_DIR", Path.home() / ".sisab-api"))
+
+# Banco SQLite com o estado dos jobs de extração.
+JOBS_DB = os.environ.get("SISAB_JOBS_DB", str(DATA_DIR / "jobs.sqlite3"))
+
+# Banco SQLite com os limites de requisições por host, compartilhado pelos
+# processos de crawl (ver Scrapy_project/Scrapy_project/throttle.py).
+THROTTLE_DB = os.environ.get("SISAB_THROTTLE_DB", str(DATA_DIR / "throttle.sqlite3"))
+
+# Cache HTTP das páginas dos portais (formulário do TabNet), compartilhado
+# pelos processos de crawl (ver Scrapy_project/Scrapy_project/httpcache.py):
+# banco SQLite, se o cache está ativo e por quanto tempo, em segundos, uma
+# página guardada é usada sem consultar o servidor (depois disso ela é
+# revalidada com uma requisição condicional).
+HTTP_CACHE_DB = os.environ.get("SISAB_HTTP_CACHE_DB", str(DATA_DIR / "httpcache.sqlite3"))
+HTTP_CACHE_ENABLED = os.environ.get("SISAB_HTTP_CACHE", "1").lower() in ("1", "true", "sim")
+HTTP_CACHE_FRESH_SECS = float(os.environ.get("SISAB_HTTP_CACHE_FRESH", "3600"))
+
+# Número máximo de extrações executadas ao mesmo tempo.
+MAX_CONCURRENT_JOBS = int(os.environ.get("SISAB_MAX_JOBS", "2"))
+
+# Controle de admissão das extrações novas: jobs que podem esperar na fila
+# (além deles, a API responde 429 com Retry-After; 0 = sem limite) e cota de
+# cada cliente (IP), em extrações por minuto e tamanho da rajada permitida
+# (taxa 0 desativa a cota). Pedidos idênticos a um job em andamento e os
+# servidos pelo cache não contam.
+MAX_QUEUED_JOBS = int(os.environ.get("SISAB_MAX_QUEUED_JOBS", "20"))
+CLIENT_RATE_PER_MINUTE = float(os.environ.get("SISAB_CLIENT_RATE_PER_MINUTE", "6"))
+CLIENT_BURST = int(os.environ.get("SISAB_CLIENT_BURST", "10"))
+
+# Proxies reversos confiáveis na frente da API. Cada proxy acrescenta ao fim do
+# X-Forwarded-For o endereço de quem se conectou a ele, então o cliente é o
+# endereço nessa posição, contada a partir do fim; os anteriores são enviados
+# pelo próprio cliente e podem ser forjados. 0 = sem proxy: vale o IP da conexão.
+TRUSTED_PROXY_HOPS = int(os.environ.get("SISAB_TRUSTED_PROXY_HOPS", "0"))
+
+# URL da página de relatórios do SISAB. Permite apontar os spiders para um
+# servidor local que simula o portal (testes e benchmarks).
+SISAB_URL = os.environ.get("SISAB_URL") or None
+
+# Pool de processos de crawl: quantidade de processos, número de crawls que
+# cada processo executa antes de ser reciclado, intervalo entre os health
+# checks e tempo máximo de um crawl (em segundos).
+CRAWL_WORKERS = int(os.environ.get("SISAB_CRAWL_WORKERS", str(MAX_CONCURRENT_JOBS)))
+CRAWL_MAX_JOBS_PER_WORKER = int(os.environ.get("SISAB_CRAWL_MAX_JOBS_PER_WORKER", "50"))
+CRAWL_HEALTH_CHECK_INTERVAL = float(os.environ.get("SISAB_CRAWL_HEALTH_CHECK_INTERVAL", "30"))
+CRAWL_TIMEOUT = float(os.environ.get("SISAB_CRAWL_TIMEOUT", "1800"))
+
+# Inicia os processos do pool só quando a primeira extração precisa deles, em
+# vez de junto com a API: a API fica pronta mais cedo e ocupa menos memória
+# enquanto não há crawls, ao custo de a primeira extração esperar o processo
+# subir.
+CRAWL_LAZY_START = os.environ.get("SISAB_CRAWL_LAZY_START", "0").lower() in ("1", "true", "sim")
+
+# Perfis de execução sob demanda (parâmetro 'perfil' das extrações, ver
+# api_service/profiling.py): se podem ser pedidos, pasta onde ficam e por
+# quanto tempo, em segundos, são guardados. Desativado por padrão: o perfil
+# deixa o crawl mais lento (o de memória, várias vezes mais).
+PROFILING_ENABLED = os.environ.get("SISAB_PROFILING", "0").lower() in ("1", "true", "sim")
+PROFILE_DIR = os.environ.get("SISAB_PROFILE_DIR", str(DATA_DIR / "perfis"))
+PROFILE_TTL = float(os.environ.get("SISAB_PROFILE_TTL", str(7 * 86400)))
+
+# Cache das competências disponíveis (/date-finder): tempo, em segundos, em que
+# a lista é considerada fresca e janela extra em que a versão antiga continua
+# sendo servida enquanto é atualizada em segundo plano.
+DATE_CACHE_TTL = float(os.environ.get("SISAB_DATE_CACHE_TTL", "21600"))
+DATE_CACHE_STALE_TTL = float(os.environ.get("SISAB_DATE_CACHE_STALE_TTL", "86400"))
+
+# Cache de resultados das extrações: pasta, espaço máximo em disco (bytes) e
+# validade das entradas que incluem competências recentes. Relatórios com
+# competências dos últimos RESULT_CACHE_REVISION_MONTHS meses podem ser
+# revisados pelo SISAB e expiram após RESULT_CACHE_RECENT_TTL segundos; os
+# demais ficam no cache até serem removidos por falta de espaço (LRU).
+RESULT_CACHE_DIR = os.environ.get("SISAB_RESULT_CACHE_DIR", str(DATA_DIR / "cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("SISAB_RESULT_CACHE_MAX_BYTES", str(1024 ** 3)))
+RESULT_CACHE_REVISION_MONTHS = int(os.environ.get("SISAB_RESULT_CACHE_REVISION_MONTHS", "4"))
+RESULT_CACHE_RECENT_TTL = float(os.environ.get("SISAB_RESULT_CACHE_RECENT_TTL", "86400"))
+
+# Extração em lotes: número de competências por lote (0 desativa a divisão e
+# envia todas as datas em um único POST), quantos lotes são baixados ao mesmo
+# tempo e quantas vezes um lote é reenviado quando o SISAB não devolve o CSV.
+FANOUT_CHUNK_SIZE = int(os.environ.get("SISAB_FANOUT_CHUNK_SIZE", "0"))
+FANOUT_CONCURRENCY = int(os.environ.get("SISAB_FANOUT_CONCURRENCY", "2"))
+FANOUT_MAX_RETRIES = int(os.environ.get("SISAB_FANOUT_MAX_RETRIES", "3"))
+
+# Spool dos relatórios gerados pelos jobs: pasta, espaço máximo em disco
+# (bytes), tempo, em segundos, que um resultado não baixado fica disponível e
+# intervalo entre as limpezas das pastas expiradas.
+SPOOL_DIR = os.environ.get("SISAB_SPOOL_DIR", str(DATA_DIR / "spool"))
+SPOOL_MAX_BYTES = int(os.environ.get("SISAB_SPOOL_MAX_BYTES", str(2 * 1024 ** 3)))
+SPOOL_TTL = float(os.environ.get("SISAB_SPOOL_TTL", "21600"))
+SPOOL_CLEANUP_INTERVAL = float(os.environ.get("SISAB_SPOOL_CLEANUP_INTERVAL", "300"))
+
+# Sessões do portal reaproveitadas por cada processo de crawl (cookies +
+# ViewState), para pular o GET inicial: quantas sessões guardar (0 desativa),
+# tempo máximo sem uso, em segundos, e número máximo de relatórios por sessão
+# (0 = sem limite).
+SESSION_POOL_SIZE = int(os.environ.get("SISAB_SESSION_POOL_SIZE", "4"))
+SESSION_MAX_IDLE = float(os.environ.get("SISAB_SESSION_MAX_IDLE", "600"))
+SESSION_MAX_USES = int(os.environ.get("SISAB_SESSION_MAX_USES", "0"))
+
+# Coleta periódica das competências publicadas no SISAB (ver
+# api_service/data_store.py): pasta do store local com os relatórios colhidos,
+# intervalo entre as rodadas, em segundos (0 desativa a coleta), e número
+# máximo de competências extraídas por rodada. As competências guardadas são
+# servidas pelo store em vez de consultar o portal. Desativada por padrão: a
+# primeira rodada roda ao iniciar a API e sobe o pool de crawl (o que anula
+# SISAB_CRAWL_LAZY_START); os crawls da coleta ocupam vagas de SISAB_MAX_JOBS.
+STORE_DIR = os.environ.get("SISAB_STORE_DIR", str(DATA_DIR / "store"))
+HARVEST_INTERVAL = float(os.environ.get("SISAB_HARVEST_INTERVAL", "0"))
+HARVEST_MAX_PER_RUN = int(os.environ.get("SISAB_HARVEST_MAX_PER_RUN", "6"))
+
+# TabNet (DATASUS): URL alternativa do formulário da base (deftohtm.exe?<base>.def;
+# vazio usa a de procedimentos hospitalares do SIH/SUS) e quantos períodos são
+# consultados ao mesmo tempo em uma extração.
+DATASUS_URL = os.environ.get("SISAB_DATASUS_URL") or None
+DATASUS_CONCURRENCY = int(os.environ.get("SISAB_DATASUS_CONCURRENCY", "4"))
@@ -0,0 +1,255 @@
+import logging
+import multiprocessing
+import threading
+import time
+from queue import Empty
+from typing import Callable, Optional
+
+from api_service import metrics
+
+logger = logging.getLogger(__name__)
+
+# Os workers são iniciados com 'spawn' para não herdarem o estado do processo
+# da API (threads, event loop do asyncio em execução, conexões abertas).
+_mp = multiprocessing.get_context("spawn")
+
+
+def _worker_entry(*args):
+    """
+    Ponto de entrada dos processos do pool. O Scrapy, o Twisted e os spiders
+    (api_service.crawl_worker) só são importados aqui, no processo filho: o
+    processo da API não paga o tempo nem a memória desses imports.
+    """
+    from api_service.crawl_worker import worker_main
+    worker_main(*args)
+
+
+class CrawlWorkerError(RuntimeError):
+    """Erro reportado por um worker do pool (falha do crawl ou do próprio processo)."""
+
+
+class _Worker:
+    """Um processo worker de longa duração e as filas usadas para falar com ele."""
+
+    def __init__(self, task_timeout: float):
+        self.inbox = _mp.Queue()
+        self.outbox = _mp.Queue()
+        self.jobs_done = 0
+        # Marcado quando um crawl do worker falha ou ele é morto: não volta a ficar ocioso.
+        self.descartado = False
+        self.process = _mp.Process(
+            target=_worker_entry, args=(self.inbox, self.outbox, task_timeout, time.time()), daemon=True
+        )
+        self.process.start()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        """Mata o processo (ex.: crawl que passou do tempo limite) e o descarta."""
+        self.descartado = True
+        self.process.kill()
+        self.process.join()
+
+    def stop(self, timeout: float = 5.0):
+        if self.process.is_alive():
+            self.inbox.put(None)
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class CrawlWorkerPool:
+    """
+    Pool de processos que mantêm um reactor do Twisted rodando e executam
+    crawls sob demanda.
+
+    - size: número de processos (e, portanto, de crawls simultâneos).
+    - max_jobs_per_worker: após esse número de crawls o processo é reciclado,
+      limitando o crescimento de memória.
+    - health_check_interval: intervalo, em segundos, entre as verificações
+      dos workers ociosos.
+    - task_timeout: tempo máximo de um crawl antes de o worker ser descartado.
+    - lazy: não inicia os processos junto com o pool, e sim quando um crawl
+      precisa deles; a API sobe mais rápido e sem os processos de crawl até a
+      primeira extração (útil com instâncias que escalam a partir de zero).
+    """
+
+    def __init__(self, size: int = 2, max_jobs_per_worker: int = 50,
+                 health_check_interval: float = 30.0, task_timeout: float = 1800.0, lazy: bool = False):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.health_check_interval = health_check_interval
+        self.task_timeout = task_timeout
+        self.lazy = lazy
+        self._idle: list[_Worker] = []
+        # Processos criados (ociosos ou ocupados).
+        self._started = 0
+        self._available = threading.Condition()
+        self._stopping = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopping.clear()
+        with self._available:
+            while not self.lazy and self._started < self.size:
+                self._idle.append(_Worker(self.task_timeout))
+                self._started += 1
+        self._health_thread = threading.Thread(target=self._health_loop, name="crawl-pool-health", daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._available:
+            workers, self._idle = self._idle, []
+            self._started = 0
+            self._available.notify_all()
+        for worker in workers:
+            worker.stop()
+
+    def run(self, tarefa: str, kwargs: dict, on_event: Callable[[dict], None] = None, perfil: dict = None):
+        """
+        Executa uma tarefa de crawl no primeiro worker livre e retorna o seu
+        resultado. Bloqueia a thread chamadora até o crawl terminar.
+
+        'perfil' (argumentos de api_service.profiling.Profiler) faz o worker
+        gravar um perfil de execução do crawl.
+        """
+        worker = self._acquire()
+        try:
+            worker.inbox.put(("crawl", tarefa, kwargs, perfil))
+            try:
+                resultado = self._wait_result(worker, on_event)
+            except CrawlWorkerError:
+                # Após um erro o processo pode estar saindo (ex.: crawl que
+                # excedeu o tempo limite) e ainda parecer vivo: é substituído.
+                worker.descartado = True
+                metrics.CRAWLS.labels(tarefa=tarefa, resultado="erro").inc()
+                raise
+            metrics.CRAWLS.labels(tarefa=tarefa, resultado="ok").inc()
+            worker.jobs_done += 1
+            return resultado
+        finally:
+            self._release(worker)
+
+    def _wait_result(self, worker: _Worker, on_event):
+        deadline = time.monotonic() + self.task_timeout + 30
+        while True:
+            try:
+                msg = worker.outbox.get(timeout=1)
+            except Empty:
+                if not worker.is_alive():
+                    raise CrawlWorkerError("O processo worker terminou inesperadamente durante o crawl.")
+                if time.monotonic() > deadline:
+                    worker.kill()
+                    raise CrawlWorkerError("O worker não respondeu dentro do tempo limite.")
+                continue
+
+            tipo = msg[0]
+            if tipo == "evento":
+                if on_event is not None:
+                    on_event(msg[1])
+            elif tipo == "metricas":
+                metrics.observe_worker_metrics(msg[1])
+            elif tipo == "resultado":
+                return msg[1]
+            elif tipo == "erro":
+                raise CrawlWorkerError(msg[1])
+
+    def _acquire(self) -> _Worker:
+        with self._available:
+            while not self._idle:
+                if self._stopping.is_set():
+                    raise CrawlWorkerError("O pool de crawlers está sendo encerrado.")
+                if self._started < self.size:
+                    # Reserva a vaga; o processo é criado fora do lock.
+                    self._started += 1
+                    break
+                self._available.wait()
+            else:
+                return self._idle.pop()
+
+        # Pool sob demanda: o crawl espera o processo novo ficar pronto, sem
+        # bloquear quem devolve ou pega outros workers enquanto isso.
+        try:
+            return _Worker(self.task_timeout)
+        except BaseException:
+            with self._available:
+                self._started -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, worker: _Worker):
+        if worker.descartado or not worker.is_alive() or worker.jobs_done >= self.max_jobs_per_worker:
+            # Recicla o processo fora da thread chamadora, para não atrasar a
+            # resposta de quem acabou de usar o worker.
+            threading.Thread(target=self._replace, args=(worker,), daemon=True).start()
+            return
+        self._put_idle(worker)
+
+    def _replace(self, worker: _Worker):
+        worker.stop()
+        if not self._stopping.is_set():
+            self._put_idle(_Worker(self.task_timeout))
+
+    def _put_idle(self, worker: _Worker):
+        with self._available:
+            if self._stopping.is_set():
+                worker.stop()
+                return
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _health_loop(self):
+        while not self._stopping.wait(self.health_check_interval):
+            self.check_health()
+
+    def check_health(self) -> int:
+        """
+        Envia um ping a cada worker ocioso e substitui os que não respondem.
+        Retorna o número de workers substituídos.
+        """
+        with self._available:
+            workers, self._idle = self._idle, []
+
+        substituidos = 0
+        saudaveis = []
+        for worker in workers:
+            if self._ping(worker):
+                saudaveis.append(worker)
+            else:
+                logger.warning("Worker %s não respondeu ao health check; substituindo.", worker.process.pid)
+                worker.stop()
+                saudaveis.append(_Worker(self.task_timeout))
+                substituidos += 1
+
+        with self._available:
+            if self._stopping.is_set():
+                for worker in saudaveis:
+                    worker.stop()
+                return substituidos
+            self._idle.extend(saudaveis)
+            self._available.notify_all()
+        return substituidos
+
+    def _ping(self, worker: _Worker, timeout: float = 10.0) -> bool:
+        if not worker.is_alive():
+            return False
+        worker.inbox.put(("ping",))
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                msg = worker.outbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except Empty:
+                return False
+            if msg[0] == "metricas":
+                metrics.observe_worker_metrics(msg[1])
+                continue
+            return msg == ("pong",)
+
+    def status(self) -> dict:
+        with self._available:
+            ociosos = len(self._idle)
+            iniciados = self._started
+        return {"tamanho": self.size, "iniciados": iniciados, "ociosos": ociosos, "ocupados": iniciados - ociosos}
@@ -0,0 +1,335 @@
+"""
+Código executado dentro dos processos do pool de crawlers.
+
+Cada processo instala o reactor do Twisted uma única vez (rodando em uma thread
+gerenciada pelo crochet), monta as configurações do Scrapy e então atende
+jobs de crawl recebidos por uma fila, sem pagar o custo de inicialização a cada
+requisição.
+"""
+import os
+import time
+
+# Garante que o Scrapy encontre as configurações do projeto mesmo quando a API
+# não é executada a partir da pasta que contém o scrapy.cfg.
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "Scrapy_project.Scrapy_project.settings")
+
+import crochet
+import scrapy.signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from twisted.internet import defer
+
+from Scrapy_project.Scrapy_project.sisab_sessions import SessionPool
+from Scrapy_project.Scrapy_project.spiders.datasus import DatasusSpider
+from Scrapy_project.Scrapy_project.spiders.get_dates import DateFinderSpider
+from Scrapy_project.Scrapy_project.spiders.sisab import SisabSpider
+from api_service import config
+from api_service.profiling import Profiler
+
+# Sessões do portal abertas por este processo, reaproveitadas entre os crawls
+# (inclusive de jobs diferentes). Criado em 'worker_main'; None desativa.
+session_pool: SessionPool = None
+
+# Envia ao processo da API as métricas de um crawl. Definido em 'worker_main'.
+report_metrics = None
+
+# --- Tarefas de Crawl ---
+# Cada tarefa recebe o CrawlerRunner do processo, uma função 'emit' para
+# reportar eventos de progresso e os parâmetros do job. Ela deve retornar um
+# Deferred que dispara com o resultado do crawl.
+
+def _connect_metrics(crawler):
+    """
+    Mede o tempo de cada etapa das requisições do crawl e, ao final, envia
+    essas medições e as estatísticas do Scrapy para o processo da API.
+    """
+    etapas = []
+    downloads = []
+
+    def request_reached_downloader(request, spider):
+        request.meta["_metricas_envio"] = time.monotonic()
+
+    def headers_received(headers, body_length, request, spider):
+        agora = time.monotonic()
+        request.meta["_metricas_cabecalhos"] = agora
+        if request.method == "POST" and "_metricas_envio" in request.meta:
+            # Tempo que o portal levou para gerar o relatório.
+            etapas.append(("espera_post", agora - request.meta["_metricas_envio"]))
+
+    def response_received(response, request, spider):
+        agora = time.monotonic()
+        if request.method == "GET" and "_metricas_envio" in request.meta:
+            etapas.append(("get_inicial", agora - request.meta["_metricas_envio"]))
+        elif request.method == "POST" and "_metricas_cabecalhos" in request.meta:
+            duracao = agora - request.meta["_metricas_cabecalhos"]
+            etapas.append(("download", duracao))
+            downloads.append((len(response.body), duracao))
+
+    def spider_closed(spider, reason):
+        if report_metrics is None:
+            return
+        gravacoes = [("gravacao_arquivo", segundos) for segundos in getattr(spider, "tempos_gravacao", [])]
+        estatisticas = {
+            nome: valor for nome, valor in crawler.stats.get_stats().items()
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool)
+        }
+        report_metrics({"etapas": etapas + gravacoes, "downloads": downloads, "estatisticas": estatisticas})
+
+    crawler.signals.connect(request_reached_downloader, signal=scrapy.signals.request_reached_downloader, weak=False)
+    crawler.signals.connect(headers_received, signal=scrapy.signals.headers_received, weak=False)
+    crawler.signals.connect(response_received, signal=scrapy.signals.response_received, weak=False)
+    crawler.signals.connect(spider_closed, signal=scrapy.signals.spider_closed, weak=False)
+
+def crawl_date_finder(runner: CrawlerRunner, emit, url: str = None):
+    """Executa o DateFinderSpider e retorna o primeiro item encontrado (ou None)."""
+    crawled_items = []
+    def item_scraped(item, response, spider):
+        crawled_items.append(item)
+
+    crawler = runner.create_crawler(DateFinderSpider)
+    _connect_metrics(crawler)
+    crawler.signals.connect(item_scraped, signal=scrapy.signals.item_scraped, weak=False)
+    d = runner.crawl(crawler, url=url, sessoes=session_pool)
+    d.addCallback(lambda _: dict(crawled_items[0]) if crawled_items else None)
+    return d
+
+def _connect_progress(crawler, emit, erros: list):
+    """Conecta os sinais do crawler que viram eventos de progresso do job."""
+    def response_received(response, request, spider):
+        if request.method == "POST":
+            emit({"etapa": "relatorio_recebido", "bytes": len(response.body), "lote": request.meta.get("lote")})
+        else:
+            emit({"etapa": "pagina_carregada", "lote": request.meta.get("lote")})
+
+    def request_reached_downloader(request, spider):
+        if request.method == "POST":
+            emit({"etapa": "formulario_enviado", "lote": request.meta.get("lote")})
+
+    baixados = {}
+    def bytes_received(data, request, spider):
+        # Reporta o volume baixado de cada lote, no máximo duas vezes por segundo.
+        if request.method != "POST":
+            return
+        lote = request.meta.get("lote")
+        total, ultimo_envio = baixados.get(lote, (0, 0.0))
+        total += len(data)
+        agora = time.monotonic()
+        if agora - ultimo_envio >= 0.5:
+            emit({"etapa": "baixando", "bytes": total, "lote": lote})
+            ultimo_envio = agora
+        baixados[lote] = (total, ultimo_envio)
+
+    def item_scraped(item, response, spider):
+        if "lote" in item:
+            emit({"etapa": "lote_concluido", "lote": item["lote"], "datas": item["datas"]})
+
+    def spider_error(failure, response, spider):
+        erros.append(failure.value)
+
+    crawler.signals.connect(response_received, signal=scrapy.signals.response_received, weak=False)
+    crawler.signals.connect(request_reached_downloader, signal=scrapy.signals.request_reached_downloader, weak=False)
+    crawler.signals.connect(bytes_received, signal=scrapy.signals.bytes_received, weak=False)
+    crawler.signals.connect(item_scraped, signal=scrapy.signals.item_scraped, weak=False)
+    crawler.signals.connect(spider_error, signal=scrapy.signals.spider_error, weak=False)
+
+def crawl_sisab(runner: CrawlerRunner, emit, datas_alvo: list, output_file: str, url: str = None,
+                filtros: dict = None):
+    """Executa o SisabSpider, reportando cada etapa, e retorna o caminho do CSV gerado."""
+    erros = []
+
+    def check_result(_):
+        if erros:
+            raise erros[0]
+        falha = crawler.spider.resultados.get(0)
+        if falha not in (None, "ok"):
+            raise RuntimeError(falha)
+        if not os.path.exists(output_file):
+            raise RuntimeError("O spider terminou sem gerar o arquivo de saída.")
+        return output_file
+
+    crawler = runner.create_crawler(SisabSpider)
+    _connect_progress(crawler, emit, erros)
+    _connect_metrics(crawler)
+    d = runner.crawl(crawler, datas_alvo=datas_alvo, output_file=output_file, url=url, filtros=filtros,
+                     sessoes=session_pool)
+    d.addCallback(check_result)
+    return d
+
+def crawl_sisab_lotes(runner: CrawlerRunner, emit, lotes: list, url: str = None,
+                      concorrencia: int = None, max_tentativas: int = 3):
+    """
+    Executa o SisabSpider em modo de lotes: cada lote é uma submissão
+    independente, e até 'concorrencia' lotes são baixados ao mesmo tempo.
+
+    Retorna um dict {indice_do_lote: "ok" | mensagem de erro}; a falha de um
+    lote não interrompe os demais.
+    """
+    crawler = runner.create_crawler(SisabSpider)
+    if concorrencia:
+        crawler.settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", concorrencia, priority="cmdline")
+    _connect_progress(crawler, emit, [])
+    _connect_metrics(crawler)
+
+    def collect(_):
+        resultados = crawler.spider.resultados
+        return {
+            indice: ("ok" if resultado == "ok" and os.path.exists(lotes[indice]["output_file"]) else resultado or "O lote não foi concluído.")
+            for indice, resultado in resultados.items()
+        }
+
+    d = runner.crawl(crawler, lotes=lotes, url=url, max_tentativas=max_tentativas, sessoes=session_pool)
+    d.addCallback(collect)
+    return d
+
+def crawl_datasus_options(runner: CrawlerRunner, emit, url: str = None):
+    """Executa o DatasusSpider em modo 'apenas_opcoes' e retorna as opções do formulário (ou None)."""
+    crawled_items = []
+    def item_scraped(item, response, spider):
+        crawled_items.append(item)
+
+    crawler = runner.create_crawler(DatasusSpider)
+    _connect_metrics(crawler)
+    crawler.signals.connect(item_scraped, signal=scrapy.signals.item_scraped, weak=False)
+    d = runner.crawl(crawler, url=url, apenas_opcoes=True)
+    d.addCallback(lambda _: crawled_items[0]["opcoes"] if crawled_items else None)
+    return d
+
+def crawl_datasus(runner: CrawlerRunner, emit, output_file: str, periodos: list = None, linha: str = None,
+                  coluna: str = None, incrementos: list = None, formato: str = "prn", url: str = None,
+                  concorrencia: int = None, formato_saida: str = None):
+    """
+    Executa o DatasusSpider: os períodos são consultados em paralelo e as
+    linhas das tabelas são gravadas em 'output_file' (no 'formato_saida')
+    pelo BatchedExportPipeline.
+    Retorna o caminho do CSV gerado e o número de linhas de cada período.
+    """
+    erros = []
+
+    def period_done(response, request, spider):
+        if request.method == "POST":
+            emit({"etapa": "periodo_recebido", "lote": request.meta.get("lote"),
+                  "periodo": request.meta.get("periodo")})
+
+    def check_result(_):
+        if erros:
+            raise erros[0]
+        resultados = crawler.spider.resultados
+        if not resultados:
+            raise RuntimeError("O formulário do TabNet não foi carregado.")
+        falhas = [resultado or "O período não foi concluído." for resultado in resultados.values() if resultado != "ok"]
+        if falhas:
+            raise RuntimeError(falhas[0])
+        erro_exportacao = crawler.stats.get_value("exportacao/erro")
+        if erro_exportacao:
+            raise RuntimeError(f"Falha ao gravar o resultado: {erro_exportacao}")
+        if not os.path.exists(output_file):
+            raise RuntimeError("O spider terminou sem gerar o arquivo de saída.")
+        return {"output_file": output_file, "linhas": sum(crawler.spider.linhas_extraidas.values())}
+
+    crawler = runner.create_crawler(DatasusSpider)
+    if concorrencia:
+        crawler.settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", concorrencia, priority="cmdline")
+    _connect_metrics(crawler)
+    # O item_scraped dispara a cada célula; o progresso é reportado por período.
+    crawler.signals.connect(period_done, signal=scrapy.signals.response_received, weak=False)
+    crawler.signals.connect(lambda failure, response, spider: erros.append(failure.value),
+                            signal=scrapy.signals.spider_error, weak=False)
+    d = runner.crawl(crawler, url=url, output_file=output_file, periodos=periodos, linha=linha, coluna=coluna,
+                     incrementos=incrementos, formato=formato, formato_saida=formato_saida)
+    d.addCallback(check_result)
+    return d
+
+TASKS = {
+    "date_finder": crawl_date_finder,
+    "sisab": crawl_sisab,
+    "sisab_lotes": crawl_sisab_lotes,
+    "datasus_opcoes": crawl_datasus_options,
+    "datasus": crawl_datasus,
+}
+
+# --- Loop do Processo Worker ---
+
+def worker_main(inbox, outbox, task_timeout: float, criado_em: float = None):
+    """
+    Ponto de entrada do processo worker.
+
+    Mensagens recebidas em 'inbox':
+    - ("ping",): verifica se o reactor está respondendo; responde ("pong",).
+    - ("crawl", nome_da_tarefa, kwargs, perfil): executa a tarefa; durante a
+      execução envia ("evento", dict) e, ao final, ("resultado", valor) ou
+      ("erro", mensagem). Com 'perfil' (argumentos do Profiler), grava um
+      perfil de execução do crawl.
+    - None: encerra o processo.
+
+    A qualquer momento o worker também pode enviar ("metricas", dict) com
+    medições para o processo da API.
+    """
+    global session_pool, report_metrics
+    report_metrics = lambda dados: outbox.put(("metricas", dados))
+    if config.SESSION_POOL_SIZE > 0:
+        session_pool = SessionPool(
+            max_sessions=config.SESSION_POOL_SIZE,
+            max_idle=config.SESSION_MAX_IDLE,
+            max_uses=config.SESSION_MAX_USES,
+        )
+
+    settings = get_project_settings()
+    settings.set("ADAPTIVE_THROTTLE_DB", config.THROTTLE_DB, priority="cmdline")
+    settings.set("HTTPCACHE_ENABLED", config.HTTP_CACHE_ENABLED, priority="cmdline")
+    settings.set("HTTPCACHE_DB", config.HTTP_CACHE_DB, priority="cmdline")
+    settings.set("HTTPCACHE_FRESH_SECS", config.HTTP_CACHE_FRESH_SECS, priority="cmdline")
+    install_reactor(settings["TWISTED_REACTOR"], settings["ASYNCIO_EVENT_LOOP"])
+    configure_logging(settings)
+    crochet.setup()
+
+    runner = CrawlerRunner(settings)
+    if criado_em is not None:
+        report_metrics({"etapas": [("inicio_worker", time.time() - criado_em)]})
+
+    def emit(evento: dict):
+        outbox.put(("evento", evento))
+
+    @crochet.run_in_reactor
+    def run_task(nome: str, kwargs: dict, perfil: dict = None):
+        if perfil is None:
+            return TASKS[nome](runner, emit, **kwargs)
+        # O crawl roda na thread do reactor: é nela que o perfil é medido, do
+        # início da tarefa até o Deferred disparar.
+        profiler = Profiler(**perfil).start()
+
+        def finish_profile(resultado):
+            profiler.stop()
+            return resultado
+
+        return defer.maybeDeferred(TASKS[nome], runner, emit, **kwargs).addBoth(finish_profile)
+
+    @crochet.run_in_reactor
+    def noop():
+        return None
+
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            break
+
+        if msg[0] == "ping":
+            try:
+                noop().wait(timeout=5)
+                outbox.put(("pong",))
+            except Exception as e:
+                outbox.put(("erro", f"Reactor não respondeu: {e}"))
+            continue
+
+        _, nome, kwargs, perfil = msg
+        try:
+            resultado = run_task(nome, kwargs, perfil).wait(timeout=task_timeout)
+            outbox.put(("resultado", resultado))
+        except crochet.TimeoutError:
+            # O crawl continua rodando no reactor; o processo é descartado
+            # para que o pool o substitua por um worker limpo.
+            outbox.put(("erro", f"O crawl excedeu o tempo limite de {task_timeout:.0f}s."))
+            break
+        except Exception as e:
+            outbox.put(("erro", f"{type(e).__name__}: {e}"))
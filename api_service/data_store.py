@@ -0,0 +1,512 @@
+import csv
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from Scrapy_project.Scrapy_project.sisab_form import build_form_data, normalize_form_data
+from api_service.sisab_report import DELIMITER, ENCODING, parse_count, parse_report, read_report, rewrite_preamble
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS competencias (
+    competencia TEXT PRIMARY KEY,
+    caminho TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    registros INTEGER NOT NULL,
+    colhido_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS registros (
+    competencia TEXT NOT NULL,
+    uf TEXT,
+    tipo_atendimento TEXT NOT NULL,
+    quantidade INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_registros ON registros (competencia, uf, tipo_atendimento);
+CREATE INDEX IF NOT EXISTS idx_registros_uf ON registros (uf, tipo_atendimento, competencia, quantidade);
+CREATE INDEX IF NOT EXISTS idx_registros_tipo ON registros (tipo_atendimento, competencia, uf, quantidade);
+CREATE TABLE IF NOT EXISTS revisoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    competencia TEXT NOT NULL,
+    situacao TEXT NOT NULL,
+    registrada_em REAL NOT NULL,
+    hash_anterior TEXT,
+    hash_conteudo TEXT NOT NULL,
+    inseridos INTEGER NOT NULL,
+    alterados INTEGER NOT NULL,
+    removidos INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_revisoes_competencia ON revisoes (competencia, id);
+CREATE TABLE IF NOT EXISTS mudancas (
+    revisao INTEGER NOT NULL,
+    uf TEXT,
+    tipo_atendimento TEXT NOT NULL,
+    operacao TEXT NOT NULL,
+    quantidade_anterior INTEGER,
+    quantidade INTEGER,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_mudancas_revisao ON mudancas (revisao);
+"""
+
+# Colunas acrescentadas depois da primeira versão do store (bancos antigos
+# recebem as colunas vazias; os hashes são preenchidos na coleta seguinte).
+_COLUNAS_NOVAS = {
+    "competencias": {"sha256": "TEXT", "hash_conteudo": "TEXT", "alterado_em": "REAL"},
+    "registros": {"hash": "TEXT"},
+}
+
+# Situação de uma competência em uma coleta e operação de cada linha de uma revisão.
+NOVA, REVISADA, INALTERADA = "nova", "revisada", "inalterada"
+INSERIDO, ALTERADO, REMOVIDO = "inserido", "alterado", "removido"
+
+# Colunas dos registros que podem ser filtradas e agrupadas em 'query'.
+DIMENSOES_CONSULTA = ("competencia", "uf", "tipo_atendimento")
+
+# Parâmetros do relatório guardado: o nacional, por UF, com os filtros padrão.
+_FORMULARIO_PADRAO = normalize_form_data(build_form_data([]))
+
+
+def supports_filters(filtros: dict) -> bool:
+    """
+    Indica se um relatório com estes filtros pode ser montado a partir do
+    relatório nacional guardado: só o filtro de estados (que seleciona linhas
+    da tabela) pode diferir do padrão.
+    """
+    outros = {nome: valor for nome, valor in (filtros or {}).items() if nome != "estados"}
+    return normalize_form_data(build_form_data([], filtros=outros)) == _FORMULARIO_PADRAO
+
+
+def _format_count(valor: int) -> str:
+    return f"{valor:,}".replace(",", ".")
+
+
+def row_hash(uf: Optional[str], tipo_atendimento: str, quantidade: Optional[int]) -> str:
+    """Hash (16 hex) de uma linha tipada: muda sempre que a quantidade muda."""
+    texto = f"{uf or ''}\x1f{tipo_atendimento}\x1f{'' if quantidade is None else quantidade}"
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def content_hash(hashes) -> str:
+    """
+    Hash do conteúdo de uma competência, a partir dos hashes das linhas: não
+    depende da ordem das linhas nem do preâmbulo e do rodapé do CSV (que
+    trazem, por exemplo, a data de geração do relatório).
+    """
+    return hashlib.sha256("\n".join(sorted(hashes)).encode("ascii")).hexdigest()
+
+
+def _add_counts(a: str, b: str) -> str:
+    try:
+        x, y = parse_count(a), parse_count(b)
+    except ValueError:
+        return a
+    if x is None and y is None:
+        return a
+    return _format_count((x or 0) + (y or 0))
+
+
+class HarvestStore:
+    """
+    Relatórios nacionais (por UF, com os filtros padrão) de cada competência já
+    colhida do SISAB, guardados localmente para que as extrações dessas datas
+    não precisem ir ao portal.
+
+    - O CSV original de cada competência fica em '<pasta>/competencia=AAAAMM/'.
+    - As linhas de todos os relatórios, no formato tipado (UF, tipo de
+      atendimento, quantidade), ficam indexadas em '<pasta>/store.sqlite3'.
+
+    Cada competência guarda o SHA-256 do CSV e um hash do conteúdo (ver
+    'content_hash'), e cada linha o seu próprio hash. Quando uma competência é
+    colhida de novo, só as linhas que mudaram são gravadas, e cada mudança de
+    conteúdo vira uma revisão (tabela 'revisoes') com as linhas inseridas,
+    alteradas e removidas (tabela 'mudancas'), para que quem consome os dados
+    recarregue só o que mudou.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Arquivos em montagem; o que sobrou de uma execução interrompida é descartado.
+        self.tmp_dir = self.directory / "tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / "store.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        for tabela, colunas in _COLUNAS_NOVAS.items():
+            existentes = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({tabela})")}
+            for coluna, tipo in colunas.items():
+                if coluna not in existentes:
+                    self._conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+        self._conn.commit()
+
+    def _partition_for(self, competencia: str) -> Path:
+        return self.directory / f"competencia={competencia}"
+
+    def harvested(self) -> dict:
+        """Competências guardadas -> momento (epoch) em que foram colhidas."""
+        with self._lock:
+            rows = self._conn.execute("SELECT competencia, colhido_em FROM competencias").fetchall()
+        return {row["competencia"]: row["colhido_em"] for row in rows}
+
+    def covers(self, datas: list, filtros: dict = None) -> bool:
+        """Indica se o relatório pedido pode ser montado só com o que está guardado."""
+        if not datas or not supports_filters(filtros):
+            return False
+        guardadas = self.harvested()
+        return all(competencia in guardadas for competencia in datas)
+
+    def add(self, competencia: str, source_path: str) -> dict:
+        """
+        Move o relatório de uma competência para o store e aplica ao índice só
+        as linhas que mudaram desde a coleta anterior. Retorna o resumo:
+        'situacao' ('nova', 'revisada' ou 'inalterada'), o id da 'revisao'
+        registrada (None se o conteúdo não mudou) e as linhas 'inseridos',
+        'alterados' e 'removidos'.
+        """
+        with open(source_path, "rb") as f:
+            sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+        tabela = parse_report(read_report(source_path))
+        novos = {}
+        for registro in tabela.registros:
+            chave = (registro.get("uf"), registro["tipo_atendimento"])
+            novos[chave] = (registro["quantidade"], row_hash(*chave, registro["quantidade"]))
+        conteudo = content_hash(h for _, h in novos.values())
+
+        pasta = self._partition_for(competencia)
+        pasta.mkdir(exist_ok=True)
+        destino = pasta / "relatorio.csv"
+        os.replace(source_path, destino)
+
+        agora = time.time()
+        with self._lock:
+            with self._conn:
+                anterior = self._conn.execute(
+                    "SELECT hash_conteudo, alterado_em FROM competencias WHERE competencia = ?", (competencia,)
+                ).fetchone()
+                if anterior is not None and anterior["hash_conteudo"] == conteudo:
+                    mudancas, sem_hash = [], []
+                else:
+                    mudancas, sem_hash = self._diff(competencia, novos)
+                self._apply(competencia, mudancas, sem_hash)
+                contagens = {operacao: sum(1 for m in mudancas if m[0] == operacao)
+                             for operacao in (INSERIDO, ALTERADO, REMOVIDO)}
+
+                revisao = None
+                if anterior is None or mudancas:
+                    revisao = self._record_revision(
+                        competencia, NOVA if anterior is None else REVISADA,
+                        anterior["hash_conteudo"] if anterior is not None else None, conteudo,
+                        mudancas, contagens, agora,
+                    )
+                alterado_em = agora if revisao is not None else (anterior["alterado_em"] or agora)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO competencias "
+                    "(competencia, caminho, tamanho, registros, colhido_em, sha256, hash_conteudo, alterado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (competencia, str(destino), destino.stat().st_size, len(novos), agora, sha256, conteudo,
+                     alterado_em),
+                )
+
+        return {
+            "situacao": NOVA if anterior is None else (REVISADA if mudancas else INALTERADA),
+            "revisao": revisao,
+            "inseridos": contagens[INSERIDO],
+            "alterados": contagens[ALTERADO],
+            "removidos": contagens[REMOVIDO],
+        }
+
+    def _diff(self, competencia: str, novos: dict) -> tuple[list, list]:
+        """
+        Compara as linhas novas com as guardadas. Retorna as mudanças, como
+        (operacao, uf, tipo, quantidade anterior, quantidade, hash), e as linhas
+        iguais guardadas sem hash (bancos antigos), como (hash, uf, tipo).
+        """
+        guardados = {
+            (row["uf"], row["tipo_atendimento"]): (row["quantidade"], row["hash"])
+            for row in self._conn.execute(
+                "SELECT uf, tipo_atendimento, quantidade, hash FROM registros WHERE competencia = ?", (competencia,)
+            )
+        }
+        mudancas, sem_hash = [], []
+        for chave, (quantidade, hash_linha) in novos.items():
+            atual = guardados.pop(chave, None)
+            if atual is None:
+                mudancas.append((INSERIDO, *chave, None, quantidade, hash_linha))
+            elif atual[0] != quantidade:
+                mudancas.append((ALTERADO, *chave, atual[0], quantidade, hash_linha))
+            elif atual[1] != hash_linha:
+                sem_hash.append((hash_linha, *chave))
+        for chave, (quantidade, _) in guardados.items():
+            mudancas.append((REMOVIDO, *chave, quantidade, None, None))
+        return mudancas, sem_hash
+
+    def _apply(self, competencia: str, mudancas: list, sem_hash: list):
+        """Grava no índice só as linhas inseridas, alteradas e removidas."""
+        # 'uf IS ?' também casa as linhas sem UF (NULL).
+        filtro = "competencia = ? AND uf IS ? AND tipo_atendimento = ?"
+        self._conn.executemany(
+            "INSERT INTO registros (competencia, uf, tipo_atendimento, quantidade, hash) VALUES (?, ?, ?, ?, ?)",
+            [(competencia, uf, tipo, quantidade, h) for op, uf, tipo, _, quantidade, h in mudancas if op == INSERIDO],
+        )
+        self._conn.executemany(
+            f"UPDATE registros SET quantidade = ?, hash = ? WHERE {filtro}",
+            [(quantidade, h, competencia, uf, tipo) for op, uf, tipo, _, quantidade, h in mudancas if op == ALTERADO],
+        )
+        self._conn.executemany(
+            f"DELETE FROM registros WHERE {filtro}",
+            [(competencia, uf, tipo) for op, uf, tipo, *_ in mudancas if op == REMOVIDO],
+        )
+        self._conn.executemany(
+            f"UPDATE registros SET hash = ? WHERE {filtro}",
+            [(h, competencia, uf, tipo) for h, uf, tipo in sem_hash],
+        )
+
+    def _record_revision(self, competencia: str, situacao: str, hash_anterior: Optional[str], hash_conteudo: str,
+                         mudancas: list, contagens: dict, agora: float) -> int:
+        cursor = self._conn.execute(
+            "INSERT INTO revisoes (competencia, situacao, registrada_em, hash_anterior, hash_conteudo, "
+            "inseridos, alterados, removidos) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (competencia, situacao, agora, hash_anterior, hash_conteudo,
+             contagens[INSERIDO], contagens[ALTERADO], contagens[REMOVIDO]),
+        )
+        self._conn.executemany(
+            "INSERT INTO mudancas (revisao, uf, tipo_atendimento, operacao, quantidade_anterior, quantidade, hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(cursor.lastrowid, uf, tipo, op, anterior, quantidade, h) for op, uf, tipo, anterior, quantidade, h in mudancas],
+        )
+        return cursor.lastrowid
+
+    def revisions(self, desde: int = 0, competencias: list = None, situacao: str = None,
+                  limite: int = 100) -> list:
+        """Revisões registradas depois da revisão 'desde', da mais antiga para a mais nova."""
+        condicoes, parametros = ["id > ?"], [desde]
+        if competencias:
+            condicoes.append(f"competencia IN ({', '.join('?' * len(competencias))})")
+            parametros.extend(competencias)
+        if situacao:
+            condicoes.append("situacao = ?")
+            parametros.append(situacao)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM revisoes WHERE {' AND '.join(condicoes)} ORDER BY id LIMIT ?", [*parametros, limite]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def revision(self, revisao: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM revisoes WHERE id = ?", (revisao,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def changes(self, revisao: int, limite: int = 1000, deslocamento: int = 0) -> tuple[list, int]:
+        """Linhas inseridas, alteradas e removidas em uma revisão. Retorna (página, total)."""
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM mudancas WHERE revisao = ?", (revisao,)).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT uf, tipo_atendimento, operacao, quantidade_anterior, quantidade, hash FROM mudancas "
+                "WHERE revisao = ? ORDER BY rowid LIMIT ? OFFSET ?",
+                (revisao, limite, deslocamento),
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def write_report(self, datas: list, estados: list, output_file: str):
+        """
+        Monta o relatório de um conjunto de competências como o SISAB o
+        entregaria: as contagens de cada UF são somadas entre as competências e,
+        se 'estados' for informado, só as linhas desses estados são mantidas.
+        """
+        datas = sorted(set(datas))
+        layouts = [read_report(str(self._partition_for(competencia) / "relatorio.csv")) for competencia in datas]
+        primeiro = layouts[0]
+        selecionados = set(estados) if estados else None
+
+        somas = {}
+        for layout in layouts:
+            for campos in csv.reader(layout.linhas, delimiter=DELIMITER):
+                chave = campos[0].strip()
+                if selecionados is not None and chave not in selecionados:
+                    continue
+                atual = somas.get(chave)
+                if atual is None:
+                    somas[chave] = list(campos)
+                else:
+                    for i in range(1, min(len(atual), len(campos))):
+                        atual[i] = _add_counts(atual[i], campos[i])
+
+        with open(output_file, "w", encoding=ENCODING, errors="replace", newline="") as f:
+            preambulo = rewrite_preamble(primeiro.preambulo, datas) if len(datas) > 1 else primeiro.preambulo
+            for linha in preambulo:
+                f.write(linha + "\n")
+            if primeiro.cabecalho:
+                f.write(primeiro.cabecalho + "\n")
+            writer = csv.writer(f, delimiter=DELIMITER, lineterminator="\n")
+            writer.writerows(somas.values())
+            for linha in primeiro.rodape:
+                f.write(linha + "\n")
+
+    def query(self, competencias: list = None, inicio: str = None, fim: str = None, ufs: list = None,
+              tipos_atendimento: list = None, agrupar_por: list = None, limite: int = 1000,
+              deslocamento: int = 0) -> tuple[list, int]:
+        """
+        Consulta os registros guardados. Retorna (página de registros, total).
+
+        - competencias, ufs, tipos_atendimento: valores aceitos de cada coluna
+          (None = todos); inicio e fim limitam o intervalo de competências.
+        - agrupar_por: colunas de DIMENSOES_CONSULTA pelas quais as quantidades
+          são somadas; None devolve os registros sem agrupar e uma lista vazia
+          devolve só o total geral.
+        - limite, deslocamento: paginação, na ordem das colunas retornadas.
+        """
+        condicoes, parametros = [], []
+        for coluna, valores in (("competencia", competencias), ("uf", ufs), ("tipo_atendimento", tipos_atendimento)):
+            if valores:
+                condicoes.append(f"{coluna} IN ({', '.join('?' * len(valores))})")
+                parametros.extend(valores)
+        if inicio:
+            condicoes.append("competencia >= ?")
+            parametros.append(inicio)
+        if fim:
+            condicoes.append("competencia <= ?")
+            parametros.append(fim)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+        if agrupar_por is None:
+            colunas = list(DIMENSOES_CONSULTA)
+            sql = f"SELECT {', '.join(colunas)}, quantidade FROM registros {where}"
+        else:
+            colunas = [coluna for coluna in DIMENSOES_CONSULTA if coluna in agrupar_por]
+            selecao = "".join(f"{coluna}, " for coluna in colunas)
+            agrupamento = f"GROUP BY {', '.join(colunas)}" if colunas else ""
+            sql = f"SELECT {selecao}SUM(quantidade) AS quantidade FROM registros {where} {agrupamento}"
+        ordem = f"ORDER BY {', '.join(colunas)}" if colunas else ""
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM ({sql})", parametros).fetchone()[0]
+            rows = self._conn.execute(
+                f"{sql} {ordem} LIMIT ? OFFSET ?", [*parametros, limite, deslocamento]
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def usage(self) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS competencias, COALESCE(SUM(registros), 0) AS registros, "
+                "COALESCE(SUM(tamanho), 0) AS bytes, MAX(colhido_em) AS ultima_coleta FROM competencias"
+            ).fetchone()
+            revisoes = self._conn.execute(
+                "SELECT COUNT(*) AS revisoes, MAX(id) AS ultima_revisao FROM revisoes WHERE situacao = ?", (REVISADA,)
+            ).fetchone()
+        return {**dict(row), **dict(revisoes)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Harvester:
+    """
+    Coleta periódica das competências publicadas no SISAB.
+
+    A cada 'interval' segundos, busca a lista de competências disponíveis
+    ('fetch_dates') e extrai ('extract') as que ainda não estão no store, das
+    mais recentes para as mais antigas, até 'max_per_run' por rodada. As
+    competências que o SISAB ainda pode revisar são colhidas de novo quando a
+    cópia guardada fica mais velha que 'refresh_after(competencia)' segundos
+    (None = nunca); o store grava só as linhas que mudaram e registra a
+    revisão (ver 'HarvestStore.add').
+
+    'extract(competencias, pasta)' deve gravar o relatório de cada competência
+    em um arquivo dentro de 'pasta' e retornar {competencia: caminho ou erro}.
+    """
+
+    def __init__(self, store: HarvestStore, fetch_dates: Callable[[], list],
+                 extract: Callable[[list, str], dict], interval: float, max_per_run: int = 6,
+                 refresh_after: Callable[[str], Optional[float]] = None):
+        self.store = store
+        self.fetch_dates = fetch_dates
+        self.extract = extract
+        self.interval = interval
+        self.max_per_run = max_per_run
+        self.refresh_after = refresh_after or (lambda competencia: None)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.ultima_rodada: dict = {}
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="harvester", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def pending(self, disponiveis: list) -> list:
+        """Competências a colher: as novas e as revisáveis com cópia antiga."""
+        guardadas = self.store.harvested()
+        agora = time.time()
+        pendentes = []
+        for competencia in sorted(set(disponiveis), reverse=True):
+            colhida_em = guardadas.get(competencia)
+            if colhida_em is None:
+                pendentes.append(competencia)
+                continue
+            validade = self.refresh_after(competencia)
+            if validade is not None and agora - colhida_em >= validade:
+                pendentes.append(competencia)
+        return pendentes[:self.max_per_run]
+
+    def run_once(self) -> dict:
+        """Executa uma rodada de coleta e retorna o resumo dela."""
+        inicio = time.time()
+        pendentes = self.pending(self.fetch_dates())
+        colhidas, revisadas, inalteradas, falhas = [], [], [], {}
+        if pendentes:
+            pasta = self.store.tmp_dir / f"coleta-{int(inicio * 1000)}"
+            pasta.mkdir(parents=True)
+            try:
+                resultados = self.extract(pendentes, str(pasta))
+                for competencia in pendentes:
+                    resultado = resultados.get(competencia)
+                    if resultado and os.path.exists(resultado):
+                        resumo = self.store.add(competencia, resultado)
+                        colhidas.append(competencia)
+                        if resumo["situacao"] == REVISADA:
+                            revisadas.append(competencia)
+                        elif resumo["situacao"] == INALTERADA:
+                            inalteradas.append(competencia)
+                    else:
+                        falhas[competencia] = resultado or "O relatório não foi gerado."
+            finally:
+                shutil.rmtree(pasta, ignore_errors=True)
+        self.ultima_rodada = {
+            "inicio": inicio,
+            "duracao": time.time() - inicio,
+            "colhidas": colhidas,
+            "revisadas": revisadas,
+            "inalteradas": inalteradas,
+            "falhas": falhas,
+        }
+        if colhidas or falhas:
+            logger.info("Coleta: %d competência(s) colhida(s) (%d revisada(s), %d inalterada(s)), %d falha(s).",
+                        len(colhidas), len(revisadas), len(inalteradas), len(falhas))
+        return self.ultima_rodada
+
+    def status(self) -> dict:
+        return {"intervalo": self.interval, "ultima_rodada": self.ultima_rodada, **self.store.usage()}
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.warning("Falha na coleta de competências.", exc_info=True)
+            if self._stopping.wait(self.interval):
+                break
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CatalogEntry:
+    """Uma versão do catálogo de competências disponíveis."""
+    datas: Union[list, dict]
+    etag: str
+    buscado_em: float
+    modificado_em: float
+
+
+class DateCatalogCache:
+    """
+    Cache em memória das competências disponíveis no SISAB (ou de outro
+    catálogo serializável em JSON, como as opções do formulário do TabNet).
+
+    - Dentro do 'ttl' a entrada é servida direto do cache.
+    - Depois do 'ttl', e até 'ttl + stale_ttl', a entrada antiga continua sendo
+      servida enquanto uma única atualização roda em segundo plano
+      (stale-while-revalidate).
+    - Sem entrada ou além dessa janela, a busca é feita na hora; chamadas
+      simultâneas esperam a mesma busca em vez de disparar várias.
+
+    Se uma busca falhar, a entrada anterior (se houver) continua valendo.
+    """
+
+    def __init__(self, fetch: Callable[[], Union[list, dict]], ttl: float, stale_ttl: float):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entry: Optional[CatalogEntry] = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self) -> CatalogEntry:
+        entry = self._entry
+        if entry is not None:
+            idade = time.time() - entry.buscado_em
+            if idade < self.ttl:
+                return entry
+            if idade < self.ttl + self.stale_ttl:
+                self._refresh_in_background()
+                return entry
+        return self._fetch_now(entry)
+
+    def max_age(self, entry: CatalogEntry) -> int:
+        """Segundos que faltam para a entrada deixar de ser considerada fresca."""
+        return max(0, int(self.ttl - (time.time() - entry.buscado_em)))
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+    def _fetch_now(self, antiga: Optional[CatalogEntry]) -> CatalogEntry:
+        with self._fetch_lock:
+            # Outra thread pode ter atualizado o cache enquanto esperávamos.
+            atual = self._entry
+            if atual is not None and atual is not antiga:
+                return atual
+            try:
+                return self._update()
+            except Exception:
+                if antiga is None:
+                    raise
+                logger.warning("Falha ao atualizar as competências; servindo a versão em cache.", exc_info=True)
+                return antiga
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._fetch_lock:
+                    self._update()
+            except Exception:
+                logger.warning("Falha na atualização em segundo plano das competências.", exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, name="date-cache-refresh", daemon=True).start()
+
+    def _update(self) -> CatalogEntry:
+        datas = self.fetch()
+        agora = time.time()
+        etag = hashlib.sha256(json.dumps(datas, sort_keys=True).encode()).hexdigest()[:32]
+        with self._lock:
+            anterior = self._entry
+            # Last-Modified só avança quando o conteúdo realmente muda.
+            modificado_em = anterior.modificado_em if anterior and anterior.etag == etag else agora
+            self._entry = CatalogEntry(datas=datas, etag=etag, buscado_em=agora, modificado_em=modificado_em)
+            return self._entry
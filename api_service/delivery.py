@@ -0,0 +1,233 @@
+"""
+Entrega dos arquivos de resultado com compactação negociada e downloads retomáveis.
+
+Ao lado de cada arquivo entregue ficam versões pré-compactadas
+('<arquivo>.gz' e, se houver suporte a zstd, '<arquivo>.zst') e um
+'<arquivo>.entrega.json' com o hash SHA-256 do conteúdo, de onde sai o ETag
+forte de cada versão. As versões são geradas uma única vez (ao final do job
+ou no primeiro download) e depois servidas direto do disco, com suporte a
+Range/If-Range (pelo FileResponse) e a If-None-Match.
+
+Os arquivos derivados seguem o padrão '<arquivo>.*', então são apagados junto
+com a entrada do cache de resultados.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 9
+
+# Arquivos menores que isto são sempre entregues sem compactação.
+TAMANHO_MINIMO = 1024
+
+# Content-types que valem a pena compactar (Parquet e Arrow já são compactados).
+COMPACTAVEIS = {"text/csv", "application/x-ndjson", "application/vnd.sqlite3"}
+
+_CHUNK = 1024 * 1024
+
+# Um lock por arquivo em preparação, com o número de threads que o usam; a
+# entrada sai do dicionário quando a última delas termina.
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _open_gzip(caminho: str):
+    # mtime=0: o mesmo conteúdo gera sempre os mesmos bytes.
+    return gzip.GzipFile(caminho, "wb", compresslevel=NIVEL_GZIP, mtime=0)
+
+
+def _open_zstd(caminho: str):
+    return zstd.open(caminho, "wb", level=NIVEL_ZSTD)
+
+
+# Codificações suportadas, na ordem de preferência em caso de empate no Accept-Encoding.
+CODIFICACOES = {"zstd": (".zst", _open_zstd), "gzip": (".gz", _open_gzip)} if zstd else {"gzip": (".gz", _open_gzip)}
+
+
+@contextmanager
+def _locked(caminho: str):
+    with _locks_guard:
+        entrada = _locks.setdefault(caminho, [threading.Lock(), 0])
+        entrada[1] += 1
+    try:
+        with entrada[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del _locks[caminho]
+
+
+def _metadata_path(caminho: str) -> str:
+    return f"{caminho}.entrega.json"
+
+
+def _read_metadata(caminho: str) -> Optional[dict]:
+    """Os metadados guardados, se ainda correspondem ao arquivo (mesmo tamanho e data)."""
+    try:
+        with open(_metadata_path(caminho), encoding="utf-8") as f:
+            meta = json.load(f)
+        info = os.stat(caminho)
+    except (OSError, ValueError):
+        return None
+    if meta.get("tamanho") != info.st_size or meta.get("mtime_ns") != info.st_mtime_ns:
+        return None
+    if not all(os.path.exists(caminho + CODIFICACOES[c][0]) for c in meta["codificacoes"] if c in CODIFICACOES):
+        return None
+    return meta
+
+
+def prepare(caminho: str, compactar: bool = True) -> dict:
+    """
+    Calcula o hash do arquivo e grava as versões pré-compactadas, se ainda não
+    existirem. Retorna os metadados: 'sha256', 'tamanho' e 'codificacoes'
+    (as versões disponíveis e o tamanho de cada uma).
+    """
+    meta = _read_metadata(caminho)
+    if meta is not None and (meta["codificacoes"] or not compactar):
+        return meta
+    with _locked(caminho):
+        meta = _read_metadata(caminho)
+        if meta is not None and (meta["codificacoes"] or not compactar):
+            return meta
+        info = os.stat(caminho)
+        codificacoes = list(CODIFICACOES) if compactar and info.st_size >= TAMANHO_MINIMO else []
+        sufixo_temporario = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        temporarios = {c: f"{caminho}{CODIFICACOES[c][0]}{sufixo_temporario}" for c in codificacoes}
+        saidas = {c: CODIFICACOES[c][1](temporarios[c]) for c in codificacoes}
+        sha256 = hashlib.sha256()
+        try:
+            with open(caminho, "rb") as origem:
+                while chunk := origem.read(_CHUNK):
+                    sha256.update(chunk)
+                    for saida in saidas.values():
+                        saida.write(chunk)
+            for saida in saidas.values():
+                saida.close()
+            tamanhos = {}
+            for c, temporario in temporarios.items():
+                os.replace(temporario, caminho + CODIFICACOES[c][0])
+                tamanhos[c] = os.path.getsize(caminho + CODIFICACOES[c][0])
+        finally:
+            for c, saida in saidas.items():
+                saida.close()
+                if os.path.exists(temporarios[c]):
+                    os.remove(temporarios[c])
+        meta = {
+            "sha256": sha256.hexdigest(),
+            "tamanho": info.st_size,
+            "mtime_ns": info.st_mtime_ns,
+            "codificacoes": tamanhos,
+        }
+        temporario = _metadata_path(caminho) + sufixo_temporario
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporario, _metadata_path(caminho))
+    return meta
+
+
+def negotiate(accept_encoding: Optional[str], disponiveis) -> Optional[str]:
+    """
+    Escolhe, entre as codificações disponíveis, a de maior peso (q) no
+    cabeçalho Accept-Encoding; None para entregar o arquivo sem compactação.
+    """
+    if not accept_encoding or not disponiveis:
+        return None
+    pesos = {}
+    for parte in accept_encoding.split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        nome = nome.strip().lower()
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                peso = 0.0
+        if nome:
+            pesos[nome] = peso
+    candidatas = [(pesos.get(c, pesos.get("*", 0.0)), -ordem, c) for ordem, c in enumerate(CODIFICACOES) if c in disponiveis]
+    peso, _, escolhida = max(candidatas)
+    return escolhida if peso > 0 else None
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # A comparação de If-None-Match é fraca: 'W/"x"' equivale a '"x"'.
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class _DeliveryFileResponse(FileResponse):
+    """
+    FileResponse que executa 'on_complete' só depois de enviar o arquivo
+    inteiro com status 200. Respostas parciais (Range), sem corpo (HEAD) e
+    downloads interrompidos pelo cliente não contam como entregues.
+    """
+
+    def __init__(self, *args, on_complete: BackgroundTask = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_complete = on_complete
+
+    async def __call__(self, scope, receive, send):
+        estado = {"status": None, "completo": False}
+        cabecalho_apenas = scope.get("method", "").upper() == "HEAD"
+
+        async def send_tracking(mensagem):
+            if mensagem["type"] == "http.response.start":
+                estado["status"] = mensagem["status"]
+            await send(mensagem)
+            fim = (mensagem["type"] == "http.response.pathsend"
+                   or (mensagem["type"] == "http.response.body" and not mensagem.get("more_body", False)))
+            if fim and estado["status"] == 200 and not cabecalho_apenas:
+                estado["completo"] = True
+
+        await super().__call__(scope, receive, send_tracking)
+        if estado["completo"] and self.on_complete is not None:
+            await self.on_complete()
+
+
+def file_response(request: Request, caminho: str, media_type: str, filename: str,
+                  on_complete: BackgroundTask = None) -> Response:
+    """
+    Responde com o arquivo (ou a sua versão compactada aceita pelo cliente),
+    com ETag forte, Accept-Ranges e 304 para If-None-Match.
+
+    'on_complete' é executada só quando o arquivo inteiro é enviado (200):
+    depois de um 206 ou de um 304 o cliente ainda pode retomar o download.
+    """
+    compactavel = media_type in COMPACTAVEIS
+    meta = prepare(caminho, compactar=compactavel)
+    codificacao = negotiate(request.headers.get("accept-encoding"), meta["codificacoes"]) if compactavel else None
+    sufixo = f"-{codificacao}" if codificacao else ""
+    headers = {"ETag": f'"{meta["sha256"][:32]}{sufixo}"'}
+    if compactavel:
+        headers["Vary"] = "Accept-Encoding"
+    if codificacao:
+        headers["Content-Encoding"] = codificacao
+        caminho += CODIFICACOES[codificacao][0]
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return _DeliveryFileResponse(path=caminho, media_type=media_type, filename=filename, headers=headers,
+                                 on_complete=on_complete)
+
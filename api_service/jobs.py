@@ -0,0 +1,362 @@
+import asyncio
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Estados possíveis de um job ---
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    parametros TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progresso TEXT NOT NULL DEFAULT '{}',
+    chave TEXT,
+    resultado TEXT,
+    erro TEXT,
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, criado_em);
+"""
+
+
+class JobStore:
+    """
+    Persiste o estado dos jobs em um arquivo SQLite local, para que jobs
+    enfileirados ou em execução não sejam perdidos quando o servidor reinicia.
+    """
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        colunas = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "chave" not in colunas:
+            # Bancos criados antes da coluna 'chave' existir.
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN chave TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_chave ON jobs (chave, status)")
+        self._conn.commit()
+
+    def _row_to_dict(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["parametros"] = json.loads(job["parametros"])
+        job["progresso"] = json.loads(job["progresso"])
+        return job
+
+    def create(self, tipo: str, parametros: dict, chave: str = None,
+               status: str = PENDENTE, resultado: str = None) -> dict:
+        agora = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, tipo, parametros, status, chave, resultado, criado_em, atualizado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, tipo, json.dumps(parametros), status, chave, resultado, agora, agora),
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def find_active(self, chave: str) -> Optional[dict]:
+        """Retorna um job pendente ou em execução com a mesma chave, se houver."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE chave = ? AND status IN (?, ?) ORDER BY criado_em LIMIT 1",
+                (chave, PENDENTE, EXECUTANDO),
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def update(self, job_id: str, **campos):
+        if "progresso" in campos:
+            campos["progresso"] = json.dumps(campos["progresso"])
+        campos["atualizado_em"] = time.time()
+        colunas = ", ".join(f"{nome} = ?" for nome in campos)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {colunas} WHERE id = ?", (*campos.values(), job_id))
+            self._conn.commit()
+
+    def count(self, status: str) -> int:
+        """Número de jobs em um estado."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def claim_next(self) -> Optional[dict]:
+        """Marca o job pendente mais antigo como 'executando' e o retorna."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY criado_em LIMIT 1", (PENDENTE,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, atualizado_em = ? WHERE id = ?",
+                (EXECUTANDO, time.time(), row["id"]),
+            )
+            self._conn.commit()
+        job = self._row_to_dict(row)
+        job["status"] = EXECUTANDO
+        return job
+
+    def requeue_interrupted(self) -> int:
+        """Devolve para a fila os jobs que estavam em execução quando o servidor parou."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, atualizado_em = ? WHERE status = ?",
+                (PENDENTE, time.time(), EXECUTANDO),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueueFullError(RuntimeError):
+    """A fila de jobs está cheia; 'retry_after' estima em quantos segundos haverá vaga."""
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class JobEvents:
+    """
+    Distribui os eventos dos jobs (mudanças de status e progresso do crawl)
+    para os clientes acompanhando a extração em tempo real.
+
+    Os eventos de cada job são numerados em ordem ('seq') e os últimos
+    'historico' ficam guardados, para que um cliente que reconecta informando o
+    último número recebido não perca nada. 'publish' pode ser chamado de
+    qualquer thread; os assinantes são filas asyncio, alimentadas pelo loop de
+    cada uma. O histórico de um job terminado é descartado depois de 'retencao'
+    segundos.
+    """
+
+    def __init__(self, historico: int = 256, retencao: float = 600.0):
+        self.historico = historico
+        self.retencao = retencao
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def publish(self, job_id: str, evento: str, dados: dict, final: bool = False):
+        agora = time.monotonic()
+        with self._lock:
+            estado = self._state(job_id)
+            estado["seq"] += 1
+            registro = (estado["seq"], evento, dados)
+            estado["eventos"].append(registro)
+            if final:
+                estado["fim"] = agora
+            assinantes = list(estado["assinantes"])
+            self._prune(agora)
+        for loop, fila in assinantes:
+            try:
+                loop.call_soon_threadsafe(fila.put_nowait, registro)
+            except RuntimeError:
+                # O loop do assinante já foi encerrado.
+                pass
+
+    def subscribe(self, job_id: str, desde: int = 0) -> tuple:
+        """
+        Registra um assinante (chamado de dentro do loop asyncio) e retorna a
+        sua fila e os eventos guardados com número maior que 'desde'.
+        """
+        fila = asyncio.Queue()
+        assinante = (asyncio.get_running_loop(), fila)
+        with self._lock:
+            estado = self._state(job_id)
+            estado["assinantes"].add(assinante)
+            anteriores = [registro for registro in estado["eventos"] if registro[0] > desde]
+        return assinante, anteriores
+
+    def since(self, job_id: str, desde: int = 0) -> list:
+        """Eventos guardados do job com número maior que 'desde', sem assinar os próximos."""
+        with self._lock:
+            estado = self._jobs.get(job_id)
+            return [registro for registro in estado["eventos"] if registro[0] > desde] if estado else []
+
+    def unsubscribe(self, job_id: str, assinante: tuple):
+        with self._lock:
+            estado = self._jobs.get(job_id)
+            if estado is not None:
+                estado["assinantes"].discard(assinante)
+
+    def _state(self, job_id: str) -> dict:
+        estado = self._jobs.get(job_id)
+        if estado is None:
+            estado = self._jobs[job_id] = {
+                "seq": 0, "eventos": deque(maxlen=self.historico), "assinantes": set(), "fim": None,
+            }
+        return estado
+
+    def _prune(self, agora: float):
+        expirados = [
+            job_id for job_id, estado in self._jobs.items()
+            if estado["fim"] is not None and not estado["assinantes"] and agora - estado["fim"] > self.retencao
+        ]
+        for job_id in expirados:
+            del self._jobs[job_id]
+
+
+class JobManager:
+    """
+    Executa os jobs enfileirados em um pool limitado de threads.
+
+    Cada thread apenas coordena a execução: o trabalho pesado (o crawl) é feito
+    pela função 'runner', que recebe o job e uma função para reportar progresso
+    e retorna o caminho do arquivo de resultado.
+
+    O progresso guardado no job é o do último evento: quando a 'etapa' muda,
+    os campos da etapa anterior são descartados, exceto os listados em
+    'campos_do_job', que descrevem o job inteiro (ex.: os lotes concluídos).
+    """
+
+    # Duração assumida para um job enquanto nenhum terminou (para estimar a espera na fila).
+    DURACAO_PADRAO = 30.0
+
+    def __init__(self, store: JobStore, runner: Callable[[dict, Callable[[dict], None]], str], max_workers: int = 2,
+                 events: JobEvents = None, max_pending: int = 0, campos_do_job: tuple = ()):
+        self.store = store
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.campos_do_job = campos_do_job
+        self.events = events or JobEvents()
+        self._duracoes = deque(maxlen=20)
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        # Vagas de execução: cada job ocupa uma, e trabalhos feitos fora da fila
+        # também podem ocupar (ver 'slot').
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def start(self):
+        reenfileirados = self.store.requeue_interrupted()
+        if reenfileirados:
+            logger.info("%d job(s) interrompido(s) foram devolvidos para a fila.", reenfileirados)
+        self._stopping.clear()
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, tipo: str, parametros: dict, chave: str = None, admit: Callable[[], None] = None) -> dict:
+        """
+        Enfileira um job. Se 'chave' for informada e já existir um job idêntico
+        pendente ou em execução, retorna esse job em vez de criar outro, de modo
+        que requisições iguais compartilhem um único crawl.
+
+        Com 'max_pending' jobs já esperando na fila, levanta QueueFullError.
+        'admit' é chamada logo antes de criar o job (depois dessas verificações)
+        e pode recusá-lo levantando uma exceção, por exemplo por cota do cliente.
+        """
+        with self._wakeup:
+            if chave is not None:
+                existente = self.store.find_active(chave)
+                if existente is not None:
+                    return existente
+            if self.max_pending and self.store.count(PENDENTE) >= self.max_pending:
+                raise QueueFullError(
+                    f"A fila de extrações está cheia ({self.max_pending} jobs aguardando).",
+                    retry_after=self.estimate_wait(),
+                )
+            if admit is not None:
+                admit()
+            job = self.store.create(tipo, parametros, chave=chave)
+            self._wakeup.notify()
+        return job
+
+    def estimate_wait(self) -> int:
+        """
+        Segundos até um job sair da fila, pela duração média dos últimos jobs:
+        com 'max_workers' jobs rodando ao mesmo tempo, um termina a cada
+        duração / max_workers.
+        """
+        duracao = sum(self._duracoes) / len(self._duracoes) if self._duracoes else self.DURACAO_PADRAO
+        return max(1, math.ceil(duracao / max(1, self.max_workers)))
+
+    @contextmanager
+    def slot(self):
+        """
+        Ocupa uma das 'max_workers' vagas de execução para um trabalho feito
+        fora da fila (ex.: a coleta periódica), esperando uma vaga livre:
+        enquanto ele roda, um job a menos é executado ao mesmo tempo.
+        """
+        while not self._slots.acquire(timeout=1.0):
+            if self._stopping.is_set():
+                raise RuntimeError("O gerenciador de jobs foi encerrado.")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            if not self._slots.acquire(timeout=1.0):
+                continue
+            try:
+                job = self.store.claim_next()
+                if job is not None:
+                    self._run(job)
+            finally:
+                self._slots.release()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+
+    def _run(self, job: dict):
+        progresso = {}
+
+        def report_progress(evento: dict):
+            if "etapa" in evento and evento["etapa"] != progresso.get("etapa"):
+                do_job = {campo: progresso[campo] for campo in self.campos_do_job if campo in progresso}
+                progresso.clear()
+                progresso.update(do_job)
+            progresso.update(evento)
+            self.store.update(job["id"], progresso=progresso)
+            self.events.publish(job["id"], "progresso", evento)
+
+        self.events.publish(job["id"], "status", {"status": EXECUTANDO})
+        inicio = time.monotonic()
+        try:
+            resultado = self.runner(job, report_progress)
+            self.store.update(job["id"], status=CONCLUIDO, resultado=resultado)
+            self.events.publish(job["id"], "status", {"status": CONCLUIDO}, final=True)
+        except Exception as e:
+            logger.exception("Job %s falhou.", job["id"])
+            self.store.update(job["id"], status=ERRO, erro=str(e))
+            self.events.publish(job["id"], "status", {"status": ERRO, "erro": str(e)}, final=True)
+        finally:
+            self._duracoes.append(time.monotonic() - inicio)
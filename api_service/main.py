@@ -1,62 +1,630 @@
+import asyncio
+import json
 import os
-from pathlib import Path
+from contextlib import asynccontextmanager
+from datetime import date
+from email.utils import formatdate, parsedate_to_datetime
 import sys
-from multiprocessing import Process, Queue
+import tempfile
+import time
+from typing import Optional, Union
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi import Body, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import uvicorn
 
-from scrapy.crawler import CrawlerProcess
-from scrapy.utils.project import get_project_settings
-import scrapy.signals
-
 # Adiciona a pasta raiz ao path para garantir que os imports funcionem
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from Scrapy_project.Scrapy_project.spiders.get_dates import DateFinderSpider
-from Scrapy_project.Scrapy_project.spiders.sisab import SisabSpider
+from Scrapy_project.Scrapy_project.exporters import FORMATOS_EXPORTACAO
+from Scrapy_project.Scrapy_project.sisab_form import UFS, build_form_data, normalize_form_data
+from Scrapy_project.Scrapy_project.httpcache import HttpCacheDB
+from Scrapy_project.Scrapy_project.throttle import HostLimiter
+from api_service import config, delivery, metrics
+from api_service.admission import ClientQuotas, QuotaExceededError
+from api_service.crawl_pool import CrawlWorkerError, CrawlWorkerPool
+from api_service.data_store import DIMENSOES_CONSULTA, NOVA, REVISADA, Harvester, HarvestStore
+from api_service.date_cache import DateCatalogCache
+from api_service.jobs import CONCLUIDO, ERRO, EXECUTANDO, PENDENTE, JobManager, JobStore, QueueFullError
+from api_service.models import ListaCompetencias, PedidoDatasus, PedidoExtracao
+from api_service.profiling import TIPOS_PERFIL, Profiler, ProfileStore
+from api_service.result_cache import ResultCache, cache_key
+from api_service.sisab_report import FORMATOS, FormatUnavailableError, convert_report, merge_reports
+from api_service.spool import OutputSpool
+
+# --- Execução dos Jobs de Extração ---
+
+crawl_pool = CrawlWorkerPool(
+    size=config.CRAWL_WORKERS,
+    max_jobs_per_worker=config.CRAWL_MAX_JOBS_PER_WORKER,
+    health_check_interval=config.CRAWL_HEALTH_CHECK_INTERVAL,
+    task_timeout=config.CRAWL_TIMEOUT,
+    lazy=config.CRAWL_LAZY_START,
+)
+
+# Coluna adicionada ao relatório combinado, com o rótulo de cada lote. Lotes de
+# estados não têm rótulo: cada linha do relatório já traz a sua UF.
+COLUNA_ROTULO_LOTE = {"competencia": "Competencia", "estado": None}
+
+def extraction_cache_key(datas: list, filtros: dict = None, tamanho_lote: int = 0,
+                         dividir_por: str = "competencia") -> str:
+    """
+    Chave do cache de resultados: hash dos parâmetros normalizados do formulário.
+    O relatório combinado de uma extração em lotes tem outro formato (coluna com
+    o rótulo do lote), por isso o tamanho, a dimensão dos lotes e a coluna de
+    rótulo entram na chave.
+    """
+    parametros = normalize_form_data(build_form_data(datas, filtros=filtros))
+    if tamanho_lote:
+        parametros = {"formulario": parametros, "tamanho_lote": tamanho_lote}
+        if dividir_por != "competencia":
+            parametros["dividir_por"] = dividir_por
+            parametros["coluna_rotulo"] = COLUNA_ROTULO_LOTE[dividir_por]
+    return cache_key(parametros)
+
+def result_cache_ttl(datas: list) -> float:
+    """
+    Competências antigas não mudam e ficam no cache sem prazo; relatórios que
+    incluem meses recentes, que o SISAB ainda pode revisar, expiram.
+    """
+    hoje = date.today()
+    limite = (hoje.year * 12 + hoje.month - 1) - config.RESULT_CACHE_REVISION_MONTHS
+    for competencia in datas:
+        try:
+            meses = int(competencia[:4]) * 12 + int(competencia[4:6]) - 1
+        except ValueError:
+            return config.RESULT_CACHE_RECENT_TTL
+        if meses >= limite:
+            return config.RESULT_CACHE_RECENT_TTL
+    return None
+
+client_quotas = ClientQuotas(
+    taxa=config.CLIENT_RATE_PER_MINUTE / 60,
+    capacidade=config.CLIENT_BURST,
+)
+
+spool = OutputSpool(
+    config.SPOOL_DIR,
+    max_bytes=config.SPOOL_MAX_BYTES,
+    ttl=config.SPOOL_TTL,
+    cleanup_interval=config.SPOOL_CLEANUP_INTERVAL,
+)
+
+profiles = ProfileStore(config.PROFILE_DIR, ttl=config.PROFILE_TTL)
+
+def worker_profile(job: dict) -> Optional[dict]:
+    """Argumentos do perfil gravado pelo worker que executa o crawl do job (None se o job não pediu perfil)."""
+    perfil = job["parametros"].get("perfil")
+    if not perfil:
+        return None
+    return {"pasta": profiles.prepare(job["id"]), "origem": "worker", "espera": "espera_rede", **perfil}
+
+def split_into_lotes(datas: list, filtros: dict, tamanho_lote: int, dividir_por: str = "competencia") -> list:
+    """
+    Divide a extração em lotes de 'tamanho_lote' competências ou estados
+    (ordenados, sem repetição). Retorna dicts {"datas", "filtros", "rotulo"}.
+    """
+    if dividir_por == "estado":
+        estados = sorted(set(filtros.get("estados") or UFS))
+        grupos = [estados[i:i + tamanho_lote] for i in range(0, len(estados), tamanho_lote)]
+        return [{"datas": datas, "filtros": {**filtros, "estados": grupo}, "rotulo": ",".join(grupo)} for grupo in grupos]
+
+    datas = sorted(set(datas))
+    grupos = [datas[i:i + tamanho_lote] for i in range(0, len(datas), tamanho_lote)]
+    return [{"datas": grupo, "filtros": filtros, "rotulo": ",".join(grupo)} for grupo in grupos]
+
+def run_extraction_job(job: dict, report_progress) -> str:
+    """
+    Executa um job de extração em um worker do pool, repassando os eventos
+    de progresso do spider, e retorna o caminho do CSV gerado.
+    """
+    datas_alvo = job["parametros"]["datas_alvo"]
+    filtros = job["parametros"].get("filtros") or {}
+    tamanho_lote = job["parametros"].get("tamanho_lote") or 0
+    dividir_por = job["parametros"].get("dividir_por") or "competencia"
+    chave = job.get("chave")
 
-# --- Funções para executar os Spiders em Processos Separados ---
+    # Um job idêntico pode ter terminado enquanto este esperava na fila.
+    if chave:
+        cached = result_cache.get(chave)
+        if cached is not None:
+            report_progress({"etapa": "cache"})
+            return cached
 
-def run_date_finder_process(queue: Queue):
-    """Executa o DateFinderSpider e coloca o resultado na fila."""
+    output_file_path = spool.allocate(job["id"])
     try:
-        crawled_items = []
-        def item_scraped(item, response, spider):
-            crawled_items.append(item)
-
-        process = CrawlerProcess(get_project_settings())
-        crawler = process.create_crawler(DateFinderSpider)
-        crawler.signals.connect(item_scraped, signal=scrapy.signals.item_scraped)
-        process.crawl(crawler)
-        process.start()
-
-        if crawled_items:
-            queue.put(crawled_items[0])
+        if harvest_store.covers(datas_alvo, filtros):
+            report_progress({"etapa": "store"})
+            resultado = build_from_store(datas_alvo, filtros, tamanho_lote, dividir_por, output_file_path)
+        elif tamanho_lote:
+            lotes = split_into_lotes(datas_alvo, filtros, tamanho_lote, dividir_por)
+            resultado = run_fanout_extraction(lotes, output_file_path, report_progress, COLUNA_ROTULO_LOTE[dividir_por],
+                                              perfil=worker_profile(job))
         else:
-            queue.put(None)
-    except Exception as e:
-        queue.put(e)
+            try:
+                resultado = crawl_pool.run(
+                    "sisab",
+                    {"datas_alvo": datas_alvo, "output_file": output_file_path, "url": config.SISAB_URL, "filtros": filtros},
+                    on_event=report_progress,
+                    perfil=worker_profile(job),
+                )
+            except CrawlWorkerError as e:
+                raise RuntimeError(f"Falha durante a extração: {e}")
+
+        if chave:
+            cached = result_cache.put(chave, resultado, ttl=result_cache_ttl(datas_alvo))
+            # As versões compactadas ficam prontas antes do primeiro download.
+            report_progress({"etapa": "compactando"})
+            delivery.prepare(cached)
+    except BaseException:
+        spool.release(job["id"])
+        raise
+    spool.finish(job["id"])
+    return resultado
+
+def run_fanout_extraction(lotes: list, output_file_path: str, report_progress,
+                          coluna_rotulo: Optional[str] = "Competencia", perfil: dict = None) -> str:
+    """
+    Extrai os lotes (ver 'split_into_lotes') de forma independente e junta os
+    CSVs em um só.
+
+    Lotes já presentes no cache de resultados (por exemplo, de extrações
+    anteriores de uma única competência) são reaproveitados; os demais são
+    baixados em um único crawl, vários ao mesmo tempo, cada um com a sua sessão.
+    Os lotes concluídos vão para o cache mesmo que outros falhem, de modo que
+    uma nova tentativa só busca o que faltou.
+
+    Os eventos de progresso trazem em 'lote' o índice do lote em 'lotes', e
+    cada lote pronto gera um evento 'lote_concluido' (o CSV parcial pode ser
+    baixado por /extracoes/{job_id}/parciais/{lote}). 'perfil' é repassado ao
+    worker do crawl (ver 'worker_profile').
+    """
+    arquivos = {}
+    pendentes = []
+    temporarios = []
+    for indice, lote in enumerate(lotes):
+        cached = result_cache.get(extraction_cache_key(lote["datas"], lote["filtros"]))
+        if cached is not None:
+            arquivos[indice] = cached
+        elif harvest_store.covers(lote["datas"], lote["filtros"]):
+            arquivo = f"{output_file_path}.lote{indice}"
+            temporarios.append(arquivo)
+            harvest_store.write_report(lote["datas"], lote["filtros"].get("estados"), arquivo)
+            arquivos[indice] = arquivo
+        else:
+            pendentes.append(indice)
+    report_progress({"etapa": "lotes", "total_lotes": len(lotes), "lotes_em_cache": len(arquivos)})
+    concluidos = set()
+
+    def report_lote_done(indice: int, evento: dict):
+        concluidos.add(indice)
+        report_progress({**evento, "lotes_concluidos": sorted(concluidos)})
+
+    for indice in sorted(arquivos):
+        report_lote_done(indice, {"etapa": "lote_concluido", "lote": indice, "datas": lotes[indice]["datas"]})
+
+    def report_crawl_progress(evento: dict):
+        # No crawl, 'lote' é a posição em 'pendentes'.
+        if evento.get("lote") is not None:
+            evento = {**evento, "lote": pendentes[evento["lote"]]}
+        if evento.get("etapa") == "lote_concluido":
+            report_lote_done(evento["lote"], evento)
+        else:
+            report_progress(evento)
+
+    try:
+        if pendentes:
+            lotes_crawl = [
+                {"datas": lotes[indice]["datas"], "filtros": lotes[indice]["filtros"], "output_file": f"{output_file_path}.lote{indice}"}
+                for indice in pendentes
+            ]
+            temporarios.extend(lote["output_file"] for lote in lotes_crawl)
+            try:
+                resultados = crawl_pool.run(
+                    "sisab_lotes",
+                    {
+                        "lotes": lotes_crawl,
+                        "url": config.SISAB_URL,
+                        "concorrencia": config.FANOUT_CONCURRENCY,
+                        "max_tentativas": config.FANOUT_MAX_RETRIES,
+                    },
+                    on_event=report_crawl_progress,
+                    perfil=perfil,
+                )
+            except CrawlWorkerError as e:
+                raise RuntimeError(f"Falha durante a extração: {e}")
+
+            falhas = []
+            for posicao, indice in enumerate(pendentes):
+                resultado = resultados.get(posicao)
+                if resultado == "ok":
+                    arquivo = lotes_crawl[posicao]["output_file"]
+                    lote = lotes[indice]
+                    result_cache.put(extraction_cache_key(lote["datas"], lote["filtros"]), arquivo, ttl=result_cache_ttl(lote["datas"]))
+                    arquivos[indice] = arquivo
+                else:
+                    falhas.append(f"{lotes[indice]['rotulo']}: {resultado}")
+            if falhas:
+                raise RuntimeError(f"Falha na extração de {len(falhas)} lote(s): {'; '.join(falhas)}")
 
-def run_sisab_process(queue: Queue, datas_alvo: list, output_file: str):
-    """Executa o SisabSpider e sinaliza o sucesso/erro na fila."""
+        merge_reports(
+            [arquivos[indice] for indice in range(len(lotes))],
+            [lote["rotulo"] for lote in lotes],
+            output_file_path,
+            coluna_rotulo=coluna_rotulo,
+            competencias=[data for lote in lotes for data in lote["datas"]],
+        )
+        return output_file_path
+    finally:
+        for temporario in temporarios:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+def build_from_store(datas: list, filtros: dict, tamanho_lote: int, dividir_por: str, output_file_path: str) -> str:
+    """
+    Monta o relatório de uma extração só com as competências já colhidas pelo
+    harvester (ver 'HarvestStore.covers'), sem consultar o SISAB.
+    """
+    if not tamanho_lote:
+        harvest_store.write_report(datas, filtros.get("estados"), output_file_path)
+        return output_file_path
+
+    lotes = split_into_lotes(datas, filtros, tamanho_lote, dividir_por)
+    arquivos = [f"{output_file_path}.lote{indice}" for indice in range(len(lotes))]
+    try:
+        for lote, arquivo in zip(lotes, arquivos):
+            harvest_store.write_report(lote["datas"], lote["filtros"].get("estados"), arquivo)
+        merge_reports(arquivos, [lote["rotulo"] for lote in lotes], output_file_path,
+                      coluna_rotulo=COLUNA_ROTULO_LOTE[dividir_por], competencias=datas)
+    finally:
+        for arquivo in arquivos:
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
+    return output_file_path
+
+def harvest_competencias(competencias: list, pasta: str) -> dict:
+    """
+    Extrai o relatório nacional de cada competência (um lote por competência,
+    no mesmo crawl) para a coleta periódica. Retorna {competencia: caminho ou erro}.
+
+    O crawl ocupa uma vaga de execução dos jobs (ver 'JobManager.slot'): a
+    coleta nunca roda além de SISAB_MAX_JOBS nem tira do pool um processo de
+    crawl de que as extrações dos usuários precisam.
+    """
+    lotes = [
+        {"datas": [competencia], "filtros": {}, "output_file": os.path.join(pasta, f"{competencia}.csv")}
+        for competencia in competencias
+    ]
+    try:
+        with job_manager.slot():
+            resultados = crawl_pool.run(
+                "sisab_lotes",
+                {
+                    "lotes": lotes,
+                    "url": config.SISAB_URL,
+                    "concorrencia": config.FANOUT_CONCURRENCY,
+                    "max_tentativas": config.FANOUT_MAX_RETRIES,
+                },
+            )
+    except CrawlWorkerError as e:
+        raise RuntimeError(f"Falha durante a coleta: {e}")
+    return {
+        competencia: lote["output_file"] if resultados.get(posicao) == "ok" else resultados.get(posicao)
+        for posicao, (competencia, lote) in enumerate(zip(competencias, lotes))
+    }
+
+def fetch_available_dates() -> list:
+    """Executa o DateFinderSpider no pool e retorna as competências encontradas."""
+    result = crawl_pool.run("date_finder", {"url": config.SISAB_URL})
+    datas = (result or {}).get("datas_disponiveis", [])
+    if not datas:
+        raise LookupError("Nenhuma data foi encontrada pelo spider.")
+    return datas
+
+date_cache = DateCatalogCache(
+    fetch_available_dates,
+    ttl=config.DATE_CACHE_TTL,
+    stale_ttl=config.DATE_CACHE_STALE_TTL,
+)
+
+# --- Extrações do TabNet (DATASUS) ---
+
+def fetch_datasus_options() -> dict:
+    """Executa o DatasusSpider no pool e retorna as opções do formulário do TabNet."""
+    opcoes = crawl_pool.run("datasus_opcoes", {"url": config.DATASUS_URL})
+    if not opcoes or not opcoes.get("periodos"):
+        raise LookupError("Nenhum período foi encontrado no formulário do TabNet.")
+    return opcoes
+
+datasus_options_cache = DateCatalogCache(
+    fetch_datasus_options,
+    ttl=config.DATE_CACHE_TTL,
+    stale_ttl=config.DATE_CACHE_STALE_TTL,
+)
+
+def resolve_datasus_options(opcoes: dict, pedido: PedidoDatasus) -> dict:
+    """
+    Converte os rótulos do pedido nos valores do formulário e preenche as opções
+    omitidas (a marcada na página; para o período, o mais recente). Levanta
+    ValueError com as opções que não existem no formulário.
+    """
+    def resolve(campo: str, escolhidos: list) -> list:
+        disponiveis = opcoes[campo]
+        if not escolhidos:
+            marcadas = [o["valor"] for o in disponiveis if o["selecionada"]]
+            return marcadas or [o["valor"] for o in disponiveis[:1]]
+        por_nome = {o["rotulo"]: o["valor"] for o in disponiveis}
+        por_nome.update({o["valor"]: o["valor"] for o in disponiveis})
+        invalidos = [e for e in escolhidos if e not in por_nome]
+        if invalidos:
+            raise ValueError(f"Opções inválidas em '{campo}': {', '.join(invalidos)}.")
+        return [por_nome[e] for e in escolhidos]
+
+    return {
+        "linha": resolve("linhas", [pedido.linha] if pedido.linha else [])[0],
+        "coluna": resolve("colunas", [pedido.coluna] if pedido.coluna else [])[0],
+        "incrementos": resolve("incrementos", pedido.incrementos),
+        "periodos": resolve("periodos", pedido.periodos or [opcoes["periodos"][0]["valor"]]),
+        "formato": pedido.formato,
+        "formato_saida": pedido.formato_saida,
+    }
+
+def run_datasus_job(job: dict, report_progress) -> str:
+    """
+    Executa uma extração do TabNet em um worker do pool (um POST por período,
+    em paralelo) e retorna o caminho do CSV com as linhas extraídas.
+    """
+    chave = job.get("chave")
+    if chave:
+        cached = result_cache.get(chave)
+        if cached is not None:
+            report_progress({"etapa": "cache"})
+            return cached
+
+    parametros = {nome: valor for nome, valor in job["parametros"].items() if nome != "perfil"}
+    output_file_path = spool.allocate(job["id"])
     try:
-        process = CrawlerProcess(get_project_settings())
-        process.crawl(SisabSpider, datas_alvo=datas_alvo, output_file=output_file)
-        process.start()
-        queue.put("SUCCESS")
-    except Exception as e:
-        queue.put(e)
+        try:
+            resultado = crawl_pool.run(
+                "datasus",
+                {**parametros, "output_file": output_file_path, "url": config.DATASUS_URL,
+                 "concorrencia": config.DATASUS_CONCURRENCY},
+                on_event=report_progress,
+                perfil=worker_profile(job),
+            )
+        except CrawlWorkerError as e:
+            raise RuntimeError(f"Falha durante a extração: {e}")
+        report_progress({"etapa": "concluido", "linhas": resultado["linhas"]})
+        if chave:
+            # O TabNet reprocessa os períodos recentes: o resultado sempre expira.
+            cached = result_cache.put(chave, resultado["output_file"], ttl=config.RESULT_CACHE_RECENT_TTL)
+            report_progress({"etapa": "compactando"})
+            delivery.prepare(cached, compactar=result_file_info(job)[1] in delivery.COMPACTAVEIS)
+    except BaseException:
+        spool.release(job["id"])
+        raise
+    spool.finish(job["id"])
+    return resultado["output_file"]
+
+# Campos do progresso que valem para o job inteiro e continuam no progresso
+# depois que a etapa muda (ver 'run_fanout_extraction').
+CAMPOS_PROGRESSO_DO_JOB = ("total_lotes", "lotes_em_cache", "lotes_concluidos")
+
+# Função de execução de cada tipo de job.
+JOB_RUNNERS = {
+    "sisab": run_extraction_job,
+    "datasus": run_datasus_job,
+}
+
+def run_job(job: dict, report_progress) -> str:
+    perfil = job["parametros"].get("perfil")
+    if not perfil:
+        return JOB_RUNNERS[job["tipo"]](job, report_progress)
+    # A thread do job é medida do início ao fim, inclusive a espera pelo worker.
+    with Profiler(profiles.prepare(job["id"]), "api", espera="espera_worker", **perfil):
+        return JOB_RUNNERS[job["tipo"]](job, report_progress)
+
+job_manager: JobManager = None
+result_cache: ResultCache = None
+host_limiter: HostLimiter = None
+http_cache: HttpCacheDB = None
+harvest_store: HarvestStore = None
+harvester: Harvester = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia os pools de crawl e de jobs junto com a API e os encerra ao desligar."""
+    global job_manager, result_cache, host_limiter, http_cache, harvest_store, harvester
+    crawl_pool.start()
+    spool.start()
+    result_cache = ResultCache(config.RESULT_CACHE_DIR, config.RESULT_CACHE_MAX_BYTES)
+    harvest_store = HarvestStore(config.STORE_DIR)
+    harvester = Harvester(
+        harvest_store,
+        fetch_dates=lambda: date_cache.get().datas,
+        extract=harvest_competencias,
+        interval=config.HARVEST_INTERVAL,
+        max_per_run=config.HARVEST_MAX_PER_RUN,
+        refresh_after=lambda competencia: result_cache_ttl([competencia]),
+    )
+    # Só para consulta: os limites são ajustados pelos processos de crawl.
+    host_limiter = HostLimiter(config.THROTTLE_DB)
+    http_cache = HttpCacheDB(config.HTTP_CACHE_DB)
+    metrics.POOL_WORKERS.labels(estado="ociosos").set_function(lambda: crawl_pool.status()["ociosos"])
+    metrics.POOL_WORKERS.labels(estado="ocupados").set_function(lambda: crawl_pool.status()["ocupados"])
+    metrics.SPOOL_BYTES.set_function(lambda: spool.usage()["bytes"])
+    metrics.RESULT_CACHE_BYTES.set_function(lambda: result_cache.usage()["bytes"])
+    store = JobStore(config.JOBS_DB)
+    job_manager = JobManager(store, run_job, max_workers=config.MAX_CONCURRENT_JOBS, max_pending=config.MAX_QUEUED_JOBS,
+                             campos_do_job=CAMPOS_PROGRESSO_DO_JOB)
+    metrics.JOBS.labels(status=PENDENTE).set_function(lambda: store.count(PENDENTE))
+    metrics.JOBS.labels(status=EXECUTANDO).set_function(lambda: store.count(EXECUTANDO))
+    job_manager.start()
+    if config.HARVEST_INTERVAL > 0:
+        harvester.start()
+    try:
+        yield
+    finally:
+        harvester.stop()
+        job_manager.stop()
+        crawl_pool.stop()
+        spool.stop()
+        store.close()
+        result_cache.close()
+        harvest_store.close()
+        host_limiter.close()
+        http_cache.close()
 
 # --- Lógica da API ---
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Intervalo entre as mensagens de keep-alive de /eventos, para que proxies não
+# derrubem a conexão enquanto o SISAB demora a responder.
+EVENTS_HEARTBEAT = 15.0
+
 app = FastAPI(
     title="API de Extração SISAB",
-    version="5.4.4-redirect-home"
+    version="6.0.0-jobs",
+    lifespan=lifespan
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+def job_result_path(job: dict) -> str:
+    """
+    Caminho do arquivo de resultado de um job concluído, ou None se ele não
+    estiver mais disponível. A cópia do cache tem preferência: é ao lado dela
+    que ficam as versões compactadas e convertidas, e ela continua disponível
+    depois que o arquivo do spool é entregue (ou expira).
+    """
+    if job.get("chave"):
+        cached = result_cache.get(job["chave"])
+        if cached is not None:
+            return cached
+    if job["resultado"] and os.path.exists(job["resultado"]):
+        return job["resultado"]
+    return None
+
+def result_file_info(job: dict) -> tuple[str, str]:
+    """Nome e content-type do arquivo de resultado entregue ao cliente."""
+    if job["tipo"] == "datasus":
+        media_type, extensao = FORMATOS_EXPORTACAO[job["parametros"].get("formato_saida") or "csv"]
+        return f"Relatorio-DATASUS{extensao}", media_type
+    return "Relatorio-SISAB.csv", "text/csv"
+
+def release_delivered(job: dict, path: str):
+    """
+    Apaga do spool o resultado de um job depois de entregue ao cliente (quando
+    'path' é a cópia do cache, ela continua disponível para novos downloads).
+    """
+    if job["resultado"] and spool.owns(job["resultado"]):
+        spool.release(job["id"])
+
+def job_to_response(job: dict) -> dict:
+    """Monta a representação pública de um job."""
+    return {
+        "job_id": job["id"],
+        "tipo": job["tipo"],
+        "status": job["status"],
+        "datas_alvo": job["parametros"].get("datas_alvo", []),
+        "filtros": job["parametros"].get("filtros") or {},
+        "progresso": job["progresso"],
+        "erro": job["erro"],
+        "criado_em": job["criado_em"],
+        "atualizado_em": job["atualizado_em"],
+        "status_url": f"/extracoes/{job['id']}",
+        "resultado_url": f"/extracoes/{job['id']}/resultado",
+        "stream_url": f"/extracoes/{job['id']}/stream",
+        "eventos_url": f"/extracoes/{job['id']}/eventos",
+        "perfil_url": f"/extracoes/{job['id']}/perfil" if job["parametros"].get("perfil") else None,
+    }
+
+def job_event_data(job: dict, evento: str, dados: dict) -> dict:
+    """Acrescenta a um evento de job as URLs que o cliente pode usar a partir dele."""
+    if evento == "progresso" and dados.get("etapa") == "lote_concluido" and job["parametros"].get("tamanho_lote"):
+        return {**dados, "parcial_url": f"/extracoes/{job['id']}/parciais/{dados['lote']}"}
+    if evento == "status" and dados.get("status") == CONCLUIDO:
+        return {**dados, "resultado_url": f"/extracoes/{job['id']}/resultado"}
+    return dados
+
+def client_id(request: Request) -> str:
+    """
+    Identifica o cliente pelo IP. Atrás de SISAB_TRUSTED_PROXY_HOPS proxies, é
+    o endereço que o proxy mais externo acrescentou ao X-Forwarded-For: os que
+    vêm antes dele foram enviados pelo cliente e não servem para as cotas.
+    """
+    if config.TRUSTED_PROXY_HOPS > 0:
+        enderecos = [
+            endereco.strip()
+            for cabecalho in request.headers.getlist("x-forwarded-for")
+            for endereco in cabecalho.split(",")
+            if endereco.strip()
+        ]
+        if enderecos:
+            return enderecos[max(0, len(enderecos) - config.TRUSTED_PROXY_HOPS)]
+    return request.client.host if request.client else "desconhecido"
+
+PERFIL_DESCRICAO = (
+    "Grava um perfil de execução da extração (ver /extracoes/{job_id}/perfil): 'cpu' (cProfile), "
+    "'memoria' (tracemalloc) ou 'cpu,memoria'. O job é executado à parte: não usa o cache de "
+    "resultados nem se junta a pedidos idênticos. Requer SISAB_PROFILING=1."
+)
+
+def parse_profile_option(perfil: Optional[str]) -> Optional[dict]:
+    """Converte o parâmetro 'perfil' nos argumentos do Profiler (None sem perfil)."""
+    if not perfil:
+        return None
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Os perfis de execução estão desativados (SISAB_PROFILING).")
+    tipos = {tipo.strip() for tipo in perfil.split(",") if tipo.strip()}
+    if not tipos or tipos - set(TIPOS_PERFIL):
+        raise HTTPException(status_code=400, detail=f"Perfil inválido. Use {', '.join(TIPOS_PERFIL)} ou os dois, separados por vírgula.")
+    return {"cpu": "cpu" in tipos, "memoria": "memoria" in tipos}
+
+def submit_job(request: Request, tipo: str, parametros: dict, chave: str) -> dict:
+    """
+    Enfileira um job depois do controle de admissão. Um pedido idêntico a um
+    job pendente ou em execução recebe esse mesmo job, sem custo; os demais
+    consomem uma ficha da cota do cliente e só entram se a fila tiver vaga.
+    Fila cheia ou cota esgotada respondem 429 com Retry-After.
+    """
+    if not spool.has_room():
+        raise HTTPException(status_code=507, detail="Não há espaço disponível para novas extrações no momento.")
+    cliente = client_id(request)
+    try:
+        return job_manager.submit(tipo, parametros, chave=chave, admit=lambda: client_quotas.acquire(cliente))
+    except (QueueFullError, QuotaExceededError) as e:
+        metrics.ADMISSION_REJECTIONS.labels(motivo="fila" if isinstance(e, QueueFullError) else "cota").inc()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def catalog_response(request: Request, cache: DateCatalogCache, entry, conteudo: dict) -> Response:
+    """
+    Responde com uma entrada de um DateCatalogCache, com ETag/Last-Modified e
+    304 para as requisições condicionais que já têm a versão atual.
+    """
+    headers = {
+        "ETag": f'"{entry.etag}"',
+        "Last-Modified": formatdate(entry.modificado_em, usegmt=True),
+        "Cache-Control": f"public, max-age={cache.max_age(entry)}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        nao_modificado = headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    elif if_modified_since is not None:
+        try:
+            nao_modificado = int(entry.modificado_em) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            nao_modificado = False
+    else:
+        nao_modificado = False
+    if nao_modificado:
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(conteudo, headers=headers)
 
 @app.get("/", summary="Redireciona para a Documentação", include_in_schema=False)
 async def read_root():
@@ -66,53 +634,495 @@ async def read_root():
     return RedirectResponse(url="/docs", status_code=302)
 
 @app.get("/date-finder", summary="Retorna a lista de datas disponíveis no SISAB")
-def get_available_dates():
-    q = Queue()
-    p = Process(target=run_date_finder_process, args=(q,))
-    p.start()
-    result = q.get()
-    p.join()
-
-    if isinstance(result, Exception):
-        raise HTTPException(status_code=500, detail=f"Falha ao buscar as datas: {result}")
-    if not result:
+def get_available_dates(request: Request):
+    try:
+        entry = date_cache.get()
+    except CrawlWorkerError as e:
+        raise HTTPException(status_code=500, detail=f"Falha ao buscar as datas: {e}")
+    except LookupError:
         raise HTTPException(status_code=404, detail="Nenhuma data foi encontrada pelo spider.")
+    return catalog_response(request, date_cache, entry, {"datas_disponiveis": entry.datas})
+
+@app.delete("/date-finder/cache", status_code=204, summary="Invalida o cache de datas disponíveis")
+def invalidate_available_dates():
+    date_cache.invalidate()
+    return Response(status_code=204)
+
+@app.get("/saude", summary="Verifica o estado do pool de crawlers")
+def get_health():
+    return {
+        "crawlers": crawl_pool.status(),
+        "spool": spool.usage(),
+        "cache": result_cache.usage(),
+        "coleta": harvester.status(),
+        "fila": {
+            "pendentes": job_manager.store.count(PENDENTE),
+            "executando": job_manager.store.count(EXECUTANDO),
+            "limite": job_manager.max_pending,
+            "espera_estimada": job_manager.estimate_wait(),
+        },
+        "cotas": client_quotas.status(),
+        "limites_upstream": host_limiter.snapshot(),
+        "cache_upstream": {"ativo": config.HTTP_CACHE_ENABLED, **http_cache.snapshot()},
+    }
+
+@app.get("/metrics", summary="Métricas no formato do Prometheus", include_in_schema=False)
+def get_metrics():
+    conteudo, content_type = metrics.render()
+    return Response(content=conteudo, media_type=content_type)
+
+@app.post("/iniciar-extracao", status_code=202, summary="Enfileira uma extração e retorna o ID do job")
+def start_extraction(request: Request, response: Response, pedido: Union[PedidoExtracao, ListaCompetencias] = Body(
+        description="Um objeto com as datas e os filtros do relatório, ou apenas a lista de datas "
+                    "(relatório nacional completo)."),
+    tamanho_lote: int = Query(
+        default=None, ge=0,
+        description="Divide a extração em lotes com este número de competências (0 = uma única submissão)."),
+    perfil: str = Query(default=None, description=PERFIL_DESCRICAO),
+    ):
+    opcoes_perfil = parse_profile_option(perfil)
+    if isinstance(pedido, list):
+        if not pedido:
+            raise HTTPException(status_code=400, detail="A lista 'datas_escolhidas' não pode estar vazia.")
+        pedido = PedidoExtracao(datas=pedido)
+    filtros = pedido.filtros.as_form_filters()
 
-    datas = result.get("datas_disponiveis", [])
-    return {"datas_disponiveis": datas}
+    if pedido.tamanho_lote is not None:
+        tamanho_lote = pedido.tamanho_lote
+    if tamanho_lote is None:
+        tamanho_lote = config.FANOUT_CHUNK_SIZE
+    parametros = {
+        "datas_alvo": pedido.datas,
+        "filtros": filtros,
+        "tamanho_lote": tamanho_lote,
+        "dividir_por": pedido.dividir_por,
+    }
+    chave = extraction_cache_key(pedido.datas, filtros, tamanho_lote, pedido.dividir_por)
 
-@app.post("/iniciar-extracao", summary="Gera e retorna um relatório diretamente")
-def start_extraction(datas_escolhidas: list[str]):
-    if not datas_escolhidas:
-        raise HTTPException(status_code=400, detail="A lista 'datas_escolhidas' não pode estar vazia.")
+    if opcoes_perfil:
+        # Sem chave: o job roda inteiro (mesmo que o resultado esteja no cache) e sozinho.
+        job = submit_job(request, "sisab", {**parametros, "perfil": opcoes_perfil}, None)
+        return job_to_response(job)
 
-    # Define o caminho para a pasta de Downloads do usuário que está executando o servidor
-    downloads_path = Path.home() / "Downloads"
-    downloads_path.mkdir(parents=True, exist_ok=True)
-    
-    output_filename = "Relatorio-SISAB.csv"
-    output_file_path = str(downloads_path / output_filename)
+    # Relatórios já extraídos com os mesmos parâmetros são servidos do cache.
+    cached = result_cache.get(chave)
+    if cached is not None:
+        job = job_manager.store.create("sisab", parametros, chave=chave, status=CONCLUIDO, resultado=cached)
+        response.status_code = 200
+        return job_to_response(job)
 
+    # Competências já colhidas são montadas na hora a partir do store local.
+    if harvest_store.covers(pedido.datas, filtros):
+        descritor, temporario = tempfile.mkstemp(suffix=".csv", dir=harvest_store.tmp_dir)
+        os.close(descritor)
+        try:
+            build_from_store(pedido.datas, filtros, tamanho_lote, pedido.dividir_por, temporario)
+            resultado = result_cache.put(chave, temporario, ttl=result_cache_ttl(pedido.datas))
+        finally:
+            os.remove(temporario)
+        job = job_manager.store.create("sisab", parametros, chave=chave, status=CONCLUIDO, resultado=resultado)
+        response.status_code = 200
+        return job_to_response(job)
+
+    job = submit_job(request, "sisab", parametros, chave)
+    return job_to_response(job)
+
+@app.get("/datasus/opcoes", summary="Retorna as opções do formulário do TabNet (DATASUS)")
+def get_datasus_options(request: Request):
+    """
+    Linhas, colunas, conteúdos (incrementos) e períodos disponíveis no TabNet,
+    cada um com o valor enviado ao formulário, o rótulo e se vem marcado.
+    """
     try:
-        q = Queue()
-        p = Process(target=run_sisab_process, args=(q, datas_escolhidas, output_file_path))
-        p.start()
-        result = q.get()
-        p.join()
-
-        if isinstance(result, Exception):
-            raise HTTPException(status_code=500, detail=f"Falha durante a extração: {result}")
-        if result != "SUCCESS":
-            raise HTTPException(status_code=500, detail=f"O processo de extração falhou com um resultado inesperado: {result}")
-
-        return FileResponse(
-            path=output_file_path,
-            media_type='text/csv',
-            filename=output_filename
-        )
-    except Exception as e:
-        # Garante que qualquer outra exceção seja tratada como um erro do servidor
-        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {e}")
+        entry = datasus_options_cache.get()
+    except CrawlWorkerError as e:
+        raise HTTPException(status_code=500, detail=f"Falha ao buscar as opções: {e}")
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return catalog_response(request, datasus_options_cache, entry, entry.datas)
+
+@app.post("/datasus/extracao", status_code=202, summary="Enfileira uma extração do TabNet (DATASUS)")
+def start_datasus_extraction(request: Request, response: Response, pedido: PedidoDatasus = Body(default_factory=PedidoDatasus),
+                             perfil: str = Query(default=None, description=PERFIL_DESCRICAO)):
+    """
+    Extrai uma tabela do TabNet: cada período é consultado em paralelo e as
+    células viram linhas 'periodo;linha;coluna;valor' no CSV do resultado.
+    """
+    opcoes_perfil = parse_profile_option(perfil)
+    try:
+        opcoes = datasus_options_cache.get().datas
+    except CrawlWorkerError as e:
+        raise HTTPException(status_code=500, detail=f"Falha ao buscar as opções: {e}")
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        parametros = resolve_datasus_options(opcoes, pedido)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    chave = cache_key({"datasus": {**parametros, "url": config.DATASUS_URL}})
+
+    if opcoes_perfil:
+        job = submit_job(request, "datasus", {**parametros, "perfil": opcoes_perfil}, None)
+        return job_to_response(job)
+
+    cached = result_cache.get(chave)
+    if cached is not None:
+        job = job_manager.store.create("datasus", parametros, chave=chave, status=CONCLUIDO, resultado=cached)
+        response.status_code = 200
+        return job_to_response(job)
+
+    job = submit_job(request, "datasus", parametros, chave)
+    return job_to_response(job)
+
+@app.get("/dados", summary="Consulta os dados já colhidos, com filtros, agrupamento e paginação")
+def query_data(
+    request: Request,
+    competencia: list[str] = Query(default=None, description="Competências (AAAAMM); pode ser repetido."),
+    competencia_inicio: str = Query(default=None, pattern=r"^\d{6}$", description="Primeira competência do intervalo."),
+    competencia_fim: str = Query(default=None, pattern=r"^\d{6}$", description="Última competência do intervalo."),
+    uf: list[str] = Query(default=None, description="Siglas das UFs; pode ser repetido."),
+    tipo_atendimento: list[str] = Query(default=None, description="Tipos de atendimento, como aparecem nos registros."),
+    agrupar_por: list[str] = Query(default=None, description=f"Soma as quantidades por estas colunas ({', '.join(DIMENSOES_CONSULTA)}). "
+                                                             "Informe 'nenhum' para obter só o total geral."),
+    limite: int = Query(default=1000, ge=1, le=10000, description="Registros por página."),
+    deslocamento: int = Query(default=0, ge=0, description="Registros a pular (paginação)."),
+):
+    """
+    Consulta as linhas tipadas dos relatórios colhidos pela coleta periódica
+    (uma por competência, UF e tipo de atendimento), direto do store local.
+    Só as competências já colhidas aparecem; ver '/saude' (coleta).
+    """
+    if uf:
+        uf = [sigla.strip().upper() for sigla in uf]
+        invalidas = [sigla for sigla in uf if sigla not in UFS]
+        if invalidas:
+            raise HTTPException(status_code=400, detail=f"UFs inválidas: {', '.join(invalidas)}")
+    if agrupar_por is not None:
+        agrupar_por = [] if agrupar_por == ["nenhum"] else agrupar_por
+        invalidas = [coluna for coluna in agrupar_por if coluna not in DIMENSOES_CONSULTA]
+        if invalidas:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Colunas de agrupamento inválidas: {', '.join(invalidas)}. Use: {', '.join(DIMENSOES_CONSULTA)}.",
+            )
+
+    registros, total = harvest_store.query(
+        competencias=competencia,
+        inicio=competencia_inicio,
+        fim=competencia_fim,
+        ufs=uf,
+        tipos_atendimento=tipo_atendimento,
+        agrupar_por=agrupar_por,
+        limite=limite,
+        deslocamento=deslocamento,
+    )
+    proximo = deslocamento + len(registros)
+    return {
+        "registros": registros,
+        "total": total,
+        "limite": limite,
+        "deslocamento": deslocamento,
+        "proxima_pagina": str(request.url.include_query_params(deslocamento=proximo)) if proximo < total else None,
+    }
+
+def revision_to_response(revisao: dict) -> dict:
+    return {**revisao, "linhas_url": f"/mudancas/{revisao['id']}"}
+
+@app.get("/mudancas", summary="Lista as competências colhidas ou revisadas desde uma revisão")
+def list_revisions(
+    request: Request,
+    desde: int = Query(default=0, ge=0, description="Última revisão já processada pelo cliente (o 'cursor' da resposta anterior)."),
+    competencia: list[str] = Query(default=None, description="Competências (AAAAMM); pode ser repetido."),
+    situacao: Optional[str] = Query(default=None, description=f"'{NOVA}' (primeira coleta) ou '{REVISADA}' (o SISAB mudou os dados)."),
+    limite: int = Query(default=100, ge=1, le=1000, description="Revisões por página."),
+):
+    """
+    Cada vez que a coleta periódica encontra uma competência nova ou com
+    linhas diferentes das guardadas, registra uma revisão com os hashes do
+    conteúdo e as contagens de linhas inseridas, alteradas e removidas.
+    Competências colhidas de novo sem mudanças não geram revisão. Para
+    acompanhar as mudanças, guarde o 'cursor' e passe-o em 'desde' na próxima
+    consulta; as linhas de cada revisão estão em 'linhas_url'.
+    """
+    if situacao is not None and situacao not in (NOVA, REVISADA):
+        raise HTTPException(status_code=400, detail=f"Situação inválida. Use '{NOVA}' ou '{REVISADA}'.")
+    revisoes = harvest_store.revisions(desde=desde, competencias=competencia, situacao=situacao, limite=limite)
+    cursor = revisoes[-1]["id"] if revisoes else desde
+    return {
+        "revisoes": [revision_to_response(revisao) for revisao in revisoes],
+        "cursor": cursor,
+        "proxima_pagina": str(request.url.include_query_params(desde=cursor)) if len(revisoes) == limite else None,
+    }
+
+@app.get("/mudancas/{revisao_id}", summary="Linhas inseridas, alteradas e removidas em uma revisão")
+def get_revision_changes(
+    request: Request,
+    revisao_id: int,
+    limite: int = Query(default=1000, ge=1, le=10000, description="Linhas por página."),
+    deslocamento: int = Query(default=0, ge=0, description="Linhas a pular (paginação)."),
+):
+    """
+    O delta de uma revisão: uma linha por UF e tipo de atendimento que mudou,
+    com a 'operacao' ('inserido', 'alterado' ou 'removido'), a quantidade
+    anterior, a nova e o hash da linha nova.
+    """
+    revisao = harvest_store.revision(revisao_id)
+    if revisao is None:
+        raise HTTPException(status_code=404, detail="Revisão não encontrada.")
+    linhas, total = harvest_store.changes(revisao_id, limite=limite, deslocamento=deslocamento)
+    proximo = deslocamento + len(linhas)
+    return {
+        "revisao": revisao,
+        "linhas": linhas,
+        "total": total,
+        "limite": limite,
+        "deslocamento": deslocamento,
+        "proxima_pagina": str(request.url.include_query_params(deslocamento=proximo)) if proximo < total else None,
+    }
+
+@app.get("/extracoes/{job_id}", summary="Consulta o status e o progresso de uma extração")
+def get_extraction_status(job_id: str):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job_to_response(job)
+
+@app.get("/extracoes/{job_id}/resultado", summary="Baixa o resultado de uma extração concluída")
+def download_extraction_result(request: Request, job_id: str, formato: str = Query(
+        default="bruto",
+        description="'bruto' para o CSV original do SISAB, ou 'csv', 'ndjson', 'parquet' e 'arrow' "
+                    "para a tabela tipada (uma linha por UF e tipo de atendimento, sem o preâmbulo).")):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    if job["status"] != CONCLUIDO:
+        raise HTTPException(status_code=409, detail=f"A extração ainda não foi concluída (status: {job['status']}).")
+    resultado = job_result_path(job)
+    if resultado is None:
+        raise HTTPException(status_code=410, detail="O arquivo de resultado não está mais disponível.")
+
+    if job["tipo"] == "datasus" and formato != "bruto":
+        raise HTTPException(status_code=400, detail="Extrações do TabNet são entregues no 'formato_saida' do pedido; use 'bruto'.")
+    if formato == "bruto":
+        arquivo = resultado
+        nome, media_type = result_file_info(job)
+    elif formato in FORMATOS:
+        media_type, extensao = FORMATOS[formato]
+        nome = f"Relatorio-SISAB{extensao}"
+        # A conversão é feita uma única vez e guardada ao lado do arquivo original.
+        arquivo = f"{resultado}.tabela{extensao}"
+        if not os.path.exists(arquivo):
+            temporario = f"{arquivo}.{job_id}.tmp"
+            try:
+                convert_report(resultado, formato, temporario)
+                os.replace(temporario, arquivo)
+            except FormatUnavailableError as e:
+                raise HTTPException(status_code=501, detail=str(e))
+            except FileNotFoundError:
+                # O arquivo do spool foi entregue por inteiro (e apagado) por outro download.
+                raise HTTPException(status_code=410, detail="O arquivo de resultado não está mais disponível.")
+            finally:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+    else:
+        raise HTTPException(status_code=400, detail=f"Formato inválido. Use 'bruto' ou um de: {', '.join(FORMATOS)}.")
+
+    # O spool só é liberado depois que o arquivo inteiro é enviado: um download
+    # parcial (Range) ou revalidado (304) pode ser retomado depois.
+    return delivery.file_response(request, arquivo, media_type, nome,
+                                  on_complete=BackgroundTask(release_delivered, job, resultado))
+
+@app.get("/extracoes/{job_id}/stream", summary="Transmite o CSV enquanto a extração ainda está em andamento")
+def stream_extraction_result(job_id: str):
+    """
+    Começa a enviar o CSV assim que os primeiros bytes chegam do SISAB, lendo o
+    arquivo parcial gravado pelo spider, e termina quando o job é concluído.
+    Em extrações em lotes o arquivo só existe depois da junção, então o envio
+    começa ao final. Se o job falhar, a transmissão é interrompida.
+    """
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    if job["status"] == ERRO:
+        raise HTTPException(status_code=409, detail=f"A extração falhou: {job['erro']}")
+    if job["status"] == CONCLUIDO and job_result_path(job) is None:
+        raise HTTPException(status_code=410, detail="O arquivo de resultado não está mais disponível.")
+    parcial = spool.path_for(job_id) + ".part"
+
+    async def stream():
+        arquivo = None
+        inicio = time.perf_counter()
+        try:
+            while True:
+                job = job_manager.store.get(job_id)
+                if arquivo is None:
+                    resultado = job_result_path(job) if job["status"] == CONCLUIDO else None
+                    if resultado is not None:
+                        arquivo = open(resultado, "rb")
+                    elif job["status"] != CONCLUIDO and os.path.exists(parcial):
+                        # Mesmo depois de renomeado para o caminho final, o arquivo
+                        # aberto continua sendo lido até o fim.
+                        arquivo = open(parcial, "rb")
+                if arquivo is not None:
+                    while chunk := arquivo.read(STREAM_CHUNK_SIZE):
+                        yield chunk
+                if job["status"] == CONCLUIDO:
+                    resultado = job_result_path(job)
+                    if resultado is not None:
+                        release_delivered(job, resultado)
+                    return
+                if job["status"] == ERRO:
+                    return
+                await asyncio.sleep(0.5)
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+            metrics.CRAWL_STAGE_DURATION.labels(etapa="streaming_resposta").observe(time.perf_counter() - inicio)
+
+    nome, media_type = result_file_info(job)
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome}"'},
+    )
+
+@app.get("/extracoes/{job_id}/eventos", summary="Acompanha o progresso de uma extração em tempo real")
+async def stream_extraction_events(
+        job_id: str,
+        formato: str = Query(default="sse", description="'sse' (text/event-stream) ou 'ndjson' (um evento JSON por linha)."),
+        last_event_id: Optional[str] = Header(default=None, description="Último evento recebido, ao reconectar.")):
+    """
+    Envia os eventos do job à medida que acontecem, até ele terminar: primeiro
+    o 'estado' atual (o mesmo JSON de /extracoes/{job_id}), depois cada
+    'progresso' do crawl e as mudanças de 'status'. Ao reconectar com o
+    cabeçalho Last-Event-ID, o cliente recebe só os eventos que perdeu.
+    """
+    if formato not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'sse' ou 'ndjson'.")
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    try:
+        desde = max(0, int(last_event_id)) if last_event_id else 0
+    except ValueError:
+        desde = 0
+
+    def format_event(seq: Optional[int], evento: str, dados: dict) -> str:
+        if formato == "ndjson":
+            return json.dumps({"id": seq, "evento": evento, "dados": dados}, ensure_ascii=False) + "\n"
+        mensagem = f"id: {seq}\n" if seq is not None else ""
+        return mensagem + f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+    def is_final(evento: str, dados: dict) -> bool:
+        return evento == "status" and dados.get("status") in (CONCLUIDO, ERRO)
+
+    async def stream():
+        assinante = None
+        job = job_manager.store.get(job_id)
+        if job["status"] in (CONCLUIDO, ERRO):
+            anteriores = job_manager.events.since(job_id, desde)
+        else:
+            assinante, anteriores = job_manager.events.subscribe(job_id, desde)
+            # Lido de novo depois de assinar, para não perder um fim que aconteça no meio.
+            job = job_manager.store.get(job_id)
+        try:
+            if not desde:
+                yield format_event(None, "estado", job_to_response(job))
+            for seq, evento, dados in anteriores:
+                yield format_event(seq, evento, job_event_data(job, evento, dados))
+                if is_final(evento, dados):
+                    return
+            if job["status"] in (CONCLUIDO, ERRO):
+                final = {"status": job["status"]} if job["status"] == CONCLUIDO else {"status": ERRO, "erro": job["erro"]}
+                yield format_event(None, "status", job_event_data(job, "status", final))
+                return
+            _, fila = assinante
+            while True:
+                try:
+                    seq, evento, dados = await asyncio.wait_for(fila.get(), EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n" if formato == "sse" else "\n"
+                    continue
+                yield format_event(seq, evento, job_event_data(job, evento, dados))
+                if is_final(evento, dados):
+                    return
+        finally:
+            if assinante is not None:
+                job_manager.events.unsubscribe(job_id, assinante)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream" if formato == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/extracoes/{job_id}/parciais/{lote}", summary="Baixa o CSV de um lote já concluído de uma extração em lotes")
+def download_partial_result(request: Request, job_id: str, lote: int):
+    """
+    Entrega o CSV de um lote assim que ele termina (evento 'lote_concluido'),
+    sem esperar pelos demais lotes nem pela junção.
+    """
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    parametros = job["parametros"]
+    if job["tipo"] != "sisab" or not parametros.get("tamanho_lote"):
+        raise HTTPException(status_code=404, detail="Esta extração não é dividida em lotes.")
+    lotes = split_into_lotes(parametros["datas_alvo"], parametros.get("filtros") or {},
+                             parametros["tamanho_lote"], parametros.get("dividir_por") or "competencia")
+    if not 0 <= lote < len(lotes):
+        raise HTTPException(status_code=404, detail=f"Lote inexistente; a extração tem {len(lotes)} lote(s).")
+
+    arquivo = result_cache.get(extraction_cache_key(lotes[lote]["datas"], lotes[lote]["filtros"]))
+    if arquivo is None and job["status"] == EXECUTANDO:
+        if lote not in job["progresso"].get("lotes_concluidos", []):
+            raise HTTPException(status_code=409, detail="O lote ainda não foi concluído.")
+        # Enquanto o job roda, os lotes prontos ficam ao lado do arquivo final.
+        arquivo = f"{spool.path_for(job_id)}.lote{lote}"
+    if arquivo is None or not os.path.exists(arquivo):
+        raise HTTPException(status_code=410, detail="O arquivo do lote não está mais disponível.")
+    if job["status"] == EXECUTANDO and spool.owns(arquivo):
+        # O arquivo do lote é apagado na junção; não vale a pena compactá-lo.
+        return FileResponse(path=arquivo, media_type="text/csv", filename=f"Relatorio-SISAB-lote{lote}.csv")
+    return delivery.file_response(request, arquivo, "text/csv", f"Relatorio-SISAB-lote{lote}.csv")
+
+@app.get("/extracoes/{job_id}/perfil", summary="Resumo do perfil de execução de uma extração pedida com 'perfil'")
+def get_extraction_profile(job_id: str):
+    """
+    Um resumo por origem ('api': a thread que coordena o job; 'worker': o
+    crawl, na thread do reactor): duração, tempo próprio das funções somado
+    por categoria ('espera_rede' é o tempo esperando o portal), as funções que
+    mais gastaram tempo, o pico de memória e as linhas que mais alocaram. Os
+    arquivos completos ('.prof' do cProfile, relatórios em texto) são baixados
+    pelas URLs em 'arquivos'. O resumo do worker fica pronto quando o crawl
+    termina, e o da API quando o job termina.
+    """
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    if not job["parametros"].get("perfil"):
+        raise HTTPException(status_code=404, detail="Esta extração não foi pedida com 'perfil'.")
+    resumos = profiles.summaries(job_id)
+    if not resumos:
+        if job["status"] in (PENDENTE, EXECUTANDO):
+            raise HTTPException(status_code=409, detail=f"O perfil ainda não foi gravado (status: {job['status']}).")
+        raise HTTPException(status_code=410, detail="O perfil não está mais disponível.")
+    for resumo in resumos:
+        resumo["arquivos"] = [{"nome": nome, "url": f"/extracoes/{job_id}/perfil/{nome}"} for nome in resumo["arquivos"]]
+    return {"job_id": job_id, "status": job["status"], "opcoes": job["parametros"]["perfil"], "perfis": resumos}
+
+# Content-type de cada arquivo de perfil, pela extensão.
+TIPOS_ARQUIVO_PERFIL = {".prof": "application/octet-stream", ".txt": "text/plain; charset=utf-8", ".json": "application/json"}
+
+@app.get("/extracoes/{job_id}/perfil/{arquivo}", summary="Baixa um arquivo do perfil de execução de uma extração")
+def download_extraction_profile(job_id: str, arquivo: str):
+    if job_manager.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    caminho = profiles.file_path(job_id, arquivo)
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Arquivo de perfil não encontrado.")
+    return FileResponse(path=caminho, media_type=TIPOS_ARQUIVO_PERFIL.get(os.path.splitext(arquivo)[1], "application/octet-stream"),
+                        filename=f"perfil-{job_id[:8]}-{arquivo}")
 
 if __name__ == "__main__":
     import multiprocessing
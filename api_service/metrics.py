@@ -0,0 +1,123 @@
+"""
+Métricas da API no formato do Prometheus (expostas em /metrics).
+
+As medições feitas dentro dos processos de crawl (tempo de cada etapa, bytes
+baixados e as estatísticas do Scrapy) chegam pela fila do pool como mensagens
+("metricas", dict) e são registradas aqui, no processo da API.
+"""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Buckets para etapas que vão de milissegundos (gravação) a vários minutos (relatório nacional).
+_BUCKETS_SEGUNDOS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+_BUCKETS_BYTES = tuple(1024 * 4 ** i for i in range(12))  # 1 KiB .. 4 GiB
+
+HTTP_REQUEST_DURATION = Histogram(
+    "sisab_http_request_duration_seconds",
+    "Tempo de resposta das rotas da API, até o último byte enviado.",
+    ["method", "route", "status"],
+    buckets=_BUCKETS_SEGUNDOS,
+)
+
+CRAWL_STAGE_DURATION = Histogram(
+    "sisab_crawl_stage_duration_seconds",
+    "Tempo de cada etapa de uma extração: inicio_worker, get_inicial, espera_post, "
+    "download, gravacao_arquivo, streaming_resposta.",
+    ["etapa"],
+    buckets=_BUCKETS_SEGUNDOS,
+)
+
+DOWNLOAD_BYTES = Histogram(
+    "sisab_download_bytes",
+    "Tamanho dos relatórios baixados do SISAB.",
+    buckets=_BUCKETS_BYTES,
+)
+
+DOWNLOAD_THROUGHPUT = Histogram(
+    "sisab_download_throughput_bytes_per_second",
+    "Velocidade de download dos relatórios.",
+    buckets=tuple(1024 * 4 ** i for i in range(10)),
+)
+
+CRAWLER_STATS = Counter(
+    "sisab_crawler_stats",
+    "Estatísticas do Scrapy somadas entre todos os crawls (downloader/request_count, retry/count, ...).",
+    ["estatistica"],
+)
+
+CRAWLS = Counter("sisab_crawls", "Crawls executados pelo pool, por tarefa e resultado.", ["tarefa", "resultado"])
+
+POOL_WORKERS = Gauge("sisab_crawl_pool_workers", "Processos do pool de crawl.", ["estado"])
+SPOOL_BYTES = Gauge("sisab_spool_bytes", "Espaço ocupado pelo spool dos jobs.")
+JOBS = Gauge("sisab_jobs", "Jobs de extração na fila ou em execução.", ["status"])
+ADMISSION_REJECTIONS = Counter(
+    "sisab_admission_rejections",
+    "Extrações recusadas com 429, por motivo: fila cheia ('fila') ou cota do cliente esgotada ('cota').",
+    ["motivo"],
+)
+RESULT_CACHE_BYTES = Gauge("sisab_result_cache_bytes", "Espaço ocupado pelo cache de resultados.")
+
+# Estatísticas do Scrapy que não são contadores (valores absolutos ou datas).
+_ESTATISTICAS_IGNORADAS = (
+    "memusage/", "start_time", "finish_time", "elapsed_time_seconds", "finish_reason", "request_depth_max",
+)
+
+
+def observe_worker_metrics(dados: dict):
+    """Registra as métricas enviadas por um processo worker."""
+    for etapa, segundos in dados.get("etapas", []):
+        CRAWL_STAGE_DURATION.labels(etapa=etapa).observe(segundos)
+    for tamanho, segundos in dados.get("downloads", []):
+        DOWNLOAD_BYTES.observe(tamanho)
+        if segundos > 0:
+            DOWNLOAD_THROUGHPUT.observe(tamanho / segundos)
+    for nome, valor in dados.get("estatisticas", {}).items():
+        if nome.startswith(_ESTATISTICAS_IGNORADAS) or isinstance(valor, bool):
+            continue
+        if isinstance(valor, (int, float)) and valor >= 0:
+            CRAWLER_STATS.labels(estatistica=nome).inc(valor)
+
+
+def render() -> tuple[bytes, str]:
+    """O conteúdo de /metrics e o seu content-type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede o tempo de cada requisição até o último byte da
+    resposta e adiciona o cabeçalho 'Server-Timing' com o tempo até o início
+    da resposta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        status = {"codigo": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["codigo"] = message["status"]
+                duracao_ms = (time.perf_counter() - inicio) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"app;dur={duracao_ms:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # O caminho da rota (ex.: /extracoes/{job_id}) é definido pelo roteador.
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "desconhecida"),
+                status=str(status["codigo"]),
+            ).observe(time.perf_counter() - inicio)
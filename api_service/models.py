@@ -0,0 +1,128 @@
+import re
+from typing import Annotated, Literal, Optional
+
+from pydantic import AfterValidator, BaseModel, Field, StringConstraints, field_validator
+
+from Scrapy_project.Scrapy_project.sisab_form import EQUIPES, UFS
+
+# Códigos numéricos do formulário (categorias, locais e tipos de atendimento).
+_CODIGO = re.compile(r"^\d+$")
+# Eixos da tabela, no formato usado pelo SISAB (ex.: 'ATD.CO_UF_IBGE').
+_EIXO = re.compile(r"^[A-Za-z0-9_.]+$")
+
+
+def _sem_repeticao(valores: list) -> list:
+    return list(dict.fromkeys(valores))
+
+
+def _recusa_repetidas(competencias: list) -> list:
+    repetidas = sorted({c for c in competencias if competencias.count(c) > 1})
+    if repetidas:
+        raise ValueError(f"Competências repetidas: {', '.join(repetidas)}")
+    return competencias
+
+
+# Competência no formato AAAAMM (ex.: '202405').
+Competencia = Annotated[str, StringConstraints(pattern=r"^\d{4}(0[1-9]|1[0-2])$")]
+ListaCompetencias = Annotated[list[Competencia], AfterValidator(_recusa_repetidas)]
+
+
+class FiltrosRelatorio(BaseModel):
+    """
+    Filtros do relatório do SISAB. Os campos omitidos usam o valor padrão do
+    formulário (todas as opções), que corresponde ao relatório nacional completo.
+    """
+    estados: Optional[list[str]] = Field(default=None, min_length=1, description="Siglas das UFs (ex.: ['PE', 'PB']).")
+    equipes: Optional[list[str]] = Field(default=None, min_length=1, description="Tipos de equipe (ex.: ['eq-esf']).")
+    categorias_profissionais: Optional[list[str]] = Field(default=None, min_length=1, description="Códigos das categorias profissionais.")
+    locais_atendimento: Optional[list[str]] = Field(default=None, min_length=1, description="Códigos dos locais de atendimento.")
+    tipos_atendimento: Optional[list[str]] = Field(default=None, min_length=1, description="Códigos dos tipos de atendimento.")
+    linha: Optional[str] = Field(default=None, description="Eixo das linhas da tabela (campo 'selectLinha').")
+    coluna: Optional[str] = Field(default=None, description="Eixo das colunas da tabela (campo 'selectcoluna').")
+
+    @field_validator("estados")
+    @classmethod
+    def validate_estados(cls, valores):
+        if valores is None:
+            return valores
+        valores = _sem_repeticao(v.strip().upper() for v in valores)
+        invalidos = [v for v in valores if v not in UFS]
+        if invalidos:
+            raise ValueError(f"UFs inválidas: {', '.join(invalidos)}")
+        return valores
+
+    @field_validator("equipes")
+    @classmethod
+    def validate_equipes(cls, valores):
+        if valores is None:
+            return valores
+        valores = _sem_repeticao(v.strip() for v in valores)
+        invalidos = [v for v in valores if v not in EQUIPES]
+        if invalidos:
+            raise ValueError(f"Equipes inválidas: {', '.join(invalidos)}. Use: {', '.join(EQUIPES)}")
+        return valores
+
+    @field_validator("categorias_profissionais", "locais_atendimento", "tipos_atendimento")
+    @classmethod
+    def validate_codigos(cls, valores):
+        if valores is None:
+            return valores
+        valores = _sem_repeticao(v.strip() for v in valores)
+        invalidos = [v for v in valores if not _CODIGO.match(v)]
+        if invalidos:
+            raise ValueError(f"Códigos inválidos: {', '.join(invalidos)}")
+        return valores
+
+    @field_validator("linha", "coluna")
+    @classmethod
+    def validate_eixo(cls, valor):
+        if valor is not None and not _EIXO.match(valor):
+            raise ValueError(f"Eixo inválido: {valor}")
+        return valor
+
+    def as_form_filters(self) -> dict:
+        """Os filtros informados, no formato aceito por 'build_form_data'."""
+        return self.model_dump(exclude_none=True)
+
+
+class PedidoExtracao(BaseModel):
+    """Corpo de '/iniciar-extracao'."""
+    datas: ListaCompetencias = Field(min_length=1, description="Competências (AAAAMM) a extrair, sem repetição.")
+    filtros: FiltrosRelatorio = Field(default_factory=FiltrosRelatorio)
+    tamanho_lote: Optional[int] = Field(
+        default=None, ge=0,
+        description="Divide a extração em lotes com este número de competências ou estados (0 = uma única submissão).",
+    )
+    dividir_por: Literal["competencia", "estado"] = Field(
+        default="competencia",
+        description="Dimensão usada para dividir a extração em lotes.",
+    )
+
+
+class PedidoDatasus(BaseModel):
+    """
+    Corpo de '/datasus/extracao'. As opções são os valores ou os rótulos
+    listados em '/datasus/opcoes'; as omitidas usam a opção marcada no formulário.
+    """
+    periodos: Optional[list[str]] = Field(
+        default=None, min_length=1,
+        description="Períodos (ex.: ['Ago/2025'] ou ['nibr2508.dbf']), consultados em paralelo. Padrão: o mais recente.",
+    )
+    linha: Optional[str] = Field(default=None, description="Linha da tabela (ex.: 'Unidade da Federação').")
+    coluna: Optional[str] = Field(default=None, description="Coluna da tabela (ex.: 'Caráter atendimento').")
+    incrementos: Optional[list[str]] = Field(default=None, min_length=1, description="Conteúdos da tabela (ex.: ['Internações']).")
+    formato: Literal["prn", "table"] = Field(
+        default="prn",
+        description="Formato pedido ao TabNet: 'prn' (colunas separadas por ';', mais leve) ou 'table'.",
+    )
+    formato_saida: Literal["csv", "parquet", "sqlite"] = Field(
+        default="csv",
+        description="Formato do arquivo de resultado: 'csv' (';', UTF-8), 'parquet' ou 'sqlite' (tabela 'linhas').",
+    )
+
+    @field_validator("periodos", "incrementos")
+    @classmethod
+    def validate_lista(cls, valores):
+        if valores is None:
+            return valores
+        return _sem_repeticao(v.strip() for v in valores)
@@ -0,0 +1,280 @@
+"""
+Perfis de execução das extrações (cProfile e tracemalloc), sob demanda.
+
+Um job pedido com 'perfil' é medido em dois lugares:
+
+- no processo da API, na thread que coordena o job (cache, store, junção dos
+  lotes, compactação e a espera pelo worker);
+- no worker do pool que executa o crawl, na thread do reactor, onde rodam o
+  download, o parsing das páginas e a gravação do arquivo.
+
+Cada captura grava na pasta do job ('<pasta>/<job_id>/'), com o nome da origem
+('api' ou 'worker'):
+
+- '<origem>.prof': as estatísticas do cProfile (abrir com 'python -m pstats'
+  ou com o snakeviz);
+- '<origem>.txt': as funções ordenadas por tempo acumulado e por tempo próprio;
+- '<origem>-memoria.txt': as linhas que mais alocaram memória (tracemalloc);
+- '<origem>.json': o resumo servido pela API, com o tempo próprio das funções
+  somado por categoria (espera, parsing, gravação...).
+
+Sem o pedido, nada aqui é executado: o custo de um job comum é um 'if'.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import shutil
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Tipos de perfil aceitos no parâmetro 'perfil' das extrações.
+TIPOS_PERFIL = ("cpu", "memoria")
+
+# Funções e linhas listadas nos relatórios e no resumo.
+LINHAS_RELATORIO = 40
+LINHAS_RESUMO = 15
+
+# Quadros guardados por alocação no tracemalloc.
+QUADROS_MEMORIA = 10
+
+# Categorias do tempo próprio das funções: vale a primeira cujo padrão casar
+# com 'arquivo:função' (funções nativas aparecem como '~:<método>'). É uma
+# classificação aproximada, para saber onde olhar primeiro no perfil completo.
+CATEGORIAS = {
+    # A thread parada: no worker, o reactor no epoll esperando o portal; na API,
+    # a thread do job esperando o worker (fila do multiprocessing e locks). O
+    # nome da categoria vem do Profiler ('espera_rede' ou 'espera_worker').
+    "espera": re.compile(r"^~:<(built-in method (select\.)?select|method '(poll|select|control)' of 'select\."
+                         r"|method 'acquire' of '_thread\.|built-in method time\.sleep)"),
+    "parsing": re.compile(r"[/\\](parsel|lxml|cssselect|w3lib)[/\\]|[/\\]scrapy[/\\](selector|http[/\\]response)[/\\]"
+                          r"|[/\\]spiders[/\\]|sisab_report\.py|sisab_form\.py|^~:<(built-in method _csv|method 'decode')"),
+    "compactacao": re.compile(r"[/\\](gzip|zstd|_compression)\.py|zstd|zlib|<method '(compress|flush)' of '(zlib|_zstd)"),
+    "gravacao": re.compile(r"exporters\.py|pipelines\.py|[/\\]sqlite3[/\\]|pyarrow|delivery\.py"
+                           r"|^~:<(method '(write|flush|writelines)' of '_io\.|built-in method (posix|nt)\.(replace|rename|fsync|write)"
+                           r"|method '(execute|executemany|commit)' of 'sqlite3\.)"),
+    # O restante do Scrapy, do Twisted e do loop do asyncio: montagem do
+    # crawler, sinais, agendamento dos callbacks.
+    "crawler": re.compile(r"[/\\](scrapy|twisted|pydispatch|asyncio)[/\\]|[/\\]copy\.py"),
+}
+
+
+def _categorize(arquivo: str, funcao: str) -> str:
+    chave = f"{arquivo}:{funcao}"
+    for categoria, padrao in CATEGORIAS.items():
+        if padrao.search(chave):
+            return categoria
+    return "outros"
+
+
+def _function_name(arquivo: str, linha: int, funcao: str) -> str:
+    return funcao if arquivo == "~" else f"{arquivo}:{linha}({funcao})"
+
+
+class Profiler:
+    """
+    Captura, entre 'start' e 'stop', um perfil de CPU da thread atual
+    (cProfile, com o tempo de relógio: o tempo parado esperando também
+    aparece, na categoria 'espera') e, se 'memoria', as alocações do processo
+    inteiro (tracemalloc).
+
+    'start' e 'stop' precisam ser chamados na mesma thread. Se o tracemalloc
+    já estiver ativo (outro perfil em andamento no processo), a captura usa o
+    rastreamento existente sem encerrá-lo. 'stop' grava os arquivos em 'pasta'
+    e retorna o resumo; falhas ao gravar ficam em 'erros' e nunca são
+    propagadas, para não derrubar o job medido.
+    """
+
+    def __init__(self, pasta: str, origem: str, cpu: bool = True, memoria: bool = False, espera: str = "espera"):
+        self.pasta = pasta
+        self.origem = origem
+        self.cpu = cpu
+        self.memoria = memoria
+        self.espera = espera
+        self.erros = []
+        self._perfil: Optional[cProfile.Profile] = None
+        self._dono_tracemalloc = False
+        self._inicio = 0.0
+
+    def start(self) -> "Profiler":
+        os.makedirs(self.pasta, exist_ok=True)
+        if self.memoria:
+            self._dono_tracemalloc = not tracemalloc.is_tracing()
+            if self._dono_tracemalloc:
+                tracemalloc.start(QUADROS_MEMORIA)
+        if self.cpu:
+            self._perfil = cProfile.Profile()
+            try:
+                self._perfil.enable()
+            except ValueError as e:
+                # A partir do Python 3.12 só um cProfile pode estar ativo por processo.
+                self._perfil = None
+                self.erros.append(f"cpu: {e}")
+        self._inicio = time.perf_counter()
+        return self
+
+    def stop(self) -> dict:
+        duracao = time.perf_counter() - self._inicio
+        if self._perfil is not None:
+            self._perfil.disable()
+        resumo = {"origem": self.origem, "pid": os.getpid(), "duracao_s": round(duracao, 4), "erros": self.erros}
+        memoria = None
+        if self.memoria:
+            # A foto é tirada antes de gravar os relatórios, e o rastreamento é
+            # encerrado logo em seguida: com ele ativo tudo fica várias vezes
+            # mais lento, inclusive a geração dos relatórios.
+            memoria = tracemalloc.get_traced_memory(), tracemalloc.take_snapshot()
+            if self._dono_tracemalloc:
+                tracemalloc.stop()
+                self._dono_tracemalloc = False
+        try:
+            if self._perfil is not None:
+                resumo["cpu"] = self._write_cpu(duracao)
+            if memoria is not None:
+                resumo["memoria"] = self._write_memory(*memoria)
+        except Exception as e:
+            logger.exception("Falha ao gravar o perfil '%s' em %s.", self.origem, self.pasta)
+            self.erros.append(f"{type(e).__name__}: {e}")
+        try:
+            with open(self._path(".json"), "w", encoding="utf-8") as f:
+                json.dump(resumo, f, ensure_ascii=False, indent=1)
+        except OSError as e:
+            logger.warning("Não foi possível gravar o resumo do perfil '%s': %s", self.origem, e)
+        return resumo
+
+    def __enter__(self) -> "Profiler":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def _path(self, sufixo: str) -> str:
+        return os.path.join(self.pasta, f"{self.origem}{sufixo}")
+
+    def _write_cpu(self, duracao: float) -> dict:
+        self._perfil.dump_stats(self._path(".prof"))
+        texto = io.StringIO()
+        stats = pstats.Stats(self._perfil, stream=texto)
+        texto.write(f"Perfil de CPU ({self.origem}, pid {os.getpid()}): {duracao:.3f}s\n\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(LINHAS_RELATORIO)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(LINHAS_RELATORIO)
+        with open(self._path(".txt"), "w", encoding="utf-8") as f:
+            f.write(texto.getvalue())
+
+        categorias = dict.fromkeys([*CATEGORIAS, "outros"], 0.0)
+        funcoes = []
+        for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, _) in stats.stats.items():
+            categorias[_categorize(arquivo, funcao)] += proprio
+            funcoes.append((_function_name(arquivo, linha, funcao), chamadas, proprio, acumulado))
+
+        def top(indice: int) -> list:
+            return [
+                {"funcao": nome, "chamadas": chamadas, "proprio_s": round(proprio, 4), "acumulado_s": round(acumulado, 4)}
+                for nome, chamadas, proprio, acumulado in sorted(funcoes, key=lambda f: f[indice], reverse=True)[:LINHAS_RESUMO]
+            ]
+
+        return {
+            "tempo_medido_s": round(sum(categorias.values()), 4),
+            "categorias_s": {
+                (self.espera if nome == "espera" else nome): round(segundos, 4) for nome, segundos in categorias.items()
+            },
+            "por_tempo_proprio": top(2),
+            "por_tempo_acumulado": top(3),
+        }
+
+    def _write_memory(self, memoria_rastreada: tuple, snapshot: tracemalloc.Snapshot) -> dict:
+        atual, pico = memoria_rastreada
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        estatisticas = snapshot.statistics("lineno")
+        with open(self._path("-memoria.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Memória ({self.origem}, pid {os.getpid()}): atual {atual:,} bytes, pico {pico:,} bytes\n\n")
+            for stat in estatisticas[:LINHAS_RELATORIO]:
+                f.write(f"{stat}\n")
+            f.write("\nOrigem das maiores alocações:\n")
+            for stat in snapshot.statistics("traceback")[:5]:
+                f.write(f"\n{stat.size:,} bytes em {stat.count} blocos\n")
+                f.write("\n".join(stat.traceback.format()) + "\n")
+        return {
+            "atual_bytes": atual,
+            "pico_bytes": pico,
+            "alocacoes": [
+                {"local": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size, "blocos": stat.count}
+                for stat in estatisticas[:LINHAS_RESUMO]
+            ],
+        }
+
+
+class ProfileStore:
+    """
+    Pastas com os perfis de cada job ('<pasta>/<job_id>/'). Ficam separadas do
+    spool, que apaga os arquivos do job quando ele falha ou é entregue: o
+    perfil de uma extração com erro é justamente o que mais interessa. As
+    pastas sem alterações há mais de 'ttl' segundos são apagadas.
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def path_for(self, job_id: str) -> str:
+        return str(self.directory / job_id)
+
+    def prepare(self, job_id: str) -> str:
+        """Cria a pasta de perfis de um job (apagando as expiradas) e retorna o caminho."""
+        self.prune()
+        pasta = self.directory / job_id
+        pasta.mkdir(parents=True, exist_ok=True)
+        return str(pasta)
+
+    def summaries(self, job_id: str) -> list:
+        """Os resumos ('<origem>.json') gravados para o job, cada um com a lista dos seus arquivos."""
+        pasta = self.directory / job_id
+        if not pasta.is_dir():
+            return []
+        arquivos = sorted(p.name for p in pasta.iterdir() if p.is_file())
+        resumos = []
+        for nome in arquivos:
+            if not nome.endswith(".json"):
+                continue
+            try:
+                with open(pasta / nome, encoding="utf-8") as f:
+                    resumo = json.load(f)
+            except (OSError, ValueError):
+                continue
+            origem = nome[:-len(".json")]
+            resumo["arquivos"] = [a for a in arquivos if a != nome and a.split(".")[0].split("-")[0] == origem]
+            resumos.append(resumo)
+        return resumos
+
+    def file_path(self, job_id: str, nome: str) -> Optional[str]:
+        """Caminho de um arquivo de perfil do job, ou None se ele não existir."""
+        pasta = self.directory / job_id
+        if not pasta.is_dir() or nome not in os.listdir(pasta):
+            return None
+        return str(pasta / nome)
+
+    def prune(self) -> int:
+        """Apaga as pastas sem alterações há mais de 'ttl' segundos; retorna quantas."""
+        if not self.directory.is_dir():
+            return 0
+        limite = time.time() - self.ttl
+        removidas = 0
+        for pasta in self.directory.iterdir():
+            try:
+                if pasta.is_dir() and pasta.stat().st_mtime < limite:
+                    shutil.rmtree(pasta, ignore_errors=True)
+                    removidas += 1
+            except OSError:
+                continue
+        return removidas
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entradas (
+    chave TEXT PRIMARY KEY,
+    caminho TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL,
+    expira_em REAL
+);
+CREATE INDEX IF NOT EXISTS idx_entradas_acesso ON entradas (acessado_em);
+"""
+
+
+def cache_key(parametros: dict) -> str:
+    """Hash SHA-256 dos parâmetros (já normalizados) de uma extração."""
+    canonico = json.dumps(parametros, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Armazena os CSVs já extraídos em disco, endereçados pelo hash dos parâmetros
+    do relatório.
+
+    O índice (tamanho e último acesso de cada arquivo) fica em um SQLite dentro da
+    própria pasta do cache. Quando o total passa de 'max_bytes', as entradas
+    menos usadas recentemente são removidas (LRU).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / "index.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def _path_for(self, chave: str) -> Path:
+        return self.directory / chave[:2] / f"{chave}.csv"
+
+    def get(self, chave: str) -> Optional[str]:
+        """Retorna o caminho do CSV em cache (ou None) e marca o acesso."""
+        agora = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM entradas WHERE chave = ?", (chave,)).fetchone()
+            if row is None:
+                return None
+            expirada = row["expira_em"] is not None and row["expira_em"] <= agora
+            if expirada or not os.path.exists(row["caminho"]):
+                self._remove(row)
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entradas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self._conn.commit()
+        return row["caminho"]
+
+    def put(self, chave: str, source_path: str, ttl: Optional[float] = None) -> str:
+        """
+        Guarda uma cópia do arquivo no cache e retorna o caminho dela.
+        - ttl: validade da entrada em segundos; None para nunca expirar.
+        """
+        destino = self._path_for(chave)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporario = destino.with_suffix(".tmp")
+        try:
+            # Um hard link evita duplicar o arquivo no disco quando possível.
+            if temporario.exists():
+                temporario.unlink()
+            os.link(source_path, temporario)
+        except OSError:
+            shutil.copyfile(source_path, temporario)
+        os.replace(temporario, destino)
+
+        agora = time.time()
+        tamanho = destino.stat().st_size
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entradas (chave, caminho, tamanho, criado_em, acessado_em, expira_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, str(destino), tamanho, agora, agora, agora + ttl if ttl is not None else None),
+            )
+            self._evict()
+            self._conn.commit()
+        return str(destino)
+
+    def usage(self) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) AS entradas, COALESCE(SUM(tamanho), 0) AS bytes FROM entradas").fetchone()
+        return {"entradas": row["entradas"], "bytes": row["bytes"], "limite_bytes": self.max_bytes}
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM entradas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in self._conn.execute("SELECT * FROM entradas ORDER BY acessado_em").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove(row)
+            total -= row["tamanho"]
+
+    def _remove(self, row: sqlite3.Row):
+        self._conn.execute("DELETE FROM entradas WHERE chave = ?", (row["chave"],))
+        # Remove também os arquivos derivados (ex.: conversões para Parquet).
+        caminho = Path(row["caminho"])
+        for arquivo in [caminho, *caminho.parent.glob(f"{caminho.name}.*")]:
+            try:
+                os.remove(arquivo)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,264 @@
+import csv
+import io
+import json
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+# O SISAB entrega os relatórios em CSV separado por ';' e codificado em Latin-1.
+# Antes da tabela há um preâmbulo (título, filtros aplicados) e, depois dela,
+# um rodapé com notas e a fonte.
+ENCODING = "latin-1"
+DELIMITER = ";"
+
+
+@dataclass
+class ReportLayout:
+    """As partes de um relatório do SISAB, como listas de linhas (sem o '\\n')."""
+    preambulo: list = field(default_factory=list)
+    cabecalho: str = ""
+    linhas: list = field(default_factory=list)
+    rodape: list = field(default_factory=list)
+
+
+def _count_fields(linha: str) -> int:
+    if not linha.strip():
+        return 0
+    campos = next(csv.reader(io.StringIO(linha), delimiter=DELIMITER))
+    # Linhas do preâmbulo como 'Competência: 202405;;;' têm o mesmo número de
+    # campos da tabela, mas só o primeiro preenchido.
+    if sum(1 for campo in campos if campo.strip()) < 2:
+        return 1
+    return len(campos)
+
+
+def split_report(texto: str) -> ReportLayout:
+    """
+    Separa o relatório em preâmbulo, cabeçalho, linhas de dados e rodapé.
+
+    A tabela é identificada como o maior bloco de linhas consecutivas com o
+    mesmo número (>= 2) de campos; a primeira linha do bloco é o cabeçalho.
+    """
+    linhas = texto.splitlines()
+    campos = [_count_fields(linha) for linha in linhas]
+
+    melhor_inicio, melhor_tamanho = None, 0
+    i = 0
+    while i < len(linhas):
+        j = i
+        while j + 1 < len(linhas) and campos[j + 1] == campos[i]:
+            j += 1
+        tamanho = j - i + 1
+        if campos[i] >= 2 and tamanho > melhor_tamanho:
+            melhor_inicio, melhor_tamanho = i, tamanho
+        i = j + 1
+
+    if melhor_inicio is None:
+        return ReportLayout(preambulo=linhas)
+
+    fim = melhor_inicio + melhor_tamanho
+    return ReportLayout(
+        preambulo=linhas[:melhor_inicio],
+        cabecalho=linhas[melhor_inicio],
+        linhas=linhas[melhor_inicio + 1:fim],
+        rodape=linhas[fim:],
+    )
+
+
+def decode_report(conteudo: bytes) -> str:
+    """
+    Decodifica o CSV do SISAB. O portal usa Latin-1, mas arquivos já
+    convertidos (ou combinados) podem estar em UTF-8, com ou sem BOM.
+    """
+    try:
+        return conteudo.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return conteudo.decode(ENCODING)
+
+
+def read_report(path: str) -> ReportLayout:
+    with open(path, "rb") as f:
+        return split_report(decode_report(f.read()))
+
+
+# Linha do preâmbulo com as competências do relatório (ex.: 'Competência: 202405;').
+_LINHA_COMPETENCIA = re.compile(r"^(\s*Compet[êe]ncia[^:;]*:)[^;]*", re.IGNORECASE)
+
+
+def rewrite_preamble(preambulo: list, competencias: list) -> list:
+    """Preâmbulo com a linha 'Competência: ...' trocada pelas competências informadas."""
+    lista = ", ".join(sorted(set(competencias)))
+    return [_LINHA_COMPETENCIA.sub(lambda m: f"{m.group(1)} {lista}", linha) for linha in preambulo]
+
+
+def merge_reports(paths: list, rotulos: list, output_file: str, coluna_rotulo: Optional[str] = "Competencia",
+                  competencias: list = None):
+    """
+    Junta vários relatórios com a mesma tabela em um único CSV.
+
+    O preâmbulo e o rodapé vêm do primeiro relatório e o cabeçalho aparece uma
+    única vez; se 'competencias' for informada, a linha 'Competência: ...' do
+    preâmbulo passa a listar todas elas, e não só as do primeiro lote. Como
+    cada relatório cobre um lote diferente de competências, uma coluna
+    'coluna_rotulo' é adicionada no início de cada linha com o rótulo (ex.: a
+    competência) do lote de origem. Com 'coluna_rotulo' None, as linhas são
+    copiadas sem o rótulo (lotes de estados: cada linha já traz a sua UF).
+    """
+    layouts = [read_report(path) for path in paths]
+    cabecalhos = {layout.cabecalho for layout in layouts if layout.cabecalho}
+    if len(cabecalhos) > 1:
+        raise ValueError("Os relatórios dos lotes têm cabeçalhos diferentes e não podem ser combinados.")
+
+    primeiro = layouts[0]
+    preambulo = rewrite_preamble(primeiro.preambulo, competencias) if competencias else primeiro.preambulo
+    with open(output_file, "w", encoding=ENCODING, errors="replace", newline="") as f:
+        for linha in preambulo:
+            f.write(linha + "\n")
+        prefixo = f"{coluna_rotulo}{DELIMITER}" if coluna_rotulo is not None else ""
+        if primeiro.cabecalho:
+            f.write(f"{prefixo}{primeiro.cabecalho}\n")
+        for rotulo, layout in zip(rotulos, layouts):
+            prefixo = f"{rotulo}{DELIMITER}" if coluna_rotulo is not None else ""
+            for linha in layout.linhas:
+                f.write(f"{prefixo}{linha}\n")
+        for linha in primeiro.rodape:
+            f.write(linha + "\n")
+
+
+# --- Tabela Tipada ---
+# O relatório é uma tabela "larga": as primeiras colunas identificam a linha
+# (UF, município, competência...) e as demais trazem as contagens de cada valor
+# do eixo de colunas (ex.: cada tipo de atendimento). A versão tipada é "longa":
+# uma linha por combinação, com a contagem como inteiro.
+
+# Colunas que sempre identificam a linha, mesmo quando têm valores numéricos.
+DIMENSOES_CONHECIDAS = {"competencia", "uf", "ibge", "cnes", "ine", "municipio", "regiao", "codigo"}
+
+COLUNAS_IGNORADAS = {"total"}
+
+
+def slugify(texto: str) -> str:
+    """'Tipo de Atendimento' -> 'tipo_de_atendimento'."""
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "_", texto.lower()).strip("_")
+
+
+def parse_count(valor: str) -> Optional[int]:
+    """Converte uma contagem do SISAB ('1.234', ' 56 ', '') em inteiro."""
+    valor = valor.strip().replace(".", "").replace(" ", "")
+    if not valor or valor == "-":
+        return None
+    return int(valor)
+
+
+def _is_count(valor: str) -> bool:
+    try:
+        parse_count(valor)
+        return True
+    except ValueError:
+        return False
+
+
+@dataclass
+class ReportTable:
+    """Relatório já convertido para o formato longo e tipado."""
+    dimensoes: list
+    nome_coluna: str
+    registros: list
+
+    @property
+    def colunas(self) -> list:
+        return [*self.dimensoes, self.nome_coluna, "quantidade"]
+
+
+def parse_report(layout: ReportLayout, nome_coluna: str = "tipo_atendimento") -> ReportTable:
+    """
+    Converte a tabela de um relatório em registros tipados:
+    {<dimensões>..., <nome_coluna>: <valor do eixo de colunas>, "quantidade": int}.
+
+    Uma coluna é dimensão se tiver um nome conhecido (ver DIMENSOES_CONHECIDAS)
+    ou algum valor não numérico; as colunas de total são descartadas.
+    """
+    cabecalho = next(csv.reader([layout.cabecalho], delimiter=DELIMITER)) if layout.cabecalho else []
+    linhas = list(csv.reader(layout.linhas, delimiter=DELIMITER))
+
+    indices_dimensao = []
+    for i, nome in enumerate(cabecalho):
+        valores = [linha[i] for linha in linhas if i < len(linha)]
+        if slugify(nome) in DIMENSOES_CONHECIDAS or not all(_is_count(v) for v in valores):
+            indices_dimensao.append(i)
+        else:
+            break
+    dimensoes = [slugify(cabecalho[i]) for i in indices_dimensao]
+    indices_valor = [
+        i for i in range(len(indices_dimensao), len(cabecalho))
+        if slugify(cabecalho[i]) not in COLUNAS_IGNORADAS
+    ]
+
+    registros = []
+    for linha in linhas:
+        if len(linha) != len(cabecalho):
+            continue
+        chave = {nome: linha[i].strip() for nome, i in zip(dimensoes, indices_dimensao)}
+        for i in indices_valor:
+            registros.append({**chave, nome_coluna: cabecalho[i].strip(), "quantidade": parse_count(linha[i])})
+    return ReportTable(dimensoes=dimensoes, nome_coluna=nome_coluna, registros=registros)
+
+
+# --- Formatos de Saída ---
+
+FORMATOS = {
+    "csv": ("text/csv", ".csv"),
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow"),
+}
+
+
+class FormatUnavailableError(RuntimeError):
+    """O formato pedido depende de uma biblioteca opcional que não está instalada."""
+
+
+def _iter_ndjson(tabela: ReportTable) -> Iterator[str]:
+    for registro in tabela.registros:
+        yield json.dumps(registro, ensure_ascii=False) + "\n"
+
+
+def _to_arrow(tabela: ReportTable):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise FormatUnavailableError("Os formatos Parquet e Arrow exigem o pacote 'pyarrow'.")
+    campos = [pa.field(nome, pa.string()) for nome in (*tabela.dimensoes, tabela.nome_coluna)]
+    campos.append(pa.field("quantidade", pa.int64()))
+    schema = pa.schema(campos)
+    return pa.Table.from_pylist(tabela.registros, schema=schema)
+
+
+def write_table(tabela: ReportTable, formato: str, output_file: str):
+    """Grava a tabela tipada no formato pedido ('csv', 'ndjson', 'parquet' ou 'arrow')."""
+    if formato == "csv":
+        with open(output_file, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=tabela.colunas, delimiter=DELIMITER)
+            writer.writeheader()
+            writer.writerows(tabela.registros)
+    elif formato == "ndjson":
+        with open(output_file, "w", encoding="utf-8") as f:
+            f.writelines(_iter_ndjson(tabela))
+    elif formato == "parquet":
+        arrow_table = _to_arrow(tabela)
+        import pyarrow.parquet as pq
+        pq.write_table(arrow_table, output_file, compression="zstd")
+    elif formato == "arrow":
+        arrow_table = _to_arrow(tabela)
+        import pyarrow as pa
+        with pa.OSFile(output_file, "wb") as sink, pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    else:
+        raise ValueError(f"Formato desconhecido: {formato}")
+
+
+def convert_report(path: str, formato: str, output_file: str, nome_coluna: str = "tipo_atendimento"):
+    """Lê um relatório bruto do SISAB e o grava como tabela tipada no formato pedido."""
+    write_table(parse_report(read_report(path), nome_coluna), formato, output_file)
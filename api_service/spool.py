@@ -0,0 +1,158 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolFullError(RuntimeError):
+    """Não há espaço no spool para uma nova extração."""
+
+
+class OutputSpool:
+    """
+    Pasta temporária onde os jobs gravam os relatórios que estão gerando.
+
+    Cada job recebe uma subpasta própria ('<pasta>/<job_id>/'), de modo que
+    extrações simultâneas nunca escrevem no mesmo arquivo, e tudo o que o job
+    produz (arquivo parcial, lotes, conversões) é apagado de uma vez.
+
+    - Os arquivos são removidos depois de entregues ao cliente ou, se ninguém
+      os baixar, quando passam de 'ttl' segundos.
+    - Antes de alocar espaço para um novo job, as pastas mais antigas são
+      removidas até o total ficar abaixo de 'max_bytes'. Pastas de jobs em
+      execução nunca são removidas; se ainda assim não houver espaço, a
+      alocação falha com SpoolFullError.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float, cleanup_interval: float = 300.0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._active: set[str] = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._cleanup_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stopping.clear()
+        self._cleanup_thread = threading.Thread(target=self._cleanup_loop, name="spool-cleanup", daemon=True)
+        self._cleanup_thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def path_for(self, job_id: str) -> str:
+        """Caminho do CSV de um job (a pasta só existe depois de 'allocate')."""
+        return str(self.directory / job_id / "Relatorio-SISAB.csv")
+
+    def allocate(self, job_id: str) -> str:
+        """Reserva a pasta de um job que vai começar e retorna o caminho do CSV."""
+        with self._lock:
+            self._evict(self.max_bytes)
+            if self._usage_bytes() >= self.max_bytes:
+                raise SpoolFullError("Não há espaço disponível para novas extrações no momento.")
+            pasta = self.directory / job_id
+            shutil.rmtree(pasta, ignore_errors=True)
+            pasta.mkdir(parents=True)
+            self._active.add(job_id)
+        return self.path_for(job_id)
+
+    def finish(self, job_id: str):
+        """Marca o job como terminado; a partir daqui a pasta pode expirar."""
+        with self._lock:
+            self._active.discard(job_id)
+            pasta = self.directory / job_id
+            if pasta.exists():
+                # O prazo de validade conta a partir do fim do job.
+                os.utime(pasta)
+
+    def release(self, job_id: str):
+        """Apaga a pasta de um job (resultado já entregue ou job com falha)."""
+        with self._lock:
+            self._active.discard(job_id)
+            shutil.rmtree(self.directory / job_id, ignore_errors=True)
+
+    def owns(self, path: str) -> bool:
+        """Indica se o arquivo está dentro do spool (e não, por exemplo, no cache)."""
+        return Path(path).resolve().is_relative_to(self.directory.resolve())
+
+    def has_room(self) -> bool:
+        with self._lock:
+            return self._usage_bytes() < self.max_bytes
+
+    def usage(self) -> dict:
+        with self._lock:
+            pastas = self._job_dirs()
+            total = sum(self._dir_size(p) for p in pastas)
+            ativos = len(self._active)
+        return {"jobs": len(pastas), "ativos": ativos, "bytes": total, "limite_bytes": self.max_bytes}
+
+    def cleanup(self) -> int:
+        """Remove as pastas expiradas. Retorna o número de pastas removidas."""
+        with self._lock:
+            return self._evict(None)
+
+    def _cleanup_loop(self):
+        while not self._stopping.wait(self.cleanup_interval):
+            try:
+                self.cleanup()
+            except Exception:
+                logger.warning("Falha na limpeza do spool.", exc_info=True)
+
+    def _evict(self, limite_bytes: Optional[int]) -> int:
+        """
+        Remove as pastas inativas expiradas e, se 'limite_bytes' for informado,
+        também as mais antigas até o total ficar abaixo do limite.
+        """
+        agora = time.time()
+        inativas = sorted(
+            ((p.stat().st_mtime, p) for p in self._job_dirs() if p.name not in self._active),
+            key=lambda item: item[0],
+        )
+        removidas = 0
+        restantes = []
+        for mtime, pasta in inativas:
+            if agora - mtime >= self.ttl:
+                shutil.rmtree(pasta, ignore_errors=True)
+                removidas += 1
+            else:
+                restantes.append(pasta)
+
+        if limite_bytes is not None:
+            total = self._usage_bytes()
+            for pasta in restantes:
+                if total < limite_bytes:
+                    break
+                tamanho = self._dir_size(pasta)
+                shutil.rmtree(pasta, ignore_errors=True)
+                total -= tamanho
+                removidas += 1
+        if removidas:
+            logger.info("Spool: %d pasta(s) de jobs removida(s).", removidas)
+        return removidas
+
+    def _job_dirs(self) -> list:
+        if not self.directory.exists():
+            return []
+        return [p for p in self.directory.iterdir() if p.is_dir()]
+
+    def _usage_bytes(self) -> int:
+        return sum(self._dir_size(p) for p in self._job_dirs())
+
+    @staticmethod
+    def _dir_size(pasta: Path) -> int:
+        total = 0
+        for raiz, _, arquivos in os.walk(pasta):
+            for nome in arquivos:
+                try:
+                    total += os.path.getsize(os.path.join(raiz, nome))
+                except OSError:
+                    pass
+        return total
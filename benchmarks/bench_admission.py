@@ -0,0 +1,246 @@
+"""
+Teste de carga do controle de admissão da API contra o servidor de fixtures.
+
+Dispara de uma vez uma rajada de pedidos de extração (vários clientes, com
+parte dos pedidos repetidos) e mede:
+
+- respostas: extrações aceitas (202), pedidos unidos a um job já em
+  andamento, recusas por fila cheia e por cota do cliente (429);
+- tempo de resposta das rotas de admissão (p50/p95/máx.);
+- memória: RSS da API e de todos os processos de crawl antes da rajada, no
+  pico e depois que a fila esvazia, e o maior número de processos ao mesmo
+  tempo (deve ficar em 1 + SISAB_CRAWL_WORKERS, qualquer que seja a rajada);
+- tempo até todos os jobs aceitos terminarem.
+
+Os clientes são simulados pelo cabeçalho X-Forwarded-For, como se a API
+estivesse atrás de um proxy (SISAB_TRUSTED_PROXY_HOPS=1).
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_admission.py [--rajada 300] [--clientes 10] [--repetidos 0.3]
+        [--workers 2] [--fila 8] [--taxa 6] [--capacidade 5] [--json resultado.json]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench_api import UFS, _descendants, _rss, request, start_api, summarize, wait_until_ready
+from fixture_server import add_fixture_arguments, fixture_options_from_args, start_fixture_server
+
+
+class ProcessSampler:
+    """Mede a memória da API e dos seus processos filhos ao longo do teste."""
+
+    def __init__(self, pid: int, intervalo: float = 0.05):
+        self.pid = pid
+        self.intervalo = intervalo
+        self.amostras = []
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._parar.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def sample(self) -> dict:
+        processos = _descendants(self.pid)
+        return {
+            "instante": time.perf_counter(),
+            "processos": len(processos),
+            "rss_api": _rss(self.pid),
+            "rss_total": sum(_rss(p) for p in processos),
+        }
+
+    def _run(self):
+        while not self._parar.wait(self.intervalo):
+            self.amostras.append(self.sample())
+
+    def peak(self, desde: float = 0.0) -> dict:
+        amostras = [a for a in self.amostras if a["instante"] >= desde] or [self.sample()]
+        return {campo: max(a[campo] for a in amostras) for campo in ("processos", "rss_api", "rss_total")}
+
+
+def _rejections(base_url: str) -> dict:
+    """Recusas por motivo, lidas de /metrics."""
+    _, _, corpo = request(base_url, "GET", "/metrics")
+    recusas = {"fila": 0.0, "cota": 0.0}
+    for linha in corpo.decode().splitlines():
+        if linha.startswith("sisab_admission_rejections_total{"):
+            motivo = linha.split('motivo="', 1)[1].split('"', 1)[0]
+            recusas[motivo] = float(linha.rsplit(" ", 1)[1])
+    return recusas
+
+
+def burst_requests(datas: list, total: int, clientes: int, repetidos: float, semente: int = 0) -> list:
+    """
+    Pedidos da rajada como (cliente, corpo). Uma fração 'repetidos' repete um
+    pedido anterior (de qualquer cliente); os demais são relatórios distintos.
+    """
+    aleatorio = random.Random(semente)
+    distintos = ({"datas": [competencia], "filtros": {"estados": [uf]}} for uf in UFS for competencia in datas)
+    pedidos = []
+    for _ in range(total):
+        if pedidos and aleatorio.random() < repetidos:
+            corpo = aleatorio.choice(pedidos)[1]
+        else:
+            corpo = next(distintos)
+        pedidos.append((f"10.0.0.{aleatorio.randrange(clientes) + 1}", corpo))
+    return pedidos
+
+
+def run_benchmark(args) -> dict:
+    fixture = start_fixture_server(fixture_options_from_args(args))
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="sisab-bench-") as pasta:
+        processo, base_url = start_api(pasta, fixture.sisab_url, args.workers, env_extra={
+            "SISAB_MAX_QUEUED_JOBS": str(args.fila),
+            "SISAB_CLIENT_RATE_PER_MINUTE": str(args.taxa),
+            "SISAB_CLIENT_BURST": str(args.capacidade),
+            "SISAB_TRUSTED_PROXY_HOPS": "1",
+        })
+        amostrador = ProcessSampler(processo.pid)
+        try:
+            wait_until_ready(base_url, processo)
+            status, _, corpo = request(base_url, "GET", "/date-finder")
+            if status != 200:
+                raise RuntimeError(f"/date-finder respondeu {status}: {corpo[:200]!r}")
+            datas = json.loads(corpo)["datas_disponiveis"]
+            pedidos = burst_requests(datas, args.rajada, args.clientes, args.repetidos)
+
+            # Memória de base: a API pronta, com os workers do pool ociosos.
+            time.sleep(1)
+            base = amostrador.sample()
+            amostrador.start()
+
+            def enviar(pedido):
+                cliente, corpo = pedido
+                inicio = time.perf_counter()
+                status, headers, resposta = request(base_url, "POST", "/iniciar-extracao", corpo,
+                                                    headers={"X-Forwarded-For": cliente})
+                return status, headers, resposta, time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.conexoes) as executor:
+                respostas = list(executor.map(enviar, pedidos))
+            duracao_rajada = time.perf_counter() - inicio
+
+            jobs = {}
+            aceitos = 0
+            esperas = []
+            for status, headers, resposta, _ in respostas:
+                if status in (200, 202):
+                    aceitos += 1
+                    job = json.loads(resposta)
+                    jobs[job["job_id"]] = job
+                elif status == 429:
+                    esperas.append(int(headers.get("retry-after", 0)))
+            recusas = _rejections(base_url)
+
+            # Espera a fila esvaziar.
+            limite = time.perf_counter() + args.timeout
+            pendentes = {job_id for job_id, job in jobs.items() if job["status"] not in ("concluido", "erro")}
+            erros = 0
+            while pendentes and time.perf_counter() < limite:
+                time.sleep(0.2)
+                for job_id in list(pendentes):
+                    job = json.loads(request(base_url, "GET", f"/extracoes/{job_id}")[2])
+                    if job["status"] in ("concluido", "erro"):
+                        erros += job["status"] == "erro"
+                        pendentes.discard(job_id)
+            duracao_total = time.perf_counter() - inicio
+            time.sleep(1)
+            depois = amostrador.sample()
+            amostrador.stop()
+
+            resultados = {
+                "pedidos": len(pedidos),
+                "aceitos": aceitos,
+                "jobs_distintos": len(jobs),
+                "unidos_a_job_existente": aceitos - len(jobs),
+                "recusados_fila": int(recusas["fila"]),
+                "recusados_cota": int(recusas["cota"]),
+                "retry_after": summarize(esperas) if esperas else None,
+                "outros_status": sorted({s for s, *_ in respostas if s not in (200, 202, 429)}),
+                "latencia_admissao": summarize([r[3] for r in respostas]),
+                "duracao_rajada": duracao_rajada,
+                "duracao_ate_fila_vazia": duracao_total,
+                "jobs_nao_concluidos": len(pendentes),
+                "jobs_com_erro": erros,
+                "memoria": {
+                    "antes": base,
+                    "pico": amostrador.peak(inicio),
+                    "depois": depois,
+                },
+            }
+        finally:
+            amostrador.stop()
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+            fixture.shutdown()
+            fixture.server_close()
+    return resultados
+
+
+def print_report(r: dict):
+    ms = lambda s: f"{s * 1000:8.1f} ms"
+    mib = lambda b: f"{b / 2 ** 20:8.1f} MiB"
+    print(f"{'pedidos na rajada':<32}{r['pedidos']:>8}  ({r['duracao_rajada']:.2f}s)")
+    print(f"{'aceitos (200/202)':<32}{r['aceitos']:>8}  ({r['jobs_distintos']} jobs, "
+          f"{r['unidos_a_job_existente']} unidos a um job existente)")
+    print(f"{'recusados: fila cheia (429)':<32}{r['recusados_fila']:>8}")
+    print(f"{'recusados: cota do cliente (429)':<32}{r['recusados_cota']:>8}")
+    if r["retry_after"]:
+        print(f"{'Retry-After':<32}{r['retry_after']['p50']:>8} s (p50), {r['retry_after']['max']} s (máx.)")
+    if r["outros_status"]:
+        print(f"{'outros status':<32}{r['outros_status']}")
+    l = r["latencia_admissao"]
+    print(f"{'latência da admissão':<32}{ms(l['p50'])} p50  {ms(l['p95'])} p95  {ms(l['max'])} máx.")
+    print(f"{'fila vazia após':<32}{r['duracao_ate_fila_vazia']:8.1f} s  "
+          f"({r['jobs_nao_concluidos']} não concluídos, {r['jobs_com_erro']} com erro)")
+    m = r["memoria"]
+    print(f"{'':<32}{'antes':>12}{'pico':>12}{'depois':>12}")
+    for nome, campo in (("processos", "processos"), ("RSS da API", "rss_api"), ("RSS total", "rss_total")):
+        formatar = (lambda v: f"{v:8d}    ") if campo == "processos" else mib
+        print(f"{nome:<32}{formatar(m['antes'][campo]):>12}{formatar(m['pico'][campo]):>12}{formatar(m['depois'][campo]):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rajada", type=int, default=300, help="Pedidos de extração disparados de uma vez.")
+    parser.add_argument("--clientes", type=int, default=10, help="Clientes (IPs) distintos na rajada.")
+    parser.add_argument("--repetidos", type=float, default=0.3, help="Fração dos pedidos que repete um anterior.")
+    parser.add_argument("--conexoes", type=int, default=64, help="Requisições simultâneas durante a rajada.")
+    parser.add_argument("--workers", type=int, default=2, help="Processos do pool de crawl da API.")
+    parser.add_argument("--fila", type=int, default=8, help="SISAB_MAX_QUEUED_JOBS da API.")
+    parser.add_argument("--taxa", type=float, default=6, help="SISAB_CLIENT_RATE_PER_MINUTE da API.")
+    parser.add_argument("--capacidade", type=int, default=5, help="SISAB_CLIENT_BURST da API.")
+    parser.add_argument("--timeout", type=float, default=600, help="Tempo máximo para a fila esvaziar, em segundos.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo.")
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Benchmark de ponta a ponta da API contra o servidor de fixtures (sem rede):
+
+- inicio_api: tempo até a API responder à primeira requisição;
+- /date-finder: primeira chamada (crawl) e chamadas seguintes (cache);
+- /iniciar-extracao: tempo desde o POST até o download do resultado, uma
+  extração por vez, e a mesma extração repetida (cache de resultados);
+- vazão: extrações concluídas por segundo com vários clientes simultâneos;
+- memória: pico de RSS da API e dos processos de crawl.
+
+A API roda em um subprocesso (uvicorn), com uma pasta de dados temporária e
+SISAB_URL apontando para o servidor de fixtures.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_api.py [--extracoes 5] [--clientes 4] [--extracoes-por-cliente 3]
+        [--workers 2] [--tamanho-relatorio 0] [--json resultado.json]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from fixture_server import add_fixture_arguments, fixture_options_from_args, start_fixture_server
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE",
+       "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+
+
+# --- Cliente HTTP ---
+
+def request(base_url: str, metodo: str, caminho: str, corpo=None, headers=None, timeout: float = 60):
+    """Faz uma requisição à API e retorna (status, cabeçalhos, corpo)."""
+    dados = json.dumps(corpo).encode() if corpo is not None else None
+    req = urllib.request.Request(base_url + caminho, data=dados, method=metodo, headers=dict(headers or {}))
+    if dados is not None:
+        req.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, dict(resp.headers), resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def run_extraction(base_url: str, pedido: dict, timeout: float) -> tuple[float, int]:
+    """
+    Inicia uma extração, acompanha o job até a conclusão e baixa o resultado.
+    Retorna o tempo total e o tamanho do arquivo recebido.
+    """
+    inicio = time.perf_counter()
+    status, _, corpo = request(base_url, "POST", "/iniciar-extracao", pedido)
+    if status not in (200, 202):
+        raise RuntimeError(f"/iniciar-extracao respondeu {status}: {corpo[:200]!r}")
+    job = json.loads(corpo)
+    limite = inicio + timeout
+    while job["status"] not in ("concluido", "erro"):
+        if time.perf_counter() > limite:
+            raise TimeoutError(f"O job {job['job_id']} não terminou em {timeout}s.")
+        time.sleep(0.02)
+        job = json.loads(request(base_url, "GET", job["status_url"])[2])
+    if job["status"] == "erro":
+        raise RuntimeError(f"O job {job['job_id']} falhou: {job['erro']}")
+    status, _, arquivo = request(base_url, "GET", job["resultado_url"])
+    if status != 200:
+        raise RuntimeError(f"O download do resultado respondeu {status}.")
+    return time.perf_counter() - inicio, len(arquivo)
+
+
+def unique_requests(datas: list):
+    """Pedidos de extração distintos (competência x estado), para não acertar o cache."""
+    for uf in UFS:
+        for competencia in datas:
+            yield {"datas": [competencia], "filtros": {"estados": [uf]}}
+
+
+# --- Memória ---
+
+def _descendants(pid: int) -> list:
+    filhos = {}
+    for entrada in os.listdir("/proc"):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entrada}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        filhos.setdefault(ppid, []).append(int(entrada))
+    processos, pendentes = [], [pid]
+    while pendentes:
+        atual = pendentes.pop()
+        processos.append(atual)
+        pendentes.extend(filhos.get(atual, []))
+    return processos
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class MemorySampler:
+    """
+    Mede periodicamente o RSS da API e de todos os seus processos filhos
+    (os workers do pool de crawl). Depende de /proc; em outros sistemas, só o
+    pico do maior processo é obtido, via getrusage, quando a API termina.
+    """
+
+    def __init__(self, pid: int, intervalo: float = 0.1):
+        self.pid = pid
+        self.intervalo = intervalo
+        self.pico_api = 0
+        self.pico_total = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+
+    def stop(self):
+        self._parar.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico_api = max(self.pico_api, _rss(self.pid))
+            self.pico_total = max(self.pico_total, sum(_rss(p) for p in _descendants(self.pid)))
+
+
+# --- Execução ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(pasta: str, sisab_url: str, workers: int, env_extra: dict = None) -> tuple[subprocess.Popen, str]:
+    porta = _free_port()
+    env = dict(
+        os.environ,
+        SISAB_URL=sisab_url,
+        SISAB_DATA_DIR=pasta,
+        SISAB_MAX_JOBS=str(workers),
+        SISAB_CRAWL_WORKERS=str(workers),
+        SISAB_HARVEST_INTERVAL="0",
+        # Os benchmarks medem a API, não as cotas por cliente (todos vêm do mesmo IP).
+        SISAB_CLIENT_RATE_PER_MINUTE="0",
+        SISAB_MAX_QUEUED_JOBS="0",
+    )
+    env.update(env_extra or {})
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_service.main:app", "--host", "127.0.0.1", "--port", str(porta),
+         "--log-level", "warning"],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(pasta, "api.log"), "wb"),
+    )
+    return processo, f"http://127.0.0.1:{porta}"
+
+
+def wait_until_ready(base_url: str, processo: subprocess.Popen, timeout: float = 60) -> float:
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < timeout:
+        if processo.poll() is not None:
+            raise RuntimeError("A API terminou durante a inicialização (veja api.log).")
+        try:
+            if request(base_url, "GET", "/saude", timeout=2)[0] == 200:
+                return time.perf_counter() - inicio
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError("A API não respondeu a tempo.")
+
+
+def summarize(tempos: list) -> dict:
+    ordenados = sorted(tempos)
+    return {
+        "n": len(ordenados),
+        "media": statistics.fmean(ordenados),
+        "p50": ordenados[len(ordenados) // 2],
+        "p95": ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))],
+        "max": ordenados[-1],
+    }
+
+
+def run_benchmark(args) -> dict:
+    fixture = start_fixture_server(fixture_options_from_args(args))
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="sisab-bench-") as pasta:
+        processo, base_url = start_api(pasta, fixture.sisab_url, args.workers)
+        memoria = MemorySampler(processo.pid)
+        memoria.start()
+        try:
+            resultados["inicio_api"] = wait_until_ready(base_url, processo)
+
+            # /date-finder: a primeira chamada executa o spider; as seguintes vêm do cache.
+            inicio = time.perf_counter()
+            status, headers, corpo = request(base_url, "GET", "/date-finder")
+            if status != 200:
+                raise RuntimeError(f"/date-finder respondeu {status}: {corpo[:200]!r}")
+            resultados["date_finder_frio"] = time.perf_counter() - inicio
+            datas = json.loads(corpo)["datas_disponiveis"]
+            tempos = []
+            for _ in range(args.repeticoes_cache):
+                inicio = time.perf_counter()
+                request(base_url, "GET", "/date-finder")
+                tempos.append(time.perf_counter() - inicio)
+            resultados["date_finder_cache"] = summarize(tempos)
+
+            pedidos = unique_requests(datas)
+
+            # Extrações sequenciais, sem cache.
+            tempos, tamanhos = [], []
+            primeiro = None
+            for _ in range(args.extracoes):
+                pedido = next(pedidos)
+                primeiro = primeiro or pedido
+                segundos, tamanho = run_extraction(base_url, pedido, args.timeout)
+                tempos.append(segundos)
+                tamanhos.append(tamanho)
+            resultados["extracao"] = summarize(tempos)
+            resultados["extracao"]["bytes"] = statistics.fmean(tamanhos)
+
+            # A mesma extração de novo: servida pelo cache de resultados.
+            tempos = [run_extraction(base_url, primeiro, args.timeout)[0] for _ in range(args.repeticoes_cache)]
+            resultados["extracao_cache"] = summarize(tempos)
+
+            # Vazão com clientes simultâneos.
+            lotes = [[next(pedidos) for _ in range(args.extracoes_por_cliente)] for _ in range(args.clientes)]
+
+            def cliente(lote):
+                return [run_extraction(base_url, pedido, args.timeout)[0] for pedido in lote]
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clientes) as executor:
+                tempos = [t for tempos_cliente in executor.map(cliente, lotes) for t in tempos_cliente]
+            duracao = time.perf_counter() - inicio
+            resultados["concorrencia"] = {
+                **summarize(tempos),
+                "clientes": args.clientes,
+                "duracao": duracao,
+                "extracoes_por_segundo": len(tempos) / duracao,
+            }
+
+            resultados["fixture"] = dict(fixture.state.stats)
+        finally:
+            memoria.stop()
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+            fixture.shutdown()
+            fixture.server_close()
+
+    if memoria.pico_total:
+        resultados["memoria"] = {"pico_api": memoria.pico_api, "pico_total": memoria.pico_total}
+    else:
+        import resource
+        # ru_maxrss é o pico do maior processo filho já encerrado, em KiB no Linux.
+        resultados["memoria"] = {"pico_maior_processo": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024}
+    return resultados
+
+
+def print_report(r: dict):
+    ms = lambda s: f"{s * 1000:9.1f} ms"
+    print(f"{'inicio da API':<34}{ms(r['inicio_api'])}")
+    print(f"{'/date-finder (crawl)':<34}{ms(r['date_finder_frio'])}")
+    for nome, chave in (("/date-finder (cache)", "date_finder_cache"), ("extracao (crawl)", "extracao"),
+                        ("extracao (cache)", "extracao_cache"), ("extracao (concorrente)", "concorrencia")):
+        e = r[chave]
+        print(f"{nome:<34}{ms(e['media'])}  p50 {ms(e['p50'])}  p95 {ms(e['p95'])}  (n={e['n']})")
+    c = r["concorrencia"]
+    print(f"{'vazao':<34}{c['extracoes_por_segundo']:9.2f} extrações/s com {c['clientes']} clientes")
+    for nome, valor in r["memoria"].items():
+        print(f"{'memoria: ' + nome:<34}{valor / 2 ** 20:9.1f} MiB")
+    f = r["fixture"]
+    print(f"{'servidor de fixtures':<34}{f['gets']} GETs, {f['posts']} POSTs, "
+          f"{f['sessoes_abertas']} sessões, {f['bytes_enviados'] / 2 ** 20:.1f} MiB enviados")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--extracoes", type=int, default=5, help="Extrações sequenciais sem cache.")
+    parser.add_argument("--repeticoes-cache", type=int, default=20, help="Chamadas às rotas servidas do cache.")
+    parser.add_argument("--clientes", type=int, default=4, help="Clientes simultâneos no teste de vazão.")
+    parser.add_argument("--extracoes-por-cliente", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=2, help="Processos do pool de crawl da API.")
+    parser.add_argument("--timeout", type=float, default=300, help="Tempo máximo de cada extração, em segundos.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo (para comparar execuções no CI).")
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Benchmark da detecção de mudanças nas competências revisadas pelo SISAB.
+
+Simula várias rodadas da coleta periódica sobre um HarvestStore em uma pasta
+temporária, sem rede: a cada rodada as competências da janela de revisão são
+colhidas de novo, e em algumas delas o "SISAB" alterou uma fração das linhas.
+Compara:
+
+- recarga completa (como antes): todas as linhas das competências colhidas de
+  novo são apagadas e regravadas no índice, e quem consome os dados recarrega
+  as competências inteiras;
+- deltas: o store grava só as linhas que mudaram e registra as revisões; quem
+  consome os dados lê só as linhas das revisões novas (o que /mudancas entrega).
+
+Mede, por rodada, o tempo de ingestão, as linhas gravadas no SQLite, as linhas
+e os bytes (NDJSON) que o consumidor precisa recarregar.
+
+Os relatórios são sintéticos, com --linhas chaves por competência (o relatório
+nacional por UF tem 27; por município seriam ~5570) e os tipos de atendimento
+do relatório gravado em benchmarks/fixtures.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_changes.py [--competencias 24] [--janela 4] [--rodadas 10] [--linhas 5570]
+        [--revisadas 1] [--fracao-alterada 0.01] [--json resultado.json]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+from api_service.data_store import HarvestStore
+from api_service.sisab_report import ENCODING, parse_report, read_report
+
+RELATORIO = os.path.join(RAIZ, "benchmarks", "fixtures", "sisab", "relatorio.csv")
+
+# Índice como era antes da detecção de mudanças: as linhas da competência são
+# apagadas e regravadas a cada coleta.
+_SCHEMA_COMPLETO = """
+CREATE TABLE registros (competencia TEXT NOT NULL, uf TEXT, tipo_atendimento TEXT NOT NULL, quantidade INTEGER);
+CREATE INDEX idx_registros ON registros (competencia, uf, tipo_atendimento);
+CREATE INDEX idx_registros_uf ON registros (uf, tipo_atendimento, competencia, quantidade);
+CREATE INDEX idx_registros_tipo ON registros (tipo_atendimento, competencia, uf, quantidade);
+"""
+
+
+class SyntheticReports:
+    """Relatórios no layout do SISAB, com valores que podem ser revisados."""
+
+    def __init__(self, linhas: int, semente: int = 0):
+        layout = read_report(RELATORIO)
+        self.layout = layout
+        self.colunas = len(next(csv.reader([layout.cabecalho], delimiter=";"))) - 1
+        self.chaves = [f"M{i:05d}" for i in range(linhas)]
+        self.aleatorio = random.Random(semente)
+        self.valores = {}
+
+    def values(self, competencia: str) -> list:
+        if competencia not in self.valores:
+            self.valores[competencia] = [
+                [self.aleatorio.randrange(0, 500000) for _ in range(self.colunas)] for _ in self.chaves
+            ]
+        return self.valores[competencia]
+
+    def revise(self, competencia: str, fracao: float) -> int:
+        """Altera uma fração das células da competência; retorna quantas mudaram."""
+        valores = self.values(competencia)
+        celulas = [(i, j) for i in range(len(valores)) for j in range(self.colunas)]
+        alteradas = self.aleatorio.sample(celulas, max(1, int(len(celulas) * fracao)))
+        for i, j in alteradas:
+            valores[i][j] += self.aleatorio.randrange(1, 100)
+        return len(alteradas)
+
+    def write(self, competencia: str, caminho: str):
+        with open(caminho, "w", encoding=ENCODING, newline="") as f:
+            for linha in self.layout.preambulo:
+                f.write(linha + "\n")
+            f.write(self.layout.cabecalho + "\n")
+            for chave, valores in zip(self.chaves, self.values(competencia)):
+                f.write(";".join([chave, *(f"{v:,}".replace(",", ".") for v in valores)]) + "\n")
+            for linha in self.layout.rodape:
+                f.write(linha + "\n")
+
+
+def _ndjson_bytes(registros) -> int:
+    return sum(len(json.dumps(r, ensure_ascii=False)) + 1 for r in registros)
+
+
+def full_reingest(conn: sqlite3.Connection, competencia: str, caminho: str) -> list:
+    """A ingestão anterior: apaga e regrava todas as linhas da competência."""
+    registros = [
+        (competencia, r.get("uf"), r["tipo_atendimento"], r["quantidade"])
+        for r in parse_report(read_report(caminho)).registros
+    ]
+    with conn:
+        conn.execute("DELETE FROM registros WHERE competencia = ?", (competencia,))
+        conn.executemany("INSERT INTO registros VALUES (?, ?, ?, ?)", registros)
+    return registros
+
+
+def run_benchmark(args) -> dict:
+    relatorios = SyntheticReports(args.linhas)
+    competencias = [f"{2020 + i // 12}{i % 12 + 1:02d}" for i in range(args.competencias)]
+    janela = competencias[-args.janela:]
+    pasta = tempfile.mkdtemp(prefix="bench-changes-")
+    try:
+        store = HarvestStore(os.path.join(pasta, "store"))
+        completo = sqlite3.connect(os.path.join(pasta, "completo.sqlite3"))
+        completo.executescript(_SCHEMA_COMPLETO)
+        entrada = os.path.join(pasta, "entrada.csv")
+
+        # Carga inicial: todas as competências, nos dois índices.
+        for competencia in competencias:
+            relatorios.write(competencia, entrada)
+            full_reingest(completo, competencia, entrada)
+            store.add(competencia, entrada)
+        cursor = store.revisions(limite=100000)[-1]["id"]
+
+        rodadas = []
+        for _ in range(args.rodadas):
+            revisadas = relatorios.aleatorio.sample(janela, min(args.revisadas, len(janela)))
+            celulas = sum(relatorios.revise(competencia, args.fracao_alterada) for competencia in revisadas)
+            rodada = {"celulas_revisadas": celulas, "completo": {}, "deltas": {}}
+
+            mudancas_antes = completo.total_changes
+            inicio, registros = time.perf_counter(), []
+            for competencia in janela:
+                relatorios.write(competencia, entrada)
+                registros += full_reingest(completo, competencia, entrada)
+            rodada["completo"] = {
+                "ingestao_s": time.perf_counter() - inicio,
+                "linhas_gravadas": completo.total_changes - mudancas_antes,
+                "linhas_recarregadas": len(registros),
+                "bytes_recarregados": _ndjson_bytes(
+                    {"competencia": c, "uf": u, "tipo_atendimento": t, "quantidade": q} for c, u, t, q in registros
+                ),
+            }
+
+            mudancas_antes = store._conn.total_changes
+            inicio, linhas_gravadas = time.perf_counter(), 0
+            for competencia in janela:
+                relatorios.write(competencia, entrada)
+                resumo = store.add(competencia, entrada)
+                linhas_gravadas += resumo["inseridos"] + resumo["alterados"] + resumo["removidos"]
+            ingestao = time.perf_counter() - inicio
+            escritas = store._conn.total_changes - mudancas_antes
+            delta = []
+            for revisao in store.revisions(desde=cursor, limite=100000):
+                linhas, _ = store.changes(revisao["id"], limite=10 ** 9)
+                delta += [{"competencia": revisao["competencia"], **linha} for linha in linhas]
+                cursor = revisao["id"]
+            rodada["deltas"] = {
+                "ingestao_s": ingestao,
+                "linhas_gravadas": linhas_gravadas,
+                "escritas_sqlite": escritas,
+                "linhas_recarregadas": len(delta),
+                "bytes_recarregados": _ndjson_bytes(delta),
+            }
+            rodadas.append(rodada)
+
+        store.close()
+        completo.close()
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    def mediana(modo, campo):
+        return statistics.median(r[modo][campo] for r in rodadas)
+
+    return {
+        "parametros": vars(args),
+        "rodadas": rodadas,
+        "resumo": {
+            modo: {campo: mediana(modo, campo)
+                   for campo in ("ingestao_s", "linhas_gravadas", "linhas_recarregadas", "bytes_recarregados")}
+            for modo in ("completo", "deltas")
+        },
+    }
+
+
+def print_report(r: dict):
+    p = r["parametros"]
+    print(f"{p['competencias']} competências, janela de revisão de {p['janela']}, {p['linhas']} chaves por "
+          f"competência; por rodada, {p['revisadas']} competência(s) com {p['fracao_alterada']:.1%} das células alteradas.")
+    print(f"{'mediana por rodada':<22}{'ingestão':>12}{'linhas gravadas':>17}{'linhas recarregadas':>21}{'bytes recarregados':>20}")
+    for modo, c in r["resumo"].items():
+        print(f"{modo:<22}{c['ingestao_s'] * 1000:>10.0f}ms{c['linhas_gravadas']:>17,.0f}"
+              f"{c['linhas_recarregadas']:>21,.0f}{c['bytes_recarregados']:>20,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--competencias", type=int, default=24, help="Competências no store.")
+    parser.add_argument("--janela", type=int, default=4, help="Competências recentes colhidas de novo a cada rodada.")
+    parser.add_argument("--rodadas", type=int, default=10, help="Rodadas de coleta.")
+    parser.add_argument("--linhas", type=int, default=5570, help="Chaves (linhas da tabela) por competência.")
+    parser.add_argument("--revisadas", type=int, default=1, help="Competências da janela revisadas pelo SISAB por rodada.")
+    parser.add_argument("--fracao-alterada", type=float, default=0.01,
+                        help="Fração das células alteradas em uma competência revisada.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo.")
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
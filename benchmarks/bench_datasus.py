@@ -0,0 +1,186 @@
+"""
+Benchmark do DatasusSpider contra o servidor de fixtures (sem rede).
+
+Para cada formato de tabela do TabNet ('prn' e 'table') e cada nível de
+concorrência, extrai os mesmos períodos e mede:
+
+- tempo total do crawl (GET do formulário + um POST por período);
+- linhas e células (itens) extraídas por segundo;
+- requisições por segundo;
+- pico de RSS do processo.
+
+Os crawls rodam neste processo, um após o outro, com as configurações do
+projeto (inclusive o BatchedExportPipeline gravando o arquivo de saída). O throttle adaptativo
+começa já na concorrência pedida e sem atraso, com um banco temporário, para
+que a medição não dependa do histórico do host.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_datasus.py [--periodos 12] [--linha Município] [--formatos prn,table]
+        [--concorrencia 1,4] [--formato-saida csv] [--municipios 5570] [--latencia-relatorio 0.2] [--json resultado.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "Scrapy_project.Scrapy_project.settings")
+
+from fixture_server import CAMINHO_TABNET, FixtureServer, add_fixture_arguments, fixture_options_from_args
+
+
+def _peak_rss() -> int:
+    """Pico de RSS deste processo, em bytes."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+def _serve_fixtures(opcoes, porta: int):
+    FixtureServer(("127.0.0.1", porta), opcoes).serve_forever()
+
+
+def _fixture_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url + "/__stats", timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+def start_fixture_process(opcoes) -> tuple[multiprocessing.Process, str]:
+    """
+    Inicia o servidor de fixtures em outro processo, para que a geração das
+    tabelas não dispute o GIL com o spider medido. Retorna o processo e a URL base.
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+    processo = multiprocessing.Process(target=_serve_fixtures, args=(opcoes, porta), daemon=True)
+    processo.start()
+    base_url = f"http://127.0.0.1:{porta}"
+    limite = time.monotonic() + 10
+    while True:
+        try:
+            _fixture_stats(base_url)
+            return processo, base_url
+        except OSError:
+            if time.monotonic() > limite:
+                raise
+            time.sleep(0.05)
+
+
+def run_benchmark(args) -> dict:
+    from scrapy.crawler import CrawlerRunner
+    from scrapy.utils.log import configure_logging
+    from scrapy.utils.project import get_project_settings
+    from scrapy.utils.reactor import install_reactor
+
+    from Scrapy_project.Scrapy_project.spiders.datasus import DatasusSpider
+
+    pasta = tempfile.mkdtemp(prefix="bench-datasus-")
+    settings = get_project_settings()
+    install_reactor(settings["TWISTED_REACTOR"])
+    from twisted.internet import defer, reactor
+
+    settings.set("LOG_LEVEL", "WARNING")
+    configure_logging(settings)
+    settings.set("ADAPTIVE_THROTTLE_DB", os.path.join(pasta, "throttle.sqlite3"))
+    settings.set("ADAPTIVE_THROTTLE_START_DELAY", 0.0)
+    settings.set("HTTPCACHE_DB", os.path.join(pasta, "httpcache.sqlite3"))
+
+    processo, base_url = start_fixture_process(fixture_options_from_args(args))
+    url = base_url + CAMINHO_TABNET
+    cenarios = [(formato, concorrencia) for formato in args.formatos.split(",")
+                for concorrencia in (int(c) for c in args.concorrencia.split(","))]
+    resultados = []
+
+    @defer.inlineCallbacks
+    def run_all():
+        try:
+            for formato, concorrencia in cenarios:
+                cenario_settings = settings.copy()
+                cenario_settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", concorrencia)
+                cenario_settings.set("ADAPTIVE_THROTTLE_START_CONCURRENCY", concorrencia)
+                cenario_settings.set("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", concorrencia)
+                runner = CrawlerRunner(cenario_settings)
+                crawler = runner.create_crawler(DatasusSpider)
+                saida = os.path.join(pasta, f"{formato}-{concorrencia}.{args.formato_saida}")
+                antes = _fixture_stats(base_url)
+                inicio = time.perf_counter()
+                yield runner.crawl(crawler, url=url, linha=args.linha, periodos=args.periodos_escolhidos,
+                                   formato=formato, output_file=saida, formato_saida=args.formato_saida)
+                duracao = time.perf_counter() - inicio
+                depois = _fixture_stats(base_url)
+
+                falhas = [r for r in crawler.spider.resultados.values() if r != "ok"]
+                linhas = sum(crawler.spider.linhas_extraidas.values())
+                celulas = crawler.stats.get_value("item_scraped_count", 0)
+                requisicoes = (depois["gets"] - antes["gets"]) + (depois["posts"] - antes["posts"])
+                resultados.append({
+                    "formato": formato,
+                    "concorrencia": concorrencia,
+                    "segundos": round(duracao, 3),
+                    "periodos": len(crawler.spider.resultados),
+                    "falhas": len(falhas),
+                    "linhas": linhas,
+                    "celulas": celulas,
+                    "linhas_por_segundo": round(linhas / duracao, 1),
+                    "celulas_por_segundo": round(celulas / duracao, 1),
+                    "requisicoes_por_segundo": round(requisicoes / duracao, 2),
+                    "bytes_recebidos": depois["bytes_enviados"] - antes["bytes_enviados"],
+                    "bytes_saida": os.path.getsize(saida) if os.path.exists(saida) else 0,
+                    "pico_rss_mib": round(_peak_rss() / 1024 ** 2, 1),
+                })
+        finally:
+            reactor.stop()
+
+    reactor.callWhenRunning(run_all)
+    reactor.run()
+    processo.terminate()
+    shutil.rmtree(pasta, ignore_errors=True)
+    return {"parametros": vars(args), "cenarios": resultados}
+
+
+def print_report(r: dict):
+    print(f"{'formato':<8} {'conc.':>5} {'tempo (s)':>10} {'linhas':>9} {'linhas/s':>10} "
+          f"{'células/s':>10} {'req/s':>7} {'RSS (MiB)':>10}")
+    for c in r["cenarios"]:
+        print(f"{c['formato']:<8} {c['concorrencia']:>5} {c['segundos']:>10.2f} {c['linhas']:>9} "
+              f"{c['linhas_por_segundo']:>10.0f} {c['celulas_por_segundo']:>10.0f} "
+              f"{c['requisicoes_por_segundo']:>7.1f} {c['pico_rss_mib']:>10.1f}"
+              + (f"  ({c['falhas']} períodos falharam)" if c["falhas"] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--periodos", type=int, default=12, help="Períodos (meses mais recentes) extraídos.")
+    parser.add_argument("--linha", default="Município", help="Linha da tabela (valor ou rótulo do formulário).")
+    parser.add_argument("--formatos", default="prn,table", help="Formatos do TabNet, separados por vírgula.")
+    parser.add_argument("--concorrencia", default="1,4", help="Períodos baixados ao mesmo tempo, separados por vírgula.")
+    parser.add_argument("--formato-saida", default="csv", choices=["csv", "parquet", "sqlite"],
+                        help="Formato do arquivo gravado pelo BatchedExportPipeline.")
+    parser.add_argument("--json", help="Grava o resultado também neste arquivo JSON.")
+    add_fixture_arguments(parser)
+    parser.set_defaults(latencia_relatorio=0.2)
+    args = parser.parse_args()
+
+    # Os arquivos do formulário de fixtures: 'nibrAAMM.dbf', do mais recente para o mais antigo.
+    args.periodos_escolhidos = [
+        f"nibr{(2025 - i // 12) % 100:02d}{12 - i % 12:02d}.dbf" for i in range(args.periodos)
+    ]
+
+    resultado = run_benchmark(args)
+    print_report(resultado)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
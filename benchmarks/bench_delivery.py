@@ -0,0 +1,202 @@
+"""
+Benchmark da entrega dos resultados: bytes transferidos e tempo de download
+de relatórios típicos com cada Accept-Encoding, e retomada de um download
+interrompido (Range + If-Range).
+
+Os relatórios são gerados pela API contra o servidor de fixtures (sem rede):
+
+- sisab: relatório do SISAB com várias competências, extraído em lotes (o
+  servidor de fixtures repete as mesmas linhas até --tamanho-relatorio, então
+  a compactação aqui é bem mais otimista do que num relatório real);
+- datasus: tabela do TabNet por município com vários períodos (CSV com uma
+  linha por período, município e coluna, com valores variados).
+
+Para cada relatório e codificação ('identity', 'gzip', 'zstd') mede:
+- bytes transferidos e a razão em relação ao arquivo original;
+- tempo do download local e da descompactação no cliente;
+- tempo estimado em um link de --banda Mbit/s (transferência + descompactação).
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_delivery.py [--competencias 12] [--tamanho-relatorio 2000000]
+        [--periodos 12] [--banda 20] [--json resultado.json]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench_api import request, start_api, wait_until_ready
+from fixture_server import FixtureOptions, start_fixture_server
+
+CODIFICACOES = ("identity", "gzip", "zstd")
+
+
+def _decompress(corpo: bytes, codificacao: str) -> bytes:
+    if codificacao == "gzip":
+        return gzip.decompress(corpo)
+    if codificacao == "zstd":
+        try:
+            from compression import zstd
+        except ImportError:
+            from backports import zstd
+        return zstd.decompress(corpo)
+    return corpo
+
+
+def download(url: str, headers: dict) -> tuple[int, dict, bytes, float]:
+    """GET com os cabeçalhos dados; retorna (status, cabeçalhos, corpo, segundos)."""
+    req = urllib.request.Request(url, headers=headers)
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            corpo = resp.read()
+            return resp.status, {k.lower(): v for k, v in resp.headers.items()}, corpo, time.perf_counter() - inicio
+    except urllib.error.HTTPError as e:
+        return e.code, {k.lower(): v for k, v in e.headers.items()}, e.read(), time.perf_counter() - inicio
+
+
+def wait_job(base_url: str, job: dict, timeout: float = 600) -> dict:
+    limite = time.perf_counter() + timeout
+    while job["status"] not in ("concluido", "erro"):
+        if time.perf_counter() > limite:
+            raise TimeoutError(f"O job {job['job_id']} não terminou a tempo.")
+        time.sleep(0.1)
+        job = json.loads(request(base_url, "GET", job["status_url"])[2])
+    if job["status"] == "erro":
+        raise RuntimeError(f"O job {job['job_id']} falhou: {job['erro']}")
+    return job
+
+
+def measure_report(base_url: str, job: dict, banda: float) -> dict:
+    url = base_url + job["resultado_url"]
+    original = None
+    medidas = {}
+    for codificacao in CODIFICACOES:
+        status, headers, corpo, segundos = download(url, {"Accept-Encoding": codificacao})
+        if status != 200:
+            raise RuntimeError(f"O download ({codificacao}) respondeu {status}.")
+        entregue = headers.get("content-encoding", "identity")
+        inicio = time.perf_counter()
+        conteudo = _decompress(corpo, entregue)
+        descompactacao = time.perf_counter() - inicio
+        if original is None:
+            original = conteudo
+        elif conteudo != original:
+            raise RuntimeError(f"O conteúdo entregue com {codificacao} difere do original.")
+        medidas[codificacao] = {
+            "content_encoding": entregue,
+            "etag": headers.get("etag"),
+            "bytes": len(corpo),
+            "razao": len(corpo) / len(original),
+            "download_local_s": segundos,
+            "descompactacao_s": descompactacao,
+            "estimado_no_link_s": len(corpo) * 8 / (banda * 1e6) + descompactacao,
+        }
+
+    # Retomada: baixa metade, depois o resto com Range + If-Range.
+    _, headers, _, _ = download(url, {"Accept-Encoding": "gzip"})
+    status, _, inicio_parcial, _ = download(url, {"Accept-Encoding": "gzip", "Range": f"bytes=0-{medidas['gzip']['bytes'] // 2 - 1}"})
+    status_resto, headers_resto, resto, _ = download(url, {
+        "Accept-Encoding": "gzip",
+        "Range": f"bytes={len(inicio_parcial)}-",
+        "If-Range": headers["etag"],
+    })
+    retomado = _decompress(inicio_parcial + resto, headers_resto.get("content-encoding", "identity"))
+    status_304, _, _, _ = download(url, {"Accept-Encoding": "gzip", "If-None-Match": headers["etag"]})
+    # If-Range com um ETag antigo: o servidor manda o arquivo inteiro.
+    status_if_range_antigo, _, corpo_antigo, _ = download(url, {
+        "Accept-Encoding": "gzip", "Range": "bytes=100-", "If-Range": '"versao-antiga"',
+    })
+    return {
+        "bytes_original": len(original),
+        "sha256": hashlib.sha256(original).hexdigest(),
+        "codificacoes": medidas,
+        "retomada": {
+            "status_parcial": status,
+            "status_resto": status_resto,
+            "content_range": headers_resto.get("content-range"),
+            "conteudo_integro": retomado == original,
+            "status_if_none_match": status_304,
+            "status_if_range_antigo": status_if_range_antigo,
+            "if_range_antigo_completo": len(corpo_antigo) == medidas["gzip"]["bytes"],
+        },
+    }
+
+
+def run_benchmark(args) -> dict:
+    fixture = start_fixture_server(FixtureOptions(tamanho_relatorio=args.tamanho_relatorio, municipios=args.municipios))
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="sisab-bench-") as pasta:
+        processo, base_url = start_api(pasta, fixture.sisab_url, 2, env_extra={"SISAB_DATASUS_URL": fixture.tabnet_url})
+        try:
+            wait_until_ready(base_url, processo)
+            datas = json.loads(request(base_url, "GET", "/date-finder")[2])["datas_disponiveis"][:args.competencias]
+            status, _, corpo = request(base_url, "POST", "/iniciar-extracao?tamanho_lote=1", {"datas": datas})
+            if status not in (200, 202):
+                raise RuntimeError(f"/iniciar-extracao respondeu {status}: {corpo[:200]!r}")
+            resultados["sisab"] = measure_report(base_url, wait_job(base_url, json.loads(corpo)), args.banda)
+
+            opcoes = json.loads(request(base_url, "GET", "/datasus/opcoes")[2])
+            periodos = [o["rotulo"] for o in opcoes["periodos"][:args.periodos]]
+            status, _, corpo = request(base_url, "POST", "/datasus/extracao",
+                                       {"periodos": periodos, "linha": "Município", "formato_saida": "csv"})
+            if status not in (200, 202):
+                raise RuntimeError(f"/datasus/extracao respondeu {status}: {corpo[:200]!r}")
+            resultados["datasus"] = measure_report(base_url, wait_job(base_url, json.loads(corpo)), args.banda)
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+            fixture.shutdown()
+            fixture.server_close()
+    return {"parametros": vars(args), "relatorios": resultados}
+
+
+def print_report(r: dict):
+    banda = r["parametros"]["banda"]
+    for nome, relatorio in r["relatorios"].items():
+        print(f"{nome}: {relatorio['bytes_original'] / 2 ** 20:.1f} MiB")
+        print(f"  {'codificação':<12}{'bytes':>14}{'razão':>8}{'download':>11}{'descomp.':>10}{f'{banda:g} Mbit/s':>13}")
+        for codificacao, m in relatorio["codificacoes"].items():
+            print(f"  {m['content_encoding']:<12}{m['bytes']:>14,}{m['razao']:>8.3f}"
+                  f"{m['download_local_s'] * 1000:>9.0f}ms{m['descompactacao_s'] * 1000:>8.0f}ms"
+                  f"{m['estimado_no_link_s']:>12.2f}s")
+        t = relatorio["retomada"]
+        print(f"  retomada: {t['status_parcial']} + {t['status_resto']} ({t['content_range']}), "
+              f"conteúdo {'íntegro' if t['conteudo_integro'] else 'DIFERENTE'}; If-None-Match -> {t['status_if_none_match']}; "
+              f"If-Range antigo -> {t['status_if_range_antigo']}"
+              f"{' (arquivo inteiro)' if t['if_range_antigo_completo'] else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--competencias", type=int, default=12, help="Competências do relatório do SISAB.")
+    parser.add_argument("--tamanho-relatorio", type=int, default=2_000_000,
+                        help="Tamanho mínimo, em bytes, do relatório de cada competência no servidor de fixtures.")
+    parser.add_argument("--periodos", type=int, default=12, help="Períodos da tabela do TabNet.")
+    parser.add_argument("--municipios", type=int, default=5570, help="Municípios (linhas) da tabela do TabNet.")
+    parser.add_argument("--banda", type=float, default=20, help="Banda do link estimado, em Mbit/s.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo.")
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compara o CSV bruto do SISAB com os formatos tipados (csv, ndjson, parquet,
+arrow): tamanho do arquivo, tempo de conversão e tempo de leitura.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_formats.py [--competencias 12] [--repeticoes 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api_service.sisab_report import (
+    DELIMITER, ENCODING, FORMATOS, FormatUnavailableError, convert_report, parse_report, read_report,
+)
+
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE",
+       "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+TIPOS = ["Consulta agendada", "Consulta no dia", "Demanda espontânea", "Escuta inicial/orientação",
+         "Atendimento de urgência", "Consulta agendada programada/cuidado continuado"]
+MESES = ["JAN", "FEV", "MAR", "ABR", "MAI", "JUN", "JUL", "AGO", "SET", "OUT", "NOV", "DEZ"]
+
+
+def generate_report(path: str, competencias: int, municipios_por_uf: int):
+    """Gera um relatório sintético no mesmo layout do SISAB (preâmbulo, tabela e rodapé)."""
+    rng = random.Random(42)
+    with open(path, "w", encoding=ENCODING, newline="") as f:
+        f.write("Relatório de Produção - Atendimento Individual\n")
+        f.write("Tipo de produção: Atendimento individual\n\n")
+        f.write(DELIMITER.join(["Competencia", "Uf", "Municipio", *TIPOS, "Total"]) + "\n")
+        for c in range(competencias):
+            competencia = f"{MESES[c % 12]}/{2023 + c // 12}"
+            for uf in UFS:
+                for m in range(municipios_por_uf):
+                    valores = [rng.randint(0, 250_000) for _ in TIPOS]
+                    contagens = [f"{v:,}".replace(",", ".") for v in valores]
+                    total = f"{sum(valores):,}".replace(",", ".")
+                    f.write(DELIMITER.join([competencia, uf, f"Municipio {uf}-{m}", *contagens, total]) + "\n")
+        f.write("\nFonte: SISAB (dados sintéticos)\n")
+
+
+def read_formatted(path: str, formato: str):
+    if formato == "bruto":
+        return parse_report(read_report(path))
+    if formato == "csv":
+        import csv
+        with open(path, encoding="utf-8", newline="") as f:
+            return list(csv.DictReader(f, delimiter=DELIMITER))
+    if formato == "ndjson":
+        import json
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(linha) for linha in f]
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    if formato == "arrow":
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+
+def best_of(repeticoes: int, func, *args) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func(*args)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--competencias", type=int, default=12)
+    parser.add_argument("--municipios", type=int, default=20, help="Linhas por UF em cada competência.")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        bruto = os.path.join(pasta, "relatorio.csv")
+        generate_report(bruto, args.competencias, args.municipios)
+
+        print(f"{'formato':<10} {'tamanho (KiB)':>14} {'conversão (ms)':>15} {'leitura (ms)':>13}")
+        tamanho = os.path.getsize(bruto) / 1024
+        leitura = best_of(args.repeticoes, read_formatted, bruto, "bruto") * 1000
+        print(f"{'bruto':<10} {tamanho:>14.1f} {'-':>15} {leitura:>13.1f}")
+
+        for formato, (_, extensao) in FORMATOS.items():
+            saida = os.path.join(pasta, f"relatorio.tabela{extensao}")
+            try:
+                conversao = best_of(args.repeticoes, convert_report, bruto, formato, saida) * 1000
+            except FormatUnavailableError as e:
+                print(f"{formato:<10} indisponível: {e}")
+                continue
+            tamanho = os.path.getsize(saida) / 1024
+            leitura = best_of(args.repeticoes, read_formatted, saida, formato) * 1000
+            print(f"{formato:<10} {tamanho:>14.1f} {conversao:>15.1f} {leitura:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark do cache HTTP compartilhado das páginas dos portais.
+
+Sobe o servidor de fixtures e a API (com vários processos de crawl) e executa
+uma sequência de extrações do TabNet, cada uma com um período diferente (para
+não ser servida pelo cache de resultados). Toda extração começa pelo GET do
+formulário da base, que passa pelo cache HTTP. Cenários:
+
+- sem_cache: SISAB_HTTP_CACHE=0, o formulário é baixado em todo crawl;
+- cache: o formulário é baixado uma vez e servido pelo banco compartilhado
+  pelos processos enquanto estiver fresco;
+- revalidacao: SISAB_HTTP_CACHE_FRESH=0, toda extração revalida a página com
+  uma requisição condicional (304 do servidor);
+- revalidacao_sem_validadores: idem, contra um servidor que não envia ETag nem
+  Last-Modified: a página é baixada de novo e só a validação é renovada.
+
+Mede, em cada cenário, os GETs e os 304 recebidos pelo servidor, a duração
+média do GET do formulário (métrica 'get_inicial' da API), a duração das
+extrações e as estatísticas do cache em /saude.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_httpcache.py [--extracoes 12] [--workers 2] [--latencia 0.2] [--json resultado.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench_api import request, start_api, summarize, wait_until_ready
+from fixture_server import FixtureOptions, start_fixture_server
+
+CENARIOS = {
+    "sem_cache": {"env": {"SISAB_HTTP_CACHE": "0"}, "validadores": True},
+    "cache": {"env": {}, "validadores": True},
+    "revalidacao": {"env": {"SISAB_HTTP_CACHE_FRESH": "0"}, "validadores": True},
+    "revalidacao_sem_validadores": {"env": {"SISAB_HTTP_CACHE_FRESH": "0"}, "validadores": False},
+}
+
+
+def _fixture_stats(fixture) -> dict:
+    with urllib.request.urlopen(fixture.base_url + "/__stats") as resp:
+        return json.loads(resp.read())
+
+
+def _stage_metric(base_url: str, etapa: str) -> tuple[float, float]:
+    """(quantidade, soma em segundos) da etapa no histograma de /metrics."""
+    _, _, corpo = request(base_url, "GET", "/metrics")
+    quantidade = soma = 0.0
+    for linha in corpo.decode().splitlines():
+        if f'etapa="{etapa}"' not in linha:
+            continue
+        if linha.startswith("sisab_crawl_stage_duration_seconds_count"):
+            quantidade = float(linha.rsplit(" ", 1)[1])
+        elif linha.startswith("sisab_crawl_stage_duration_seconds_sum"):
+            soma = float(linha.rsplit(" ", 1)[1])
+    return quantidade, soma
+
+
+def run_scenario(cenario: dict, args) -> dict:
+    fixture = start_fixture_server(FixtureOptions(
+        latencia=args.latencia, municipios=args.municipios, validadores=cenario["validadores"],
+    ))
+    with tempfile.TemporaryDirectory(prefix="sisab-bench-") as pasta:
+        processo, base_url = start_api(pasta, fixture.sisab_url, args.workers, env_extra={
+            "SISAB_DATASUS_URL": fixture.tabnet_url, **cenario["env"],
+        })
+        try:
+            wait_until_ready(base_url, processo)
+            opcoes = json.loads(request(base_url, "GET", "/datasus/opcoes")[2])
+            periodos = [o["rotulo"] for o in opcoes["periodos"]][:args.extracoes]
+            antes = _fixture_stats(fixture)
+
+            duracoes = []
+            for periodo in periodos:
+                inicio = time.perf_counter()
+                status, _, corpo = request(base_url, "POST", "/datasus/extracao", {"periodos": [periodo]})
+                if status not in (200, 202):
+                    raise RuntimeError(f"/datasus/extracao respondeu {status}: {corpo[:200]!r}")
+                job = json.loads(corpo)
+                while job["status"] not in ("concluido", "erro"):
+                    time.sleep(0.02)
+                    job = json.loads(request(base_url, "GET", job["status_url"])[2])
+                if job["status"] == "erro":
+                    raise RuntimeError(f"A extração de {periodo} falhou: {job['erro']}")
+                duracoes.append(time.perf_counter() - inicio)
+
+            depois = _fixture_stats(fixture)
+            gets, soma_gets = _stage_metric(base_url, "get_inicial")
+            saude = json.loads(request(base_url, "GET", "/saude")[2])
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+            fixture.shutdown()
+            fixture.server_close()
+    return {
+        "extracoes": len(duracoes),
+        "gets_no_servidor": depois["gets"] - antes["gets"],
+        "respostas_304": depois["nao_modificados"] - antes["nao_modificados"],
+        "gets_baixados": gets,
+        "get_formulario_medio": soma_gets / gets if gets else None,
+        "duracao_extracao": summarize(duracoes),
+        "duracao_total": sum(duracoes),
+        "cache_upstream": saude["cache_upstream"],
+    }
+
+
+def run_benchmark(args) -> dict:
+    return {nome: run_scenario(cenario, args) for nome, cenario in CENARIOS.items()}
+
+
+def print_report(r: dict):
+    print(f"{'cenário':<30}{'GETs':>6}{'304':>6}{'GET médio':>11}{'extração p50':>14}{'total':>9}"
+          f"{'acertos':>9}{'inalterado':>12}")
+    for nome, c in r.items():
+        estatisticas = c["cache_upstream"]["estatisticas"]
+        acertos = estatisticas.get("hit", 0) + estatisticas.get("revalidate", 0)
+        get_medio = f"{c['get_formulario_medio'] * 1000:.0f}ms" if c["get_formulario_medio"] is not None else "-"
+        print(f"{nome:<30}{c['gets_no_servidor']:>6}{c['respostas_304']:>6}{get_medio:>11}"
+              f"{c['duracao_extracao']['p50'] * 1000:>12.0f}ms{c['duracao_total']:>8.1f}s"
+              f"{acertos:>9}{estatisticas.get('inalterado', 0):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--extracoes", type=int, default=12, help="Extrações do TabNet por cenário (uma por período).")
+    parser.add_argument("--workers", type=int, default=2, help="Processos do pool de crawl da API.")
+    parser.add_argument("--latencia", type=float, default=0.2,
+                        help="Espera do servidor de fixtures antes de cada resposta, em segundos.")
+    parser.add_argument("--municipios", type=int, default=100, help="Linhas das tabelas do TabNet por município.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo.")
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark dos perfis de execução sob demanda (parâmetro 'perfil' das extrações).
+
+Sobe o servidor de fixtures e a API com SISAB_PROFILING=1 e executa extrações
+do SISAB distintas (competência x estado, para não acertar o cache), alternando
+entre os cenários:
+
+- sem_perfil: o caminho normal; o único custo do recurso desativado é
+  verificar, por job, se 'perfil' foi pedido;
+- cpu: '?perfil=cpu' (cProfile na thread do job da API e no reactor do worker);
+- cpu_memoria: '?perfil=cpu,memoria' (também tracemalloc nos dois processos).
+
+Mede a duração das extrações (do pedido ao job concluído) em cada cenário e,
+das extrações com perfil, o tamanho dos arquivos gravados e o resumo de
+/extracoes/{job_id}/perfil: o tempo próprio por categoria (espera de rede,
+parsing, gravação...) na API e no worker e o pico de memória.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_profiling.py [--extracoes 8] [--workers 2] [--json resultado.json]
+        [opções do servidor de fixtures, ex.: --latencia-relatorio 0.3 --tamanho-relatorio 2000000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench_api import request, start_api, summarize, unique_requests, wait_until_ready
+from fixture_server import add_fixture_arguments, fixture_options_from_args, start_fixture_server
+
+CENARIOS = {"sem_perfil": None, "cpu": "cpu", "cpu_memoria": "cpu,memoria"}
+
+
+def run_extraction(base_url: str, pedido: dict, perfil: str, timeout: float = 300) -> tuple[float, dict]:
+    caminho = "/iniciar-extracao" + (f"?perfil={perfil}" if perfil else "")
+    inicio = time.perf_counter()
+    status, _, corpo = request(base_url, "POST", caminho, pedido)
+    if status not in (200, 202):
+        raise RuntimeError(f"{caminho} respondeu {status}: {corpo[:200]!r}")
+    job = json.loads(corpo)
+    while job["status"] not in ("concluido", "erro"):
+        if time.perf_counter() - inicio > timeout:
+            raise TimeoutError(f"O job {job['job_id']} não terminou em {timeout}s.")
+        time.sleep(0.02)
+        job = json.loads(request(base_url, "GET", job["status_url"])[2])
+    if job["status"] == "erro":
+        raise RuntimeError(f"O job {job['job_id']} falhou: {job['erro']}")
+    return time.perf_counter() - inicio, job
+
+
+def profile_summary(base_url: str, job: dict) -> dict:
+    status, _, corpo = request(base_url, "GET", job["perfil_url"])
+    if status != 200:
+        raise RuntimeError(f"{job['perfil_url']} respondeu {status}: {corpo[:200]!r}")
+    bytes_arquivos = 0
+    for perfil in json.loads(corpo)["perfis"]:
+        for arquivo in perfil["arquivos"]:
+            status, _, conteudo = request(base_url, "GET", arquivo["url"])
+            if status != 200:
+                raise RuntimeError(f"{arquivo['url']} respondeu {status}.")
+            bytes_arquivos += len(conteudo)
+    return {"perfis": json.loads(corpo)["perfis"], "bytes_arquivos": bytes_arquivos}
+
+
+def run_benchmark(args) -> dict:
+    fixture = start_fixture_server(fixture_options_from_args(args))
+    duracoes = {nome: [] for nome in CENARIOS}
+    resumos = {nome: [] for nome in CENARIOS if CENARIOS[nome]}
+    with tempfile.TemporaryDirectory(prefix="sisab-bench-") as pasta:
+        processo, base_url = start_api(pasta, fixture.sisab_url, args.workers, env_extra={"SISAB_PROFILING": "1"})
+        try:
+            wait_until_ready(base_url, processo)
+            datas = json.loads(request(base_url, "GET", "/date-finder")[2])["datas_disponiveis"]
+            pedidos = unique_requests(datas)
+            # Um crawl de aquecimento (sessões, imports) fora das medições.
+            run_extraction(base_url, next(pedidos), None)
+            for _ in range(args.extracoes):
+                for nome, perfil in CENARIOS.items():
+                    duracao, job = run_extraction(base_url, next(pedidos), perfil)
+                    duracoes[nome].append(duracao)
+                    if perfil:
+                        resumos[nome].append(profile_summary(base_url, job))
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+            fixture.shutdown()
+            fixture.server_close()
+    return {
+        "parametros": vars(args),
+        "cenarios": {
+            nome: {
+                "duracao_extracao": summarize(duracoes[nome]),
+                "bytes_arquivos_perfil": summarize([r["bytes_arquivos"] for r in resumos[nome]]) if nome in resumos else None,
+                "ultimo_perfil": resumos[nome][-1]["perfis"] if nome in resumos else None,
+            }
+            for nome in CENARIOS
+        },
+    }
+
+
+def print_report(r: dict):
+    base = r["cenarios"]["sem_perfil"]["duracao_extracao"]["p50"]
+    print(f"{'cenário':<14}{'extração p50':>14}{'p95':>10}{'custo':>9}{'arquivos (p50)':>16}")
+    for nome, c in r["cenarios"].items():
+        d = c["duracao_extracao"]
+        arquivos = f"{c['bytes_arquivos_perfil']['p50'] / 1024:.0f} KiB" if c["bytes_arquivos_perfil"] else "-"
+        print(f"{nome:<14}{d['p50'] * 1000:>12.0f}ms{d['p95'] * 1000:>8.0f}ms{d['p50'] / base - 1:>+9.0%}{arquivos:>16}")
+    for nome in ("cpu", "cpu_memoria"):
+        print(f"\nÚltimo perfil ({nome}):")
+        for perfil in r["cenarios"][nome]["ultimo_perfil"]:
+            linha = f"  {perfil['origem']:<7}{perfil['duracao_s'] * 1000:>7.0f}ms"
+            if "cpu" in perfil:
+                categorias = ", ".join(f"{categoria} {segundos * 1000:.0f}ms"
+                                       for categoria, segundos in perfil["cpu"]["categorias_s"].items() if segundos >= 0.0005)
+                linha += f"  {categorias}"
+            if "memoria" in perfil:
+                linha += f"  pico de memória {perfil['memoria']['pico_bytes'] / 2 ** 20:.1f} MiB"
+            print(linha)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--extracoes", type=int, default=8, help="Extrações por cenário.")
+    parser.add_argument("--workers", type=int, default=2, help="Processos do pool de crawl da API.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo.")
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
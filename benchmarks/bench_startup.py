@@ -0,0 +1,188 @@
+"""
+Benchmark da inicialização a frio da API (sem rede), para deploys que
+escalam a partir de zero.
+
+Mede, em cada cenário:
+
+- import: tempo de 'import api_service.main' em um interpretador novo, o RSS
+  logo depois e se o Scrapy/Twisted foram carregados no processo da API;
+- pronta: tempo desde o início do processo do uvicorn até a primeira resposta
+  de /saude;
+- memória: RSS da API e total (API + processos de crawl) com a API ociosa,
+  alguns segundos depois de pronta;
+- primeira extração: tempo da primeira chamada a /date-finder (um crawl),
+  que no pool sob demanda inclui subir o processo de crawl.
+
+Cenários:
+- crawler_importado: o processo da API importa o código de crawl (Scrapy,
+  Twisted, spiders) antes de subir, como fazia antes da separação;
+- padrao: a API sem o código de crawl, com o pool iniciado junto;
+- pool_sob_demanda: idem, com SISAB_CRAWL_LAZY_START=1.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_startup.py [--repeticoes 3] [--workers 2] [--espera 3] [--json resultado.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench_api import RAIZ, _descendants, _free_port, _rss, request
+from fixture_server import FixtureOptions, start_fixture_server
+
+MODULOS_CRAWL = ("scrapy", "twisted", "crochet", "lxml", "parsel")
+
+# Mede o import da API em um interpretador novo e imprime o resultado em JSON.
+_SCRIPT_IMPORT = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+{preload}
+import api_service.main
+duracao = time.perf_counter() - inicio
+with open("/proc/self/status") as f:
+    rss = next(int(l.split()[1]) * 1024 for l in f if l.startswith("VmRSS:"))
+print(json.dumps({{"segundos": duracao, "rss": rss, "modulos": [m for m in {modulos!r} if m in sys.modules]}}))
+"""
+
+# Sobe a API com o uvicorn, opcionalmente importando antes o código de crawl.
+_SCRIPT_API = """
+import sys
+{preload}
+import uvicorn
+uvicorn.run("api_service.main:app", host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+PRELOAD_CRAWLER = "import api_service.crawl_worker"
+
+CENARIOS = {
+    "crawler_importado": {"preload": PRELOAD_CRAWLER, "env": {}},
+    "padrao": {"preload": "", "env": {}},
+    "pool_sob_demanda": {"preload": "", "env": {"SISAB_CRAWL_LAZY_START": "1"}},
+}
+
+
+def measure_import(preload: str) -> dict:
+    saida = subprocess.run(
+        [sys.executable, "-c", _SCRIPT_IMPORT.format(preload=preload, modulos=MODULOS_CRAWL)],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def measure_startup(cenario: dict, sisab_url: str, workers: int, espera: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="sisab-bench-") as pasta:
+        porta = _free_port()
+        env = dict(
+            os.environ,
+            SISAB_URL=sisab_url,
+            SISAB_DATA_DIR=pasta,
+            SISAB_MAX_JOBS=str(workers),
+            SISAB_CRAWL_WORKERS=str(workers),
+            SISAB_HARVEST_INTERVAL="0",
+            **cenario["env"],
+        )
+        base_url = f"http://127.0.0.1:{porta}"
+        inicio = time.perf_counter()
+        processo = subprocess.Popen(
+            [sys.executable, "-c", _SCRIPT_API.format(preload=cenario["preload"]), str(porta)],
+            cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(pasta, "api.log"), "wb"),
+        )
+        try:
+            while True:
+                if processo.poll() is not None:
+                    raise RuntimeError("A API terminou durante a inicialização.")
+                try:
+                    if request(base_url, "GET", "/saude", timeout=2)[0] == 200:
+                        break
+                except OSError:
+                    pass
+                if time.perf_counter() - inicio > 120:
+                    raise TimeoutError("A API não respondeu a tempo.")
+                time.sleep(0.01)
+            pronta = time.perf_counter() - inicio
+
+            # Memória com a API ociosa, depois que os workers (se houver) terminaram de subir.
+            time.sleep(espera)
+            processos = _descendants(processo.pid)
+            rss_api = _rss(processo.pid)
+            rss_total = sum(_rss(p) for p in processos)
+
+            inicio = time.perf_counter()
+            status, _, corpo = request(base_url, "GET", "/date-finder", timeout=120)
+            if status != 200:
+                raise RuntimeError(f"/date-finder respondeu {status}: {corpo[:200]!r}")
+            primeira_extracao = time.perf_counter() - inicio
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+    return {
+        "pronta": pronta,
+        "processos": len(processos),
+        "rss_api": rss_api,
+        "rss_total": rss_total,
+        "primeira_extracao": primeira_extracao,
+    }
+
+
+def run_benchmark(args) -> dict:
+    fixture = start_fixture_server(FixtureOptions())
+    resultados = {}
+    try:
+        for nome, cenario in CENARIOS.items():
+            importacoes = [measure_import(cenario["preload"]) for _ in range(args.repeticoes)]
+            inicios = [measure_startup(cenario, fixture.sisab_url, args.workers, args.espera)
+                       for _ in range(args.repeticoes)]
+            mediana = lambda medidas, campo: statistics.median(m[campo] for m in medidas)
+            resultados[nome] = {
+                "import_segundos": mediana(importacoes, "segundos"),
+                "import_rss": mediana(importacoes, "rss"),
+                "modulos_de_crawl_na_api": importacoes[-1]["modulos"],
+                **{campo: mediana(inicios, campo)
+                   for campo in ("pronta", "processos", "rss_api", "rss_total", "primeira_extracao")},
+            }
+    finally:
+        fixture.shutdown()
+        fixture.server_close()
+    return resultados
+
+
+def print_report(r: dict):
+    print(f"{'cenário':<20}{'import':>10}{'RSS import':>12}{'pronta':>10}{'processos':>10}"
+          f"{'RSS API':>10}{'RSS total':>11}{'1ª extração':>13}")
+    for nome, c in r.items():
+        print(f"{nome:<20}{c['import_segundos'] * 1000:>8.0f}ms{c['import_rss'] / 2 ** 20:>9.1f}MiB"
+              f"{c['pronta'] * 1000:>8.0f}ms{c['processos']:>10.0f}{c['rss_api'] / 2 ** 20:>7.1f}MiB"
+              f"{c['rss_total'] / 2 ** 20:>8.1f}MiB{c['primeira_extracao'] * 1000:>11.0f}ms")
+    for nome, c in r.items():
+        if c["modulos_de_crawl_na_api"]:
+            print(f"{nome}: a API carrega {', '.join(c['modulos_de_crawl_na_api'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=3, help="Medições por cenário (é usada a mediana).")
+    parser.add_argument("--workers", type=int, default=2, help="Processos do pool de crawl da API.")
+    parser.add_argument("--espera", type=float, default=3.0,
+                        help="Segundos entre a API ficar pronta e a medição de memória.")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo.")
+    args = parser.parse_args()
+
+    resultados = run_benchmark(args)
+    print_report(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""
+Servidor local que reproduz as páginas do SISAB e do DATASUS gravadas em
+benchmarks/fixtures, para testar os spiders e medir a API sem acesso à rede.
+
+- GET  .../RelSauProducao.xhtml: página de relatórios do SISAB; cada GET abre
+  uma sessão nova (cookie JSESSIONID + javax.faces.ViewState).
+- POST .../RelSauProducao.xhtml: gera o CSV do relatório para as competências
+  e estados enviados. Como o portal, responde com a página HTML (e não com o
+  CSV) quando a sessão ou o ViewState não são válidos.
+- GET  /cgi/deftohtm.exe?sih/cnv/nibr.def: formulário do TabNet (DATASUS),
+  com ETag e Last-Modified; requisições condicionais recebem 304.
+- POST /cgi/tabcgi.exe?sih/cnv/nibr.def: página de resultado do TabNet para a
+  linha, coluna, conteúdos e período escolhidos, com a tabela em '<pre>'
+  (formato 'prn') ou em '<table>' (formato 'table') e o link para o CSV em
+  /csv/<arquivo>.csv.
+- GET  /__stats: contadores de requisições, sessões e bytes enviados.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/fixture_server.py [--porta 8765] [--latencia 0.05] [--latencia-relatorio 0.3]
+        [--tamanho-relatorio 1048576] [--taxa-transferencia 0] [--sessao-max-usos 0] [--falha-a-cada 0]
+        [--municipios 5570] [--sem-validadores]
+
+Em seguida, inicie a API apontando para ele:
+    SISAB_URL=http://127.0.0.1:8765/paginas/acessoRestrito/relatorio/federal/saude/RelSauProducao.xhtml
+"""
+import argparse
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from email.utils import formatdate
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CAMINHO_SISAB = "/paginas/acessoRestrito/relatorio/federal/saude/RelSauProducao.xhtml"
+CAMINHO_TABNET = "/cgi/deftohtm.exe?sih/cnv/nibr.def"
+
+# Codificação usada pelos dois portais nos relatórios e no TabNet.
+ENCODING = "latin-1"
+TAMANHO_BLOCO = 64 * 1024
+
+
+@dataclass
+class FixtureOptions:
+    """
+    Comportamento do servidor:
+    - latencia: espera, em segundos, antes de responder a qualquer requisição.
+    - latencia_relatorio: tempo extra para "gerar" um relatório (POST do SISAB).
+    - tamanho_relatorio: tamanho mínimo, em bytes, do CSV do SISAB; as linhas
+      da tabela são repetidas até atingi-lo (0 = o relatório gravado).
+    - taxa_transferencia: limite de envio dos relatórios, em bytes/s (0 = sem limite).
+    - sessao_max_usos: relatórios gerados por sessão antes de ela expirar (0 = sem limite).
+    - falha_a_cada: a cada N requisições, uma responde 503 (0 = nunca).
+    - municipios: linhas das tabelas do TabNet por município.
+    - validadores: envia ETag/Last-Modified no formulário do TabNet e responde
+      304 às requisições condicionais (False simula um servidor sem validadores).
+    """
+    latencia: float = 0.0
+    latencia_relatorio: float = 0.0
+    tamanho_relatorio: int = 0
+    taxa_transferencia: int = 0
+    sessao_max_usos: int = 0
+    falha_a_cada: int = 0
+    municipios: int = 5570
+    validadores: bool = True
+
+
+def _read_fixture(*partes: str, encoding: str = "utf-8") -> str:
+    with open(os.path.join(FIXTURES_DIR, *partes), encoding=encoding, newline="") as f:
+        return f.read()
+
+
+class SisabReport:
+    """O relatório CSV gravado, separado em preâmbulo, linhas por UF e rodapé."""
+
+    def __init__(self, conteudo: str):
+        linhas = conteudo.splitlines()
+        inicio = next(i for i, linha in enumerate(linhas) if linha.startswith("Uf;"))
+        fim = next(i for i in range(inicio + 1, len(linhas)) if not linhas[i].strip(";"))
+        self.preambulo = linhas[:inicio + 1]
+        self.linhas = {linha.split(";", 1)[0]: linha for linha in linhas[inicio + 1:fim]}
+        self.rodape = linhas[fim:]
+
+    def render(self, competencias: list, estados: list, tamanho_minimo: int = 0) -> bytes:
+        cabecalho = "\r\n".join(self.preambulo).replace("__COMPETENCIAS__", ", ".join(competencias)) + "\r\n"
+        rodape = "\r\n".join(self.rodape) + "\r\n"
+        tabela = [self.linhas[uf] for uf in (estados or self.linhas) if uf in self.linhas]
+        corpo = "".join(f"{linha}\r\n" for linha in tabela)
+        repeticoes = 1
+        if tamanho_minimo and corpo:
+            repeticoes = max(1, -(-(tamanho_minimo - len(cabecalho) - len(rodape)) // len(corpo)))
+        return (cabecalho + corpo * repeticoes + rodape).encode(ENCODING)
+
+
+# --- TabNet ---
+# As tabelas do TabNet são geradas a partir das opções escolhidas no formulário,
+# com valores determinísticos para cada combinação de período, linha e coluna.
+
+REGIOES = ["1 Região Norte", "2 Região Nordeste", "3 Região Sudeste", "4 Região Sul", "5 Região Centro-Oeste"]
+UFS_TABNET = [
+    "11 Rondônia", "12 Acre", "13 Amazonas", "14 Roraima", "15 Pará", "16 Amapá", "17 Tocantins",
+    "21 Maranhão", "22 Piauí", "23 Ceará", "24 Rio Grande do Norte", "25 Paraíba", "26 Pernambuco",
+    "27 Alagoas", "28 Sergipe", "29 Bahia", "31 Minas Gerais", "32 Espírito Santo", "33 Rio de Janeiro",
+    "35 São Paulo", "41 Paraná", "42 Santa Catarina", "43 Rio Grande do Sul", "50 Mato Grosso do Sul",
+    "51 Mato Grosso", "52 Goiás", "53 Distrito Federal",
+]
+CARATER_ATENDIMENTO = ["Eletivo", "Urgência", "Acidente no local trabalho", "Acidente no trajeto trabalho",
+                       "Outros tipo acidente trânsito", "Outros tipo lesões/envenenamentos"]
+MESES_TABNET = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+SEM_COLUNA = "--Não-Ativa--"
+
+
+def _rotulo(valor: str) -> str:
+    return valor.replace("_", " ")
+
+
+def _periodo(arquivo: str) -> tuple[int, int]:
+    """'nibr2508.dbf' -> (2025, 8)."""
+    codigo = arquivo[4:8]
+    return 2000 + int(codigo[:2]), int(codigo[2:])
+
+
+def tabnet_rows(linha: str, municipios: int) -> list:
+    if linha == "Unidade_da_Federação":
+        return UFS_TABNET
+    if linha == "Município":
+        return [f"{UFS_TABNET[i % len(UFS_TABNET)][:2]}{i:04d} Município {i}" for i in range(municipios)]
+    return REGIOES
+
+
+def tabnet_columns(coluna: str, incrementos: list, arquivo: str) -> list:
+    if coluna == "Ano_processamento":
+        return [str(_periodo(arquivo)[0])]
+    if coluna == "Mês_processamento":
+        ano, mes = _periodo(arquivo)
+        return [f"{ano}/{MESES_TABNET[mes - 1]}"]
+    if coluna == "Caráter_atendimento":
+        return CARATER_ATENDIMENTO
+    return [_rotulo(incremento) for incremento in incrementos]
+
+
+def tabnet_value(*partes: str) -> int:
+    valor = zlib.crc32("|".join(partes).encode()) % 20000
+    # O TabNet mostra '-' nas células sem registros.
+    return 0 if valor < 1500 else valor
+
+
+def format_tabnet_value(valor, milhar: bool) -> str:
+    if not valor:
+        return "-"
+    if isinstance(valor, float):
+        texto = f"{valor:,.2f}" if milhar else f"{valor:.2f}"
+        return texto.replace(",", "#").replace(".", ",").replace("#", ".")
+    return f"{valor:,}".replace(",", ".") if milhar else str(valor)
+
+
+class FixtureState:
+    """Sessões abertas e contadores, compartilhados entre as threads do servidor."""
+
+    def __init__(self, opcoes: FixtureOptions):
+        self.opcoes = opcoes
+        self.pagina_sisab = _read_fixture("sisab", "RelSauProducao.xhtml")
+        self.relatorio_sisab = SisabReport(_read_fixture("sisab", "relatorio.csv", encoding=ENCODING))
+        self.formulario_tabnet = _read_fixture("datasus", "nibr.def.html", encoding=ENCODING)
+        self.resultado_tabnet = _read_fixture("datasus", "resultado.html", encoding=ENCODING)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._sessoes: dict[str, dict] = {}
+        self._tabnet: dict[str, str] = {}
+        self.stats = {
+            "gets": 0, "posts": 0, "sessoes_abertas": 0, "relatorios": 0,
+            "sessoes_invalidas": 0, "falhas_injetadas": 0, "bytes_enviados": 0, "nao_modificados": 0,
+        }
+        self.formulario_tabnet_etag = f'"{zlib.crc32(self.formulario_tabnet.encode(ENCODING)):08x}"'
+        self.formulario_tabnet_data = formatdate(time.time(), usegmt=True)
+
+    def count(self, nome: str, valor: int = 1):
+        with self._lock:
+            self.stats[nome] += valor
+
+    def should_fail(self) -> bool:
+        """Decide se a requisição atual recebe um 503 (injeção de falhas)."""
+        with self._lock:
+            total = self.stats["gets"] + self.stats["posts"]
+            if self.opcoes.falha_a_cada and total % self.opcoes.falha_a_cada == 0:
+                self.stats["falhas_injetadas"] += 1
+                return True
+        return False
+
+    def open_session(self) -> tuple[str, str]:
+        with self._lock:
+            sessao_id = f"{next(self._ids):06d}{secrets.token_hex(8)}"
+            viewstate = f"{secrets.randbelow(10 ** 18)}:{secrets.randbelow(10 ** 18)}"
+            self._sessoes[sessao_id] = {"viewstate": viewstate, "usos": 0}
+            self.stats["sessoes_abertas"] += 1
+        return sessao_id, viewstate
+
+    def use_session(self, sessao_id: str, viewstate: str) -> bool:
+        """Valida a sessão e o ViewState de um POST e conta mais um uso."""
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None or sessao["viewstate"] != viewstate:
+                return False
+            limite = self.opcoes.sessao_max_usos
+            if limite and sessao["usos"] >= limite:
+                del self._sessoes[sessao_id]
+                return False
+            sessao["usos"] += 1
+            return True
+
+    def store_tabnet_csv(self, conteudo: str) -> str:
+        with self._lock:
+            nome = f"A{next(self._ids):06d}.csv"
+            self._tabnet[nome] = conteudo
+        return nome
+
+    def tabnet_csv(self, nome: str):
+        with self._lock:
+            return self._tabnet.get(nome)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = "Apache-Coyote/1.1"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> FixtureState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- Respostas ---
+
+    def _send(self, status: int, corpo: bytes = b"", content_type: str = "text/html;charset=UTF-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self._write(corpo)
+
+    def _write(self, corpo: bytes):
+        """Envia o corpo em blocos, respeitando a taxa de transferência configurada."""
+        taxa = self.state.opcoes.taxa_transferencia
+        for inicio in range(0, len(corpo), TAMANHO_BLOCO):
+            bloco = corpo[inicio:inicio + TAMANHO_BLOCO]
+            self.wfile.write(bloco)
+            self.wfile.flush()
+            self.state.count("bytes_enviados", len(bloco))
+            if taxa:
+                time.sleep(len(bloco) / taxa)
+
+    def _read_form(self) -> dict:
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        return parse_qs(self.rfile.read(tamanho).decode(ENCODING), keep_blank_values=True, encoding=ENCODING)
+
+    def _start(self, metodo: str) -> bool:
+        """Contagem, latência e injeção de falhas comuns a todas as rotas."""
+        self.state.count(metodo)
+        if self.state.opcoes.latencia:
+            time.sleep(self.state.opcoes.latencia)
+        if self.state.should_fail():
+            if metodo == "posts":
+                self._read_form()
+            self._send(503, b"<html><body>Servico indisponivel</body></html>")
+            return False
+        return True
+
+    # --- Rotas ---
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/__stats":
+            with self.state._lock:
+                corpo = json.dumps(self.state.stats).encode()
+            self._send(200, corpo, "application/json")
+            return
+        if not self._start("gets"):
+            return
+
+        if url.path.endswith("/RelSauProducao.xhtml"):
+            sessao_id, viewstate = self.state.open_session()
+            pagina = self.state.pagina_sisab.replace("__VIEWSTATE__", viewstate)
+            self._send(200, pagina.encode(), headers={
+                "Set-Cookie": f"JSESSIONID={sessao_id}; Path=/; HttpOnly",
+            })
+        elif url.path == "/cgi/deftohtm.exe":
+            self._get_tabnet_form()
+        elif url.path.startswith("/csv/"):
+            conteudo = self.state.tabnet_csv(url.path[len("/csv/"):])
+            if conteudo is None:
+                self._send(404, b"<html><body>Arquivo nao encontrado</body></html>")
+            else:
+                self._send(200, conteudo.encode(ENCODING), "text/csv; charset=ISO-8859-1")
+        else:
+            self._send(404, b"<html><body>Pagina nao encontrada</body></html>")
+
+    def _get_tabnet_form(self):
+        state = self.state
+        if not state.opcoes.validadores:
+            self._send(200, state.formulario_tabnet.encode(ENCODING), "text/html; charset=ISO-8859-1")
+            return
+        validadores = {"ETag": state.formulario_tabnet_etag, "Last-Modified": state.formulario_tabnet_data}
+        if_none_match = self.headers.get("If-None-Match")
+        if (if_none_match == state.formulario_tabnet_etag
+                or (if_none_match is None and self.headers.get("If-Modified-Since") == state.formulario_tabnet_data)):
+            state.count("nao_modificados")
+            self._send(304, content_type="text/html; charset=ISO-8859-1", headers=validadores)
+            return
+        self._send(200, state.formulario_tabnet.encode(ENCODING), "text/html; charset=ISO-8859-1", headers=validadores)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if not self._start("posts"):
+            return
+        form = self._read_form()
+
+        if url.path.endswith("/RelSauProducao.xhtml"):
+            self._post_sisab(form)
+        elif url.path == "/cgi/tabcgi.exe":
+            self._post_tabnet(form)
+        else:
+            self._send(404, b"<html><body>Pagina nao encontrada</body></html>")
+
+    def _post_sisab(self, form: dict):
+        cookies = SimpleCookie(self.headers.get("Cookie", ""))
+        sessao_id = cookies["JSESSIONID"].value if "JSESSIONID" in cookies else ""
+        viewstate = form.get("javax.faces.ViewState", [""])[0]
+        if not self.state.use_session(sessao_id, viewstate):
+            # O portal devolve a própria página quando a sessão expirou.
+            self.state.count("sessoes_invalidas")
+            pagina = self.state.pagina_sisab.replace("__VIEWSTATE__", "")
+            self._send(200, pagina.encode())
+            return
+
+        if self.state.opcoes.latencia_relatorio:
+            time.sleep(self.state.opcoes.latencia_relatorio)
+        corpo = self.state.relatorio_sisab.render(
+            form.get("j_idt76", []), form.get("estados", []), self.state.opcoes.tamanho_relatorio,
+        )
+        self.state.count("relatorios")
+        self._send(200, corpo, "text/csv;charset=ISO-8859-1", headers={
+            "Content-Disposition": 'attachment; filename="relatorio.csv"',
+        })
+
+    def _post_tabnet(self, form: dict):
+        linha = form.get("Linha", ["Região"])[0]
+        coluna = form.get("Coluna", [SEM_COLUNA])[0]
+        incrementos = form.get("Incremento") or ["Internações"]
+        arquivos = form.get("Arquivos") or []
+        if not arquivos:
+            self._send(200, "<html><body>Selecione pelo menos um período.</body></html>".encode(ENCODING),
+                       "text/html; charset=ISO-8859-1")
+            return
+        if self.state.opcoes.latencia_relatorio:
+            time.sleep(self.state.opcoes.latencia_relatorio)
+
+        colunas = tabnet_columns(coluna, incrementos, arquivos[0])
+        cabecalho = [_rotulo(linha), *colunas, "Total"]
+        decimal = any(incremento.startswith("Valor") for incremento in incrementos)
+        linhas = []
+        totais = [0] * (len(colunas) + 1)
+        for rotulo in tabnet_rows(linha, self.state.opcoes.municipios):
+            valores = [
+                sum(tabnet_value(arquivo, rotulo, nome, *incrementos) for arquivo in arquivos)
+                for nome in colunas
+            ]
+            if decimal:
+                valores = [v * 3.37 for v in valores]
+            valores.append(sum(valores))
+            totais = [t + v for t, v in zip(totais, valores)]
+            linhas.append((rotulo, valores))
+        linhas.append(("Total", totais))
+
+        periodo = ", ".join(arquivos)
+        titulo = f"{', '.join(_rotulo(i) for i in incrementos)} por {_rotulo(linha)}"
+        if coluna != SEM_COLUNA:
+            titulo += f" e {_rotulo(coluna)}"
+        prn = [";".join(f'"{c}"' for c in cabecalho)]
+        prn += [f'"{rotulo}";' + ";".join(format_tabnet_value(v, False) for v in valores) for rotulo, valores in linhas]
+        nome = self.state.store_tabnet_csv("\r\n".join([f'"{titulo}"', f'"Período:{periodo}"', *prn]) + "\r\n")
+
+        if form.get("formato", ["table"])[0] == "prn":
+            tabela = "<PRE>\n" + "\n".join(prn) + "\n</PRE>"
+        else:
+            tabela = "\n".join([
+                '<table class="tabdados" border="1">',
+                "<tr>" + "".join(f"<th>{c}</th>" for c in cabecalho) + "</tr>",
+                *(
+                    f'<tr><td class="linha">{rotulo}</td>'
+                    + "".join(f"<td>{format_tabnet_value(v, True)}</td>" for v in valores) + "</tr>"
+                    for rotulo, valores in linhas
+                ),
+                "</table>",
+            ])
+        pagina = (
+            self.state.resultado_tabnet
+            .replace("__TITULO__", titulo)
+            .replace("__PERIODO__", periodo)
+            .replace("__TABELA__", tabela)
+            .replace("__ARQUIVO_CSV__", nome)
+        )
+        self._send(200, pagina.encode(ENCODING, errors="replace"), "text/html; charset=ISO-8859-1")
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco: tuple, opcoes: FixtureOptions):
+        super().__init__(endereco, FixtureHandler)
+        self.state = FixtureState(opcoes)
+
+    @property
+    def base_url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    @property
+    def sisab_url(self) -> str:
+        return self.base_url + CAMINHO_SISAB
+
+    @property
+    def tabnet_url(self) -> str:
+        return self.base_url + CAMINHO_TABNET
+
+
+def start_fixture_server(opcoes: FixtureOptions = None, host: str = "127.0.0.1", porta: int = 0) -> FixtureServer:
+    """Inicia o servidor em uma thread (porta 0 = porta livre) e o retorna."""
+    server = FixtureServer((host, porta), opcoes or FixtureOptions())
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server
+
+
+def add_fixture_arguments(parser: argparse.ArgumentParser):
+    """Opções de FixtureOptions na linha de comando (usadas também pelos benchmarks)."""
+    parser.add_argument("--latencia", type=float, default=0.0, help="Espera antes de cada resposta, em segundos.")
+    parser.add_argument("--latencia-relatorio", type=float, default=0.3,
+                        help="Tempo para gerar cada relatório do SISAB, em segundos.")
+    parser.add_argument("--tamanho-relatorio", type=int, default=0,
+                        help="Tamanho mínimo dos relatórios do SISAB, em bytes.")
+    parser.add_argument("--taxa-transferencia", type=int, default=0,
+                        help="Velocidade de envio dos relatórios, em bytes/s (0 = sem limite).")
+    parser.add_argument("--sessao-max-usos", type=int, default=0,
+                        help="Relatórios por sessão antes de ela expirar (0 = sem limite).")
+    parser.add_argument("--falha-a-cada", type=int, default=0,
+                        help="Responde 503 a cada N requisições (0 = nunca).")
+    parser.add_argument("--municipios", type=int, default=5570,
+                        help="Linhas das tabelas do TabNet por município.")
+    parser.add_argument("--sem-validadores", action="store_true",
+                        help="Não envia ETag/Last-Modified no formulário do TabNet (nem responde 304).")
+
+
+def fixture_options_from_args(args: argparse.Namespace) -> FixtureOptions:
+    return FixtureOptions(
+        latencia=args.latencia,
+        latencia_relatorio=args.latencia_relatorio,
+        tamanho_relatorio=args.tamanho_relatorio,
+        taxa_transferencia=args.taxa_transferencia,
+        sessao_max_usos=args.sessao_max_usos,
+        falha_a_cada=args.falha_a_cada,
+        municipios=args.municipios,
+        validadores=not args.sem_validadores,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+
+    server = FixtureServer((args.host, args.porta), fixture_options_from_args(args))
+    print(f"SISAB:  {server.sisab_url}")
+    print(f"TabNet: {server.tabnet_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
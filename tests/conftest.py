@@ -0,0 +1,64 @@
+"""
+Fixtures dos testes: o servidor local que simula o SISAB e o TabNet
+(benchmarks/fixture_server.py) e a API, no mesmo processo, com o estado em uma
+pasta temporária e um único processo de crawl.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+# A configuração é lida no import de api_service.config: as variáveis são
+# definidas antes de qualquer teste importar a API.
+PASTA_DADOS = tempfile.mkdtemp(prefix="sisab-testes-")
+os.environ.update(
+    SISAB_DATA_DIR=PASTA_DADOS,
+    SISAB_MAX_JOBS="1",
+    SISAB_CRAWL_WORKERS="1",
+    SISAB_HARVEST_INTERVAL="0",
+    SISAB_CLIENT_RATE_PER_MINUTE="0",
+    SISAB_MAX_QUEUED_JOBS="0",
+)
+
+import pytest
+
+from fixture_server import FixtureOptions, start_fixture_server
+
+RELATORIO = os.path.join(RAIZ, "benchmarks", "fixtures", "sisab", "relatorio.csv")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(PASTA_DADOS, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def fixture_server():
+    servidor = start_fixture_server(FixtureOptions(municipios=50))
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture(scope="session")
+def api(fixture_server):
+    """Cliente HTTP da API (com o lifespan: pool de crawl, jobs e caches)."""
+    from fastapi.testclient import TestClient
+    from api_service import config, main
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(config, "SISAB_URL", fixture_server.sisab_url)
+        mp.setattr(config, "DATASUS_URL", fixture_server.tabnet_url)
+        with TestClient(main.app) as client:
+            yield client
+
+
+@pytest.fixture
+def relatorio(tmp_path) -> str:
+    """Cópia do relatório gravado nas fixtures (HarvestStore.add move o arquivo recebido)."""
+    copia = tmp_path / "relatorio.csv"
+    shutil.copyfile(RELATORIO, copia)
+    return str(copia)
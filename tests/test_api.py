@@ -0,0 +1,224 @@
+"""
+Testes de ponta a ponta: a API no mesmo processo (ver conftest.py), com os
+crawls feitos no servidor de fixtures.
+"""
+import io
+import itertools
+import time
+
+import pytest
+
+from api_service.admission import ClientQuotas
+
+# Cada extração usa um conjunto de estados diferente, para não acertar o cache
+# de resultados de outro teste.
+_ESTADOS = itertools.combinations(["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO"], 2)
+
+
+def pedido_unico() -> dict:
+    return {"datas": ["202401"], "filtros": {"estados": list(next(_ESTADOS))}}
+
+
+def aguarda(api, job: dict, timeout: float = 60) -> dict:
+    inicio = time.monotonic()
+    while job["status"] not in ("concluido", "erro"):
+        assert time.monotonic() - inicio < timeout, f"O job {job['job_id']} não terminou a tempo."
+        time.sleep(0.05)
+        job = api.get(job["status_url"]).json()
+    assert job["status"] == "concluido", job["erro"]
+    return job
+
+
+def extrai(api, pedido: dict = None, **params) -> dict:
+    resposta = api.post("/iniciar-extracao", json=pedido or pedido_unico(), params=params)
+    assert resposta.status_code in (200, 202), resposta.text
+    return aguarda(api, resposta.json())
+
+
+@pytest.fixture
+def cotas(monkeypatch):
+    """Liga a cota por cliente: uma extração por cliente, reposta a cada hora."""
+    from api_service import main
+
+    quotas = ClientQuotas(taxa=1 / 3600, capacidade=1)
+    monkeypatch.setattr(main, "client_quotas", quotas)
+    return quotas
+
+
+def test_extracao_e_download(api):
+    job = extrai(api)
+    resposta = api.get(job["resultado_url"])
+    assert resposta.status_code == 200
+    assert resposta.headers["etag"]
+    assert "Competência: 202401" in resposta.content.decode("latin-1")
+
+
+def test_pedido_repetido_e_servido_pelo_cache(api):
+    pedido = pedido_unico()
+    primeiro = extrai(api, pedido)
+    resposta = api.post("/iniciar-extracao", json=pedido)
+    assert resposta.status_code == 200
+    repetido = resposta.json()
+    assert repetido["status"] == "concluido" and repetido["job_id"] != primeiro["job_id"]
+    assert api.get(repetido["resultado_url"]).content == api.get(primeiro["resultado_url"]).content
+
+
+def test_download_retomado_com_range_e_revalidado_com_etag(api):
+    job = extrai(api)
+    # O primeiro pedido já é parcial, como o de um download interrompido e retomado.
+    inicio = api.get(job["resultado_url"], headers={"Range": "bytes=0-99", "Accept-Encoding": "identity"})
+    assert inicio.status_code == 206
+    assert len(inicio.content) == 100
+    etag = inicio.headers["etag"]
+
+    resto = api.get(job["resultado_url"], headers={"Range": "bytes=100-", "If-Range": etag, "Accept-Encoding": "identity"})
+    assert resto.status_code == 206
+    completo = api.get(job["resultado_url"], headers={"Accept-Encoding": "identity"})
+    assert completo.status_code == 200
+    assert inicio.content + resto.content == completo.content
+
+    nao_modificado = api.get(job["resultado_url"], headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert nao_modificado.status_code == 304
+    assert api.get(job["resultado_url"], headers={"Accept-Encoding": "identity"}).status_code == 200
+
+
+@pytest.fixture
+def sem_cache(monkeypatch):
+    """Extrações com 'perfil' não passam pelo cache: o resultado fica só no spool."""
+    from api_service import config
+
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    return {"perfil": "cpu"}
+
+
+def test_spool_so_e_liberado_depois_do_download_completo(api, sem_cache):
+    import os
+
+    from api_service import main
+
+    job = extrai(api, **sem_cache)
+    resultado = main.job_manager.store.get(job["job_id"])["resultado"]
+    assert main.spool.owns(resultado)
+    identidade = {"Accept-Encoding": "identity"}
+
+    inicio = api.get(job["resultado_url"], headers={**identidade, "Range": "bytes=0-99"})
+    assert inicio.status_code == 206
+    etag = inicio.headers["etag"]
+    assert api.get(job["resultado_url"], headers={**identidade, "If-None-Match": etag}).status_code == 304
+    resto = api.get(job["resultado_url"], headers={**identidade, "Range": "bytes=100-", "If-Range": etag})
+    assert resto.status_code == 206
+    assert os.path.exists(resultado)
+
+    completo = api.get(job["resultado_url"], headers=identidade)
+    assert completo.status_code == 200
+    assert completo.content == inicio.content + resto.content
+    assert not os.path.exists(resultado)
+    assert api.get(job["resultado_url"]).status_code == 410
+
+
+def test_conversao_do_spool_e_apagada_com_o_resultado(api, sem_cache):
+    import os
+
+    from api_service import main
+
+    job = extrai(api, **sem_cache)
+    resultado = main.job_manager.store.get(job["job_id"])["resultado"]
+    parcial = api.get(job["resultado_url"], params={"formato": "ndjson"}, headers={"Range": "bytes=0-9"})
+    assert parcial.status_code == 206
+    assert os.path.exists(f"{resultado}.tabela.ndjson")
+
+    assert api.get(job["resultado_url"], params={"formato": "ndjson"}).status_code == 200
+    assert not os.path.exists(resultado)
+    assert not os.path.exists(f"{resultado}.tabela.ndjson")
+
+
+@pytest.mark.parametrize("formato", ["csv", "ndjson", "parquet"])
+def test_download_convertido(api, formato):
+    job = extrai(api)
+    resposta = api.get(job["resultado_url"], params={"formato": formato})
+    assert resposta.status_code == 200
+    if formato == "parquet":
+        pq = pytest.importorskip("pyarrow.parquet")
+        tabela = pq.read_table(io.BytesIO(resposta.content))
+        assert tabela.column_names == ["uf", "tipo_atendimento", "quantidade"]
+        assert tabela.num_rows > 0
+    elif formato == "csv":
+        assert resposta.text.splitlines()[0] == "uf;tipo_atendimento;quantidade"
+    else:
+        assert resposta.text.splitlines()[0].startswith('{"uf": ')
+
+
+def test_cota_esgotada_responde_429(api, cotas):
+    pedido = pedido_unico()
+    primeiro = api.post("/iniciar-extracao", json=pedido)
+    assert primeiro.status_code == 202
+    # Um pedido idêntico a um job em andamento não consome a cota.
+    repetido = api.post("/iniciar-extracao", json=pedido)
+    if repetido.status_code == 202:
+        assert repetido.json()["job_id"] == primeiro.json()["job_id"]
+    else:
+        assert repetido.status_code == 200
+
+    excedente = api.post("/iniciar-extracao", json=pedido_unico())
+    assert excedente.status_code == 429
+    assert int(excedente.headers["retry-after"]) > 0
+    aguarda(api, primeiro.json())
+
+
+def test_x_forwarded_for_forjado_nao_renova_a_cota(api, cotas, monkeypatch):
+    from api_service import config
+
+    # Atrás de um proxy que acrescenta o IP real (203.0.113.7) ao cabeçalho.
+    monkeypatch.setattr(config, "TRUSTED_PROXY_HOPS", 1)
+    primeiro = api.post("/iniciar-extracao", json=pedido_unico(), headers={"X-Forwarded-For": "203.0.113.7"})
+    assert primeiro.status_code == 202
+    forjado = api.post("/iniciar-extracao", json=pedido_unico(), headers={"X-Forwarded-For": "10.9.8.7, 203.0.113.7"})
+    assert forjado.status_code == 429
+    # Outro cliente real tem a sua própria cota.
+    outro = api.post("/iniciar-extracao", json=pedido_unico(), headers={"X-Forwarded-For": "10.9.8.7, 198.51.100.2"})
+    assert outro.status_code == 202
+
+    # Sem proxy confiável, o cabeçalho é ignorado e vale o IP da conexão.
+    monkeypatch.setattr(config, "TRUSTED_PROXY_HOPS", 0)
+    assert api.post("/iniciar-extracao", json=pedido_unico()).status_code == 202
+    direto = api.post("/iniciar-extracao", json=pedido_unico(), headers={"X-Forwarded-For": "192.0.2.55"})
+    assert direto.status_code == 429
+    for resposta in (primeiro, outro):
+        aguarda(api, resposta.json())
+
+
+@pytest.mark.parametrize("corpo", [
+    ["2024-01"],
+    ["202413"],
+    ["202401", "202401"],
+    {"datas": ["202401", "abc"]},
+    {"datas": ["202402", "202401", "202402"]},
+])
+def test_competencias_invalidas_ou_repetidas_respondem_422(api, corpo):
+    from api_service import main
+
+    def total_de_jobs() -> int:
+        # Jobs de outros testes podem mudar de estado, mas não somem.
+        return sum(main.job_manager.store.count(status) for status in ("pendente", "executando", "concluido", "erro"))
+
+    antes = total_de_jobs()
+    resposta = api.post("/iniciar-extracao", json=corpo)
+    assert resposta.status_code == 422
+    assert total_de_jobs() == antes
+
+
+def test_lotes_por_estado_nao_tem_coluna_de_rotulo(api):
+    from api_service.sisab_report import parse_report, split_report
+
+    pedido = {"datas": ["202401"], "filtros": {"estados": ["PE", "PB", "RN"]}, "dividir_por": "estado"}
+    job = extrai(api, pedido, tamanho_lote=2)
+    layout = split_report(api.get(job["resultado_url"]).content.decode("latin-1"))
+    assert layout.cabecalho.startswith("Uf;")
+    assert parse_report(layout).dimensoes == ["uf"]
+
+
+def test_lotes_por_competencia_listam_todas_no_preambulo(api):
+    pedido = {"datas": ["202402", "202401", "202403"], "filtros": {"estados": ["SE", "TO"]}}
+    job = extrai(api, pedido, tamanho_lote=1)
+    texto = api.get(job["resultado_url"]).content.decode("latin-1")
+    assert "Competência: 202401, 202402, 202403;" in texto.splitlines()
@@ -0,0 +1,131 @@
+import queue
+import threading
+
+import pytest
+
+from api_service import crawl_pool
+from api_service.crawl_pool import CrawlWorkerError, CrawlWorkerPool
+
+
+class _ProcessoFalso:
+    pid = 0
+
+    def __init__(self):
+        self.morto = False
+
+    def is_alive(self) -> bool:
+        # Como um processo que acabou de receber SIGKILL e ainda não foi recolhido.
+        return True
+
+    def kill(self):
+        self.morto = True
+
+    def join(self, timeout: float = None):
+        pass
+
+
+class _WorkerFalso:
+    """Worker sem processo: nunca responde aos crawls."""
+    criados = []
+    kill = crawl_pool._Worker.kill
+
+    def __init__(self, task_timeout: float):
+        self.inbox = queue.Queue()
+        self.outbox = queue.Queue()
+        self.jobs_done = 0
+        self.descartado = False
+        self.process = _ProcessoFalso()
+        self.parado = False
+        _WorkerFalso.criados.append(self)
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, timeout: float = 5.0):
+        self.parado = True
+
+
+@pytest.fixture
+def workers_falsos(monkeypatch):
+    _WorkerFalso.criados = []
+    monkeypatch.setattr(crawl_pool, "_Worker", _WorkerFalso)
+    return _WorkerFalso.criados
+
+
+def test_worker_e_criado_fora_do_lock(monkeypatch):
+    pool = CrawlWorkerPool(size=1, lazy=True)
+    lock_livre = []
+
+    class _WorkerVerificaLock(_WorkerFalso):
+        def __init__(self, task_timeout: float):
+            def tenta():
+                if pool._available.acquire(blocking=False):
+                    pool._available.release()
+                    lock_livre.append(True)
+                else:
+                    lock_livre.append(False)
+            outra = threading.Thread(target=tenta)
+            outra.start()
+            outra.join()
+            super().__init__(task_timeout)
+
+    monkeypatch.setattr(crawl_pool, "_Worker", _WorkerVerificaLock)
+    pool.start()
+    try:
+        worker = pool._acquire()
+        assert lock_livre == [True]
+        assert pool.status()["iniciados"] == 1
+        pool._release(worker)
+        assert pool.status()["ociosos"] == 1
+    finally:
+        pool.stop()
+
+
+def test_worker_que_estoura_o_tempo_e_descartado(workers_falsos):
+    pool = CrawlWorkerPool(size=1, lazy=True)
+    # O prazo de 'run' é task_timeout + 30s: aqui, cerca de 1s.
+    pool.task_timeout = -29
+    pool.start()
+    try:
+        with pytest.raises(CrawlWorkerError, match="tempo limite"):
+            pool.run("sisab", {})
+        lento = workers_falsos[0]
+        assert lento.process.morto and lento.descartado
+
+        # O worker morto é substituído em segundo plano, nunca devolvido como ocioso.
+        for _ in range(100):
+            if len(workers_falsos) == 2 and pool.status()["ociosos"] == 1:
+                break
+            threading.Event().wait(0.02)
+        assert lento.parado
+        assert pool._idle == [workers_falsos[1]]
+    finally:
+        pool.stop()
+
+
+def test_worker_que_reporta_o_proprio_tempo_limite_e_descartado(monkeypatch):
+    class _WorkerQueExpira(_WorkerFalso):
+        """Responde como crawl_worker quando o crawl passa do tempo: 'erro' e sai do loop."""
+
+        def __init__(self, task_timeout: float):
+            super().__init__(task_timeout)
+            self.outbox.put(("erro", f"O crawl excedeu o tempo limite de {task_timeout:.0f}s."))
+
+    _WorkerFalso.criados = []
+    monkeypatch.setattr(crawl_pool, "_Worker", _WorkerQueExpira)
+    pool = CrawlWorkerPool(size=1, lazy=True)
+    pool.start()
+    try:
+        with pytest.raises(CrawlWorkerError, match="tempo limite"):
+            pool.run("sisab", {})
+        expirado = _WorkerFalso.criados[0]
+        assert expirado.descartado
+
+        for _ in range(100):
+            if len(_WorkerFalso.criados) == 2 and pool.status()["ociosos"] == 1:
+                break
+            threading.Event().wait(0.02)
+        assert expirado.parado
+        assert pool._idle == [_WorkerFalso.criados[1]]
+    finally:
+        pool.stop()
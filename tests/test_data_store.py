@@ -0,0 +1,48 @@
+import shutil
+
+from api_service.data_store import ALTERADO, INALTERADA, NOVA, REVISADA, HarvestStore
+from api_service.sisab_report import ENCODING
+
+
+def _altera_celula(caminho: str, uf: str, novo_valor: str):
+    """Troca o primeiro valor da linha da UF no relatório."""
+    with open(caminho, encoding=ENCODING, newline="") as f:
+        linhas = f.read().split("\r\n")
+    for i, linha in enumerate(linhas):
+        campos = linha.split(";")
+        if campos[0] == uf:
+            campos[1] = novo_valor
+            linhas[i] = ";".join(campos)
+    with open(caminho, "w", encoding=ENCODING, newline="") as f:
+        f.write("\r\n".join(linhas))
+
+
+def test_coleta_repetida_grava_so_as_mudancas(tmp_path, relatorio):
+    store = HarvestStore(str(tmp_path / "store"))
+    original = str(tmp_path / "original.csv")
+    shutil.copyfile(relatorio, original)
+    try:
+        primeira = store.add("202401", relatorio)
+        assert primeira["situacao"] == NOVA
+        assert primeira["inseridos"] > 0 and primeira["alterados"] == primeira["removidos"] == 0
+
+        shutil.copyfile(original, relatorio)
+        repetida = store.add("202401", relatorio)
+        assert repetida == {"situacao": INALTERADA, "revisao": None, "inseridos": 0, "alterados": 0, "removidos": 0}
+
+        shutil.copyfile(original, relatorio)
+        _altera_celula(relatorio, "AC", "1.000")
+        revisada = store.add("202401", relatorio)
+        assert revisada["situacao"] == REVISADA
+        assert (revisada["inseridos"], revisada["alterados"], revisada["removidos"]) == (0, 1, 0)
+
+        revisoes = store.revisions(desde=primeira["revisao"])
+        assert [r["id"] for r in revisoes] == [revisada["revisao"]]
+        linhas, total = store.changes(revisada["revisao"])
+        assert total == 1
+        assert linhas[0]["uf"] == "AC" and linhas[0]["operacao"] == ALTERADO
+        assert (linhas[0]["quantidade_anterior"], linhas[0]["quantidade"]) == (340563, 1000)
+        registros, _ = store.query(competencias=["202401"], ufs=["AC"], tipos_atendimento=[linhas[0]["tipo_atendimento"]])
+        assert registros[0]["quantidade"] == 1000
+    finally:
+        store.close()
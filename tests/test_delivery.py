@@ -0,0 +1,34 @@
+import threading
+
+import pytest
+
+from api_service import delivery
+
+
+def test_lock_sai_do_dicionario_quando_a_preparacao_falha(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        delivery.prepare(str(tmp_path / "inexistente.csv"))
+    assert delivery._locks == {}
+
+
+def test_preparacoes_simultaneas_compactam_uma_vez(tmp_path, monkeypatch):
+    caminho = tmp_path / "relatorio.csv"
+    caminho.write_text("uf;quantidade\n" * 1000, encoding="utf-8")
+    aberturas = []
+    abre_gzip = delivery._open_gzip
+
+    def conta(destino):
+        aberturas.append(destino)
+        threading.Event().wait(0.1)
+        return abre_gzip(destino)
+
+    monkeypatch.setitem(delivery.CODIFICACOES, "gzip", (".gz", conta))
+    metas = []
+    threads = [threading.Thread(target=lambda: metas.append(delivery.prepare(str(caminho)))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(aberturas) == 1
+    assert len({m["sha256"] for m in metas}) == 1
+    assert delivery._locks == {}
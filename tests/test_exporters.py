@@ -0,0 +1,65 @@
+import csv
+import sqlite3
+
+import pytest
+
+from Scrapy_project.Scrapy_project.exporters import WRITERS, field_types
+from Scrapy_project.Scrapy_project.items import DatasusRowItem
+
+CAMPOS = list(DatasusRowItem.fields)
+INTEIROS = [["Ago/2025", "26 Pernambuco", "Internações", 1234], ["Ago/2025", "25 Paraíba", "Internações", None]]
+DECIMAIS = [["Ago/2025", "26 Pernambuco", "Valor total", 1234.56], ["Ago/2025", "25 Paraíba", "Internações", 10]]
+
+
+def grava(tmp_path, formato: str, linhas: list) -> str:
+    caminho = str(tmp_path / f"linhas.{formato}")
+    writer = WRITERS[formato](caminho, [c for c in CAMPOS], field_types(DatasusRowItem))
+    writer.write_rows(linhas)
+    writer.close()
+    return caminho
+
+
+def le_valores(caminho: str, formato: str) -> list:
+    if formato == "csv":
+        with open(caminho, encoding="utf-8", newline="") as f:
+            return [linha["valor"] for linha in csv.DictReader(f, delimiter=";")]
+    if formato == "sqlite":
+        with sqlite3.connect(caminho) as conn:
+            return [row[0] for row in conn.execute("SELECT valor FROM linhas ORDER BY rowid")]
+    pq = pytest.importorskip("pyarrow.parquet")
+    return pq.read_table(caminho).column("valor").to_pylist()
+
+
+@pytest.mark.parametrize("formato, esperado", [
+    ("csv", ["1234", ""]),
+    ("sqlite", [1234, None]),
+])
+def test_valores_inteiros_nao_viram_decimais(tmp_path, formato, esperado):
+    valores = le_valores(grava(tmp_path, formato, INTEIROS), formato)
+    assert valores == esperado
+    assert all(not isinstance(v, float) for v in valores)
+
+
+@pytest.mark.parametrize("formato, esperado", [
+    ("csv", ["1234.56", "10"]),
+    ("sqlite", [1234.56, 10]),
+    ("parquet", [1234.56, 10.0]),
+])
+def test_valores_decimais_sao_preservados(tmp_path, formato, esperado):
+    valores = le_valores(grava(tmp_path, formato, DECIMAIS), formato)
+    assert valores == esperado
+    if formato == "sqlite":
+        assert isinstance(valores[1], int)
+
+
+def test_parquet_guarda_decimais_de_lotes_posteriores(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    caminho = str(tmp_path / "lotes.parquet")
+    writer = WRITERS["parquet"](caminho, CAMPOS, field_types(DatasusRowItem))
+    writer.write_rows([["Ago/2025", "26 Pernambuco", "Valor total", 0], ["Ago/2025", "25 Paraíba", "Valor total", 0]])
+    writer.write_rows([["Ago/2025", "24 Rio Grande do Norte", "Valor total", 12.5]])
+    writer.close()
+    assert pq.read_schema(caminho).field("valor").type == pa.float64()
+    assert pq.read_table(caminho).column("valor").to_pylist() == [0.0, 0.0, 12.5]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from api_service.jobs import CONCLUIDO, PENDENTE, JobManager, JobStore
+
+
+def aguarda_status(store: JobStore, job_id: str, status: str, timeout: float = 5) -> dict:
+    inicio = time.monotonic()
+    while (job := store.get(job_id))["status"] != status:
+        assert time.monotonic() - inicio < timeout, f"O job ficou em '{job['status']}'."
+        time.sleep(0.01)
+    return job
+
+
+def test_slot_ocupa_uma_vaga_dos_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    manager = JobManager(store, lambda job, report: "ok", max_workers=1)
+    manager.start()
+    try:
+        liberar = threading.Event()
+        ocupada = threading.Event()
+
+        def coleta():
+            with manager.slot():
+                ocupada.set()
+                liberar.wait(5)
+
+        threading.Thread(target=coleta).start()
+        assert ocupada.wait(5)
+        job = manager.submit("sisab", {})
+        time.sleep(1.5)
+        assert store.get(job["id"])["status"] == PENDENTE
+
+        liberar.set()
+        assert aguarda_status(store, job["id"], CONCLUIDO)["resultado"] == "ok"
+    finally:
+        liberar.set()
+        manager.stop()
+        store.close()
+
+
+def test_progresso_troca_os_campos_quando_a_etapa_muda(tmp_path):
+    eventos = [
+        {"etapa": "lotes", "total_lotes": 2, "lotes_em_cache": 0},
+        {"etapa": "baixando", "bytes": 100, "lote": 0},
+        {"etapa": "baixando", "bytes": 250, "lote": 0},
+        {"etapa": "lote_concluido", "lote": 0, "datas": ["202401"], "lotes_concluidos": [0]},
+        {"etapa": "compactando"},
+    ]
+    vistos = []
+
+    def runner(job, report_progress):
+        for evento in eventos:
+            report_progress(evento)
+            vistos.append(dict(store.get(job["id"])["progresso"]))
+        return "ok"
+
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    manager = JobManager(store, runner, max_workers=1, campos_do_job=("total_lotes", "lotes_em_cache", "lotes_concluidos"))
+    manager.start()
+    try:
+        aguarda_status(store, manager.submit("sisab", {})["id"], CONCLUIDO)
+    finally:
+        manager.stop()
+        store.close()
+
+    assert vistos[2] == {"etapa": "baixando", "bytes": 250, "lote": 0, "total_lotes": 2, "lotes_em_cache": 0}
+    assert vistos[3] == {"etapa": "lote_concluido", "lote": 0, "datas": ["202401"], "lotes_concluidos": [0],
+                         "total_lotes": 2, "lotes_em_cache": 0}
+    assert vistos[4] == {"etapa": "compactando", "lotes_concluidos": [0], "total_lotes": 2, "lotes_em_cache": 0}
@@ -0,0 +1,56 @@
+from api_service.result_cache import ResultCache, cache_key
+
+
+def _arquivo(tmp_path, nome: str, tamanho: int) -> str:
+    caminho = tmp_path / nome
+    caminho.write_bytes(b"x" * tamanho)
+    return str(caminho)
+
+
+def test_cache_key_ignora_a_ordem_dos_parametros():
+    assert cache_key({"a": 1, "b": [1, 2]}) == cache_key({"b": [1, 2], "a": 1})
+    assert cache_key({"a": 1, "b": [1, 2]}) != cache_key({"a": 1, "b": [2, 1]})
+
+
+def test_extraction_cache_key_normaliza_o_pedido():
+    from api_service.main import extraction_cache_key
+
+    chave = extraction_cache_key(["202401", "202402"], {"estados": ["SP", "AC"]})
+    assert chave == extraction_cache_key(["202402", "202401"], {"estados": ["AC", "SP"]})
+    assert chave != extraction_cache_key(["202401", "202402"], {"estados": ["SP"]})
+    # O relatório combinado em lotes tem outro formato.
+    assert chave != extraction_cache_key(["202401", "202402"], {"estados": ["SP", "AC"]}, tamanho_lote=1)
+    assert (extraction_cache_key(["202401"], {}, tamanho_lote=1)
+            != extraction_cache_key(["202401"], {}, tamanho_lote=1, dividir_por="estado"))
+
+
+def test_get_retorna_a_copia_guardada(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000)
+    caminho = cache.put("a" * 64, _arquivo(tmp_path, "a.csv", 10))
+    assert cache.get("a" * 64) == caminho
+    assert cache.get("b" * 64) is None
+    assert cache.usage() == {"entradas": 1, "bytes": 10, "limite_bytes": 1000}
+
+
+def test_entrada_expirada_e_removida(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000)
+    cache.put("a" * 64, _arquivo(tmp_path, "a.csv", 10), ttl=-1)
+    assert cache.get("a" * 64) is None
+    assert cache.usage()["entradas"] == 0
+
+
+def test_remove_a_entrada_menos_usada_e_os_derivados(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    a = cache.put("a" * 64, _arquivo(tmp_path, "a.csv", 100))
+    b = cache.put("b" * 64, _arquivo(tmp_path, "b.csv", 100))
+    with open(f"{b}.tabela.parquet", "wb") as f:
+        f.write(b"derivado")
+    # 'a' foi usada depois de 'b': a menos usada recentemente é 'b'.
+    assert cache.get("a" * 64) == a
+    cache.put("c" * 64, _arquivo(tmp_path, "c.csv", 100))
+
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == a
+    assert cache.get("c" * 64) is not None
+    assert not (tmp_path / "cache" / "bb" / f"{'b' * 64}.csv.tabela.parquet").exists()
+    assert cache.usage()["bytes"] == 200
@@ -0,0 +1,56 @@
+import csv
+import json
+
+import pytest
+
+from api_service.sisab_report import ENCODING, convert_report, merge_reports, parse_report, read_report
+
+
+def test_parse_report_gera_uma_linha_por_uf_e_tipo(relatorio):
+    tabela = parse_report(read_report(relatorio))
+    assert tabela.dimensoes == ["uf"]
+    assert tabela.colunas == ["uf", "tipo_atendimento", "quantidade"]
+    # 27 UFs x 6 tipos de atendimento (a coluna de total é descartada).
+    assert len(tabela.registros) == 27 * 6
+    assert tabela.registros[0] == {"uf": "AC", "tipo_atendimento": "Atendimento de urgência", "quantidade": 340563}
+
+
+@pytest.mark.parametrize("formato", ["csv", "ndjson", "parquet", "arrow"])
+def test_convert_report_preserva_os_registros(tmp_path, relatorio, formato):
+    esperado = parse_report(read_report(relatorio)).registros
+    saida = str(tmp_path / f"tabela.{formato}")
+    convert_report(relatorio, formato, saida)
+
+    if formato == "csv":
+        with open(saida, encoding="utf-8", newline="") as f:
+            lidos = [{**linha, "quantidade": int(linha["quantidade"])} for linha in csv.DictReader(f, delimiter=";")]
+    elif formato == "ndjson":
+        with open(saida, encoding="utf-8") as f:
+            lidos = [json.loads(linha) for linha in f]
+    else:
+        pa = pytest.importorskip("pyarrow")
+        if formato == "parquet":
+            import pyarrow.parquet as pq
+            tabela = pq.read_table(saida)
+        else:
+            with pa.memory_map(saida) as fonte:
+                tabela = pa.ipc.open_file(fonte).read_all()
+        assert tabela.schema.field("quantidade").type == pa.int64()
+        lidos = tabela.to_pylist()
+    assert lidos == esperado
+
+
+def test_merge_reports_lista_todas_as_competencias(tmp_path, relatorio):
+    lotes = []
+    for competencia in ("202402", "202401"):
+        caminho = tmp_path / f"{competencia}.csv"
+        with open(relatorio, encoding=ENCODING, newline="") as f:
+            caminho.write_text(f.read().replace("__COMPETENCIAS__", competencia), encoding=ENCODING, newline="")
+        lotes.append(str(caminho))
+    saida = str(tmp_path / "combinado.csv")
+    merge_reports(lotes, ["202402", "202401"], saida, competencias=["202402", "202401"])
+
+    combinado = read_report(saida)
+    assert "Competência: 202401, 202402;" in combinado.preambulo
+    assert combinado.cabecalho.startswith("Competencia;Uf;")
+    assert len(combinado.linhas) == 2 * len(read_report(lotes[0]).linhas)